@@ -0,0 +1,62 @@
+"""Settings of the benchmark suite.
+
+The application settings with a SQLite database and Redis replaced by
+fakeredis, so the benchmarks run without any service. Set
+``BENCHMARK_DATABASE=postgres`` to use a local PostgreSQL database instead
+(``paw_benchmark``, with the connection settings of the application).
+"""
+import os
+import tempfile
+
+import fakeredis
+
+# values required by the application settings, not used here
+for name, value in (
+        ('SECRET_KEY', 'benchmark'),
+        ('POSTGRES_HOST', 'localhost'),
+        ('POSTGRES_USER', 'paw_user'),
+        ('POSTGRES_PASSWORD', ''),
+        ('REDIS_URL', 'redis://localhost:6379/1'),
+        ('REDIS_RQ_URL', 'redis://localhost:6379/0')):
+    os.environ.setdefault(name, value)
+
+from paw.settings import *  # noqa: E402,F401,F403
+from paw.settings import DATABASES  # noqa: E402
+
+DEBUG = False
+
+# a benchmark running more queries than the budget fails
+QUERY_BUDGET_MODE = 'raise'
+
+ALLOWED_HOSTS = ['testserver']
+
+if os.environ.get('BENCHMARK_DATABASE') == 'postgres':
+    DATABASES['default']['NAME'] = 'paw_benchmark'
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tempfile.gettempdir(), 'paw_benchmark.db'),
+        }
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': 'redis://localhost:6379/1',
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+            'CONNECTION_POOL_KWARGS': {
+                'connection_class': fakeredis.FakeConnection,
+            },
+        }
+    }
+}
+
+# the jobs are enqueued in the fake Redis of the cache
+RQ_QUEUES = {
+    'default': {
+        'USE_REDIS_CACHE': 'default',
+        'DEFAULT_TIMEOUT': 360,
+    }
+}
@@ -0,0 +1,235 @@
+"""Benchmark of the concurrent updates of the totals of a bill.
+
+Many workers (threads, each with its own database connection) bill calls of
+the same phone number at the same time, comparing:
+
+* ``read-modify-write``: the previous update, reading the bill and saving it
+  again with the totals added in Python;
+* ``increment``: the totals incremented by the database with each call
+  (``Bill.add_totals``);
+* ``append + rollup``: ``Bill.save_by_calls``, only appending the items,
+  with the totals updated by the rollup (``pawapp.rollup``) running at the
+  same time.
+
+For each one, the calls billed by second and whether the totals of the bill
+are the sum of its items (after the last rollup) are shown.
+
+The calls are saved in the database configured, so run it with a PostgreSQL
+database not used in production (see contrib/env):
+
+    $ PYTHONPATH=src DJANGO_SETTINGS_MODULE=paw.settings \\
+        python benchmarks/bill_totals.py [workers] [calls by worker]
+
+It has not been run with PostgreSQL yet, only with SQLite to check it works
+(see the benchmarks in docs/running.rst).
+"""
+import sys
+import threading
+import time
+from decimal import Decimal
+
+import django
+
+django.setup()
+
+from django.db import connection, transaction  # noqa: E402
+from django.db.models import Sum  # noqa: E402
+
+from pawapp import const  # noqa: E402
+from pawapp.helpers import money_cents  # noqa: E402
+from pawapp.models import Bill, BilledCall, BillItem, CallEvent  # noqa: E402
+from pawapp.rollup import rollup_items  # noqa: E402
+from pawapp.timestamps import parse_timestamp_utc  # noqa: E402
+
+
+PHONE_NUMBER = '11900000000'
+
+WORKERS = 16
+
+CALLS = 200
+
+DURATION = 60
+
+AMOUNT = Decimal('0.45')
+
+
+def calls(worker, number):
+    """Start and end events of the calls billed by a worker."""
+    for index in range(number):
+        call_id = 'bench-{}-{}'.format(worker, index)
+        start_call = CallEvent(
+            call_type=const.CALL_TYPE_START,
+            call_id=call_id,
+            call_timestamp='2018-03-12T10:00:00Z',
+            source_number=PHONE_NUMBER,
+            destination_number='11922222222'
+        )
+        end_call = CallEvent(
+            call_type=const.CALL_TYPE_END,
+            call_id=call_id,
+            call_timestamp='2018-03-12T10:01:00Z',
+            call_datetime=parse_timestamp_utc('2018-03-12T10:01:00Z')
+        )
+        yield start_call, end_call
+
+
+def save_item(start_call, end_call, duration, amount):
+    """Save the item of a call, already rolled up.
+
+    Returns:
+        Bill: Bill of the item.
+
+    """
+    bill, _ = Bill.objects.get_or_create(
+        phone_number=start_call.source_number,
+        year=end_call.call_timestamp_datetime.year,
+        month=end_call.call_timestamp_datetime.month,
+        defaults={
+            'total_duration': 0, 'total_amount': 0, 'total_amount_cents': 0
+        }
+    )
+    BillItem.insert_once(
+        bill=bill.id,
+        call_id=start_call.call_id,
+        phone_number=start_call.destination_number,
+        from_timestamp=start_call.call_timestamp,
+        to_timestamp=end_call.call_timestamp,
+        to_datetime=end_call.call_datetime,
+        duration=duration,
+        amount=amount,
+        amount_cents=money_cents(amount),
+        rolled_up=True
+    )
+    return bill
+
+
+def save_read_modify_write(start_call, end_call, duration, amount):
+    """Bill a call reading the bill and saving it with the totals added."""
+    with transaction.atomic():
+        bill = save_item(start_call, end_call, duration, amount)
+        bill.total_duration += duration
+        bill.total_amount += amount
+        bill.total_amount_cents = money_cents(bill.total_amount)
+        bill.save()
+
+
+def save_increment(start_call, end_call, duration, amount):
+    """Bill a call incrementing the totals in the database."""
+    with transaction.atomic():
+        bill = save_item(start_call, end_call, duration, amount)
+        Bill.add_totals({bill.id: (duration, amount)})
+
+
+def bill_each(worker, number, save):
+    for start_call, end_call in calls(worker, number):
+        save(start_call, end_call, DURATION, AMOUNT)
+
+
+def bill_read_modify_write(worker, number):
+    bill_each(worker, number, save_read_modify_write)
+
+
+def bill_increment(worker, number):
+    bill_each(worker, number, save_increment)
+
+
+def bill_append(worker, number):
+    bill_each(worker, number, Bill.save_by_calls)
+
+
+def clean():
+    """Delete the bills of the phone number, their items and calls billed."""
+    BillItem.objects.filter(bill__phone_number=PHONE_NUMBER).delete()
+    Bill.objects.filter(phone_number=PHONE_NUMBER).delete()
+    BilledCall.objects.filter(call_id__startswith='bench-').delete()
+
+
+def run(bill, workers, number, rollup=False):
+    """Bill the calls of all the workers at the same time.
+
+    With ``rollup``, the rollup runs in another thread while the calls are
+    billed, and once more after all of them.
+
+    Returns:
+        tuple: Calls billed by second and whether the totals are right.
+
+    """
+    clean()
+    barrier = threading.Barrier(workers)
+    errors = []
+
+    def worker(index):
+        try:
+            barrier.wait()
+            bill(index, number)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(index,))
+        for index in range(workers)
+    ]
+    billing = threading.Event()
+
+    def rollup_worker():
+        try:
+            while billing.is_set():
+                if not rollup_items()['items']:
+                    time.sleep(0.01)
+        finally:
+            connection.close()
+
+    billing.set()
+    rollup_thread = threading.Thread(target=rollup_worker)
+    if rollup:
+        rollup_thread.start()
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+
+    billing.clear()
+    if rollup:
+        rollup_thread.join()
+        rollup_items()
+
+    bill = Bill.objects.get(phone_number=PHONE_NUMBER)
+    items = BillItem.objects.filter(bill=bill).aggregate(
+        duration=Sum('duration'), amount=Sum('amount')
+    )
+    right = (
+        bill.total_duration == items['duration'] == workers * number * DURATION
+        and bill.total_amount == items['amount']
+        and bill.total_amount_cents == money_cents(items['amount'])
+    )
+    clean()
+    return workers * number / elapsed, right
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    number = int(sys.argv[2]) if len(sys.argv) > 2 else CALLS
+
+    print('{} workers billing {} calls each of {}'.format(
+        workers, number, PHONE_NUMBER
+    ))
+    for name, bill, rollup in (
+        ('read-modify-write', bill_read_modify_write, False),
+        ('increment', bill_increment, False),
+        ('append + rollup', bill_append, True),
+    ):
+        rate, right = run(bill, workers, number, rollup)
+        print('{:<20} {:>8.0f} calls/s  totals {}'.format(
+            name, rate, 'right' if right else 'WRONG'
+        ))
+
+
+if __name__ == '__main__':
+    main()
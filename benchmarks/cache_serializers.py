@@ -0,0 +1,76 @@
+"""Benchmark of the cache serializers.
+
+Compares the serializers of ``pawapp.cache``, whose bytes are sent to Redis
+as they are, with the values pickled by django-redis, measuring the encode
+and decode time and the bytes sent to Redis.
+
+Run with:
+
+    $ PYTHONPATH=src python benchmarks/cache_serializers.py
+"""
+import datetime
+import pickle
+import timeit
+from decimal import Decimal
+
+from pawapp import cache
+
+
+RATES = (
+    (datetime.time(6, 00), datetime.time(22, 00), Decimal('0.36'), Decimal('0.09')),
+    (datetime.time(22, 00), datetime.time(6, 00), Decimal('0.36'), Decimal('0.00')),
+)
+
+BILL = {
+    'subscriber': '11911111111',
+    'period': '3/2018',
+    'calls': [
+        {
+            'destination': '11922222222',
+            'start_date': '2018-03-01',
+            'start_time': '10:{:02d}:00Z'.format(index % 60),
+            'duration': '0:10:00',
+            'price': '1.26'
+        }
+        for index in range(100)
+    ]
+}
+
+NUMBER = 20000
+
+
+class DjangoRedisPickle:
+    """Previous behaviour: the value pickled by django-redis."""
+
+    def dumps(self, data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+def measure(name, serializer, data):
+    payload = serializer.dumps(data)
+    encode = timeit.timeit(lambda: serializer.dumps(data), number=NUMBER)
+    decode = timeit.timeit(lambda: serializer.loads(payload), number=NUMBER)
+    print('{:<14} {:>10.2f} {:>10.2f} {:>8}'.format(
+        name, encode / NUMBER * 1e6, decode / NUMBER * 1e6, len(payload)
+    ))
+
+
+def main():
+    print('{:<14} {:>10} {:>10} {:>8}'.format(
+        'serializer', 'encode us', 'decode us', 'bytes'
+    ))
+    print('rates table')
+    measure('django-redis', DjangoRedisPickle(), RATES)
+    measure('rates', cache.rates_serializer, RATES)
+    # the JSON bytes of a bill can be sent in the response without decoding
+    print('bill document (100 calls)')
+    measure('django-redis', DjangoRedisPickle(), BILL)
+    measure('pickle', cache.pickle_serializer, BILL)
+    measure('json', cache.json_serializer, BILL)
+
+
+if __name__ == '__main__':
+    main()
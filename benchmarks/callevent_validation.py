@@ -0,0 +1,98 @@
+"""Benchmark of the validation of the CallEvent data.
+
+Compares ``CallEventForm`` (the previous validation) with the compiled
+``callevent_validator``, for valid and invalid events and for a batch.
+
+Run with the environment of the application (see contrib/env):
+
+    $ PYTHONPATH=src DJANGO_SETTINGS_MODULE=paw.settings \
+        python benchmarks/callevent_validation.py
+"""
+import timeit
+
+import django
+
+django.setup()
+
+from pawapp import const  # noqa: E402
+from pawapp.forms import CallEventForm  # noqa: E402
+from pawapp.helpers import map_dict_fields  # noqa: E402
+from pawapp.validators import callevent_validator  # noqa: E402
+
+
+VALID_EVENT = {
+    'call_type': const.CALL_TYPE_START,
+    'call_timestamp': '2018-03-12T10:34:11Z',
+    'call_id': '1',
+    'source_number': '11911111111',
+    'destination_number': '11922222222',
+}
+
+INVALID_EVENT = {
+    'call_type': 'x',
+    'call_timestamp': '2018-03-12 10:34:11',
+    'call_id': '1',
+    'source_number': '123',
+}
+
+NUMBER = 5000
+
+BATCH_SIZE = 1000
+
+
+def form_validate(data):
+    """Previous behaviour: a ModelForm for each event."""
+    form = CallEventForm(data)
+    if not form.is_valid():
+        errors = form.errors
+        map_dict_fields(errors, const.DB_FIELDS, const.API_FIELDS)
+        return errors
+    return {}
+
+
+def batch_lines():
+    return [
+        (line, {
+            'type': const.CALL_TYPE_END,
+            'timestamp': '2018-03-12T10:40:11Z',
+            'call_id': str(line),
+        })
+        for line in range(BATCH_SIZE)
+    ]
+
+
+def form_validate_batch(lines):
+    """Previous behaviour of the batch: a ModelForm for each event."""
+    for _, data in lines:
+        map_dict_fields(data, const.API_FIELDS, const.DB_FIELDS)
+        form_validate(data)
+
+
+def measure(name, validate, data):
+    form = timeit.timeit(lambda: form_validate(data), number=NUMBER)
+    compiled = timeit.timeit(lambda: validate(data), number=NUMBER)
+    print('{:<14} {:>10.2f} {:>10.2f} {:>8.1f}x'.format(
+        name, form / NUMBER * 1e6, compiled / NUMBER * 1e6, form / compiled
+    ))
+
+
+def main():
+    print('{:<14} {:>10} {:>10} {:>9}'.format(
+        'event', 'form us', 'fast us', 'speedup'
+    ))
+    measure('valid', callevent_validator.validate, VALID_EVENT)
+    measure('invalid', callevent_validator.validate, INVALID_EVENT)
+
+    form = timeit.timeit(
+        lambda: form_validate_batch(batch_lines()), number=10
+    )
+    compiled = timeit.timeit(
+        lambda: callevent_validator.validate_batch(batch_lines()), number=10
+    )
+    print('{:<14} {:>10.2f} {:>10.2f} {:>8.1f}x'.format(
+        'batch (ms)', form / 10 * 1e3, compiled / 10 * 1e3, form / compiled
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,558 @@
+"""Benchmark suite of the rating, ingestion, billing and bill read hot paths.
+
+Each benchmark reports the operations by second and the 50th percentile of
+the time of an operation (of the fastest of its rounds, the others are
+slowed by the rest of the machine), the 99th percentile and the peak of the
+memory allocated by an operation (traced in a separate run). The results are
+compared with a baseline, and the command fails if any benchmark is slower or
+allocates more than the baseline by more than the tolerance, also when it is
+measured again.
+
+The times depend on the machine, so the baseline is measured in the same
+machine: with ``--baseline-ref`` the suite of the merge base of a git ref is
+run first (in a temporary worktree) and its results are the baseline.
+Without it the results are compared with the baseline saved before in the
+machine, in ``benchmarks/baseline.json`` (not versioned).
+
+The benchmarks use a SQLite database and fakeredis (see
+``benchmark_settings``), so they run without any service. Run from the root
+of the repository with:
+
+    $ PYTHONPATH=src python benchmarks/suite.py --baseline-ref master
+
+Or save the results as the baseline of the machine, and compare with it the
+results of the next runs:
+
+    $ PYTHONPATH=src python benchmarks/suite.py --save-baseline
+    $ PYTHONPATH=src python benchmarks/suite.py
+"""
+import argparse
+import datetime
+import itertools
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmark_settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from pawapp import cache, const, metrics, rating  # noqa: E402
+from pawapp.buffer import callevent_buffer  # noqa: E402
+from pawapp.models import (  # noqa: E402
+    Bill, BilledCall, BillItem, CallEvent, ConnectionRate, clean_rates_cache
+)
+from pawapp.timestamps import parse_timestamp_utc  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# max relative change accepted from the baseline
+TOLERANCE = 0.25
+
+# rounds the operations measured are split in
+ROUNDS = 3
+
+# measures again of a benchmark slower than the baseline, before it is
+# reported as a regression
+CONFIRM_RUNS = 2
+
+# operations traced to measure the memory allocated
+ALLOCATION_NUMBER = 10
+
+BATCH_SIZE = 500
+
+BILL_SIZES = (10, 1000, 100000)
+
+RATES = (
+    (datetime.time(6, 0), datetime.time(22, 0), Decimal('0.36'), Decimal('0.09')),
+    (datetime.time(22, 0), datetime.time(6, 0), Decimal('0.36'), Decimal('0.00')),
+)
+
+CALLS = (
+    ('5 minutes', datetime.datetime(2018, 3, 12, 10, 0), datetime.timedelta(minutes=5)),
+    ('2 hours', datetime.datetime(2018, 3, 12, 10, 0), datetime.timedelta(hours=2)),
+    ('over midnight', datetime.datetime(2018, 3, 12, 23, 50), datetime.timedelta(minutes=30)),
+    ('3 days', datetime.datetime(2018, 3, 12, 21, 57), datetime.timedelta(days=3, minutes=13)),
+)
+
+BENCHMARKS = []
+
+
+def benchmark(name, number, metrics_enabled=True):
+    """Register a benchmark.
+
+    The function decorated prepares the data of the benchmark and returns
+    the operation measured, called without arguments.
+
+    Args:
+        name (str): Name of the benchmark, the key of its baseline.
+        number (int): Number of operations measured.
+        metrics_enabled (bool, optional): Measure the metrics of the
+            application in the operations.
+
+    """
+    def register(setup):
+        BENCHMARKS.append((name, number, metrics_enabled, setup))
+        return setup
+    return register
+
+
+def percentile(times, percent):
+    """Percentile of the sorted times, by nearest rank."""
+    rank = int(math.ceil(percent / 100.0 * len(times)))
+    return times[max(rank, 1) - 1]
+
+
+def measure(operation, number):
+    """Measure the time and memory allocated by the operation.
+
+    The operations by second and the 50th percentile are the ones of the
+    fastest round, the others are slowed by the rest of the machine.
+
+    Returns:
+        dict: Operations by second, percentiles of the time (in
+            microseconds) and peak of the memory allocated (in KiB).
+
+    """
+    for _ in range(min(number // 10 + 1, 10)):
+        operation()
+
+    times, rates, medians = [], [], []
+    for _ in range(ROUNDS):
+        round_times = []
+        for _ in range(max(number // ROUNDS, 1)):
+            started = time.perf_counter()
+            operation()
+            round_times.append(time.perf_counter() - started)
+        times.extend(round_times)
+        rates.append(len(round_times) / sum(round_times))
+        medians.append(percentile(sorted(round_times), 50))
+
+    peaks = []
+    for _ in range(min(number, ALLOCATION_NUMBER)):
+        tracemalloc.start()
+        operation()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    times.sort()
+    return {
+        'ops': max(rates),
+        'p50': min(medians) * 1e6,
+        'p99': percentile(times, 99) * 1e6,
+        'peak_kib': max(peaks) / 1024.0,
+    }
+
+
+def best(result, other):
+    """Best values of two measures of the same benchmark."""
+    return {
+        'ops': max(result['ops'], other['ops']),
+        'p50': min(result['p50'], other['p50']),
+        'p99': min(result['p99'], other['p99']),
+        'peak_kib': min(result['peak_kib'], other['peak_kib']),
+    }
+
+
+def setup_database():
+    """Create the tables and the rates, without the data of other runs."""
+    call_command('migrate', verbosity=0)
+    for model in (BilledCall, BillItem, Bill, CallEvent, ConnectionRate):
+        model.objects.all().delete()
+    ConnectionRate.objects.bulk_create([
+        ConnectionRate(
+            from_time=from_time, to_time=to_time,
+            standing_rate=standing_rate, minute_rate=minute_rate
+        )
+        for from_time, to_time, standing_rate, minute_rate in RATES
+    ])
+    clean_rates_cache()
+
+
+def register_rating():
+    for label, start, duration in CALLS:
+        end = start + duration
+
+        @benchmark('rating/rate_call {}'.format(label), 20000)
+        def rate_call(start=start, end=end):
+            rates = ConnectionRate.rate_timeline()
+            return lambda: rating.rate_call(start, end, rates)
+
+    @benchmark('rating/calculate_call', 2000)
+    def calculate_call():
+        for call_type, timestamp in (
+                (const.CALL_TYPE_START, '2018-03-12T23:50:00Z'),
+                (const.CALL_TYPE_END, '2018-03-13T00:20:00Z')):
+            CallEvent.objects.create(
+                call_type=call_type, call_id='rating',
+                call_timestamp=timestamp,
+                call_datetime=parse_timestamp_utc(timestamp),
+                source_number='11911111111', destination_number='11922222222'
+            )
+        return lambda: CallEvent.calculate_call('rating')
+
+
+def call_events(prefix, number):
+    """Start and end events in the API format, of calls just ended.
+
+    The events are received in order, so the calls are paired by the open
+    calls without reading the database.
+    """
+    end = datetime.datetime.utcnow().replace(microsecond=0)
+    start = end - datetime.timedelta(minutes=5)
+    events = []
+    for index in range(number // 2):
+        call_id = '{}-{}'.format(prefix, index)
+        events.append({
+            'type': const.CALL_TYPE_START, 'call_id': call_id,
+            'timestamp': start.strftime(const.TIMESTAMP_FORMAT),
+            'source': '11911111111', 'destination': '11922222222',
+        })
+        events.append({
+            'type': const.CALL_TYPE_END, 'call_id': call_id,
+            'timestamp': end.strftime(const.TIMESTAMP_FORMAT),
+        })
+    return events
+
+
+def post(client, path, data):
+    response = client.post(
+        path, json.dumps(data), content_type='application/json'
+    )
+    assert response.status_code == 201, response.content
+
+
+def register_ingestion():
+    def single(prefix):
+        client = Client()
+        events = (
+            event
+            for index in itertools.count()
+            for event in call_events('{}-{}'.format(prefix, index), 2)
+        )
+
+        # the event is enqueued in the operation, so the Redis round trips
+        # are measured and not left to the thread of the buffer
+        def operation():
+            post(client, '/api/v0/call_events/', next(events))
+            callevent_buffer.close()
+
+        return operation
+
+    # the cost of the metrics is the difference between both
+    benchmark('ingestion/CallEventHandler single', 2000)(
+        lambda: single('single')
+    )
+    benchmark('ingestion/CallEventHandler single without metrics', 2000,
+              metrics_enabled=False)(lambda: single('unmeasured'))
+
+    @benchmark('ingestion/CallEventHandler batch of {}'.format(BATCH_SIZE), 100)
+    def batch():
+        client = Client()
+        batches = (
+            call_events('batch-{}'.format(index), BATCH_SIZE)
+            for index in itertools.count()
+        )
+        return lambda: post(
+            client, '/api/v0/call_events/batch/', next(batches)
+        )
+
+
+def register_billing():
+    @benchmark('billing/CallEvent.save_call start and end', 1000)
+    def save_call():
+        calls = (
+            (dict(start, call_type=start.pop('type'),
+                  call_timestamp=start.pop('timestamp'),
+                  source_number=start.pop('source'),
+                  destination_number=start.pop('destination')),
+             dict(call_id=end['call_id'], call_type=end['type'],
+                  call_timestamp=end['timestamp']))
+            for index in itertools.count()
+            for start, end in [call_events('billing-{}'.format(index), 2)]
+        )
+
+        def operation():
+            start, end = next(calls)
+            CallEvent.save_call(**start)
+            CallEvent.save_call(save_bill=True, **end)
+        return operation
+
+
+def create_bill(phone_number, size):
+    bill = Bill.objects.create(
+        phone_number=phone_number, year=2018, month=3,
+        total_duration=0, total_amount=0, total_amount_cents=0
+    )
+    from_datetime = parse_timestamp_utc('2018-03-01T10:00:00Z')
+    items = []
+    for index in range(size):
+        start = from_datetime + datetime.timedelta(seconds=index * 20)
+        end = start + datetime.timedelta(seconds=15)
+        items.append(BillItem(
+            bill=bill, call_id='{}-{}'.format(phone_number, index),
+            phone_number='11922222222',
+            from_timestamp=start.strftime(const.TIMESTAMP_FORMAT),
+            to_timestamp=end.strftime(const.TIMESTAMP_FORMAT),
+            from_datetime=start, to_datetime=end,
+            duration=15, amount=Decimal('0.36'), amount_cents=36,
+            rolled_up=True
+        ))
+    BillItem.objects.bulk_create(items, batch_size=5000)
+
+
+def register_bill_reads():
+    for size in BILL_SIZES:
+        number = max(3, 50000 // size)
+
+        @benchmark('bill/data_by_number_period {} items'.format(size), number)
+        def read(size=size):
+            phone_number = '1190{:07d}'.format(size)
+            create_bill(phone_number, size)
+            key = Bill.cache_key(phone_number, '03', '2018')
+
+            def operation():
+                cache.clean_value(key)
+                Bill.data_by_number_period(phone_number, '03', '2018')
+            return operation
+
+    @benchmark('bill/data_by_number_period 1000 items cached', 5000)
+    def read_cached():
+        phone_number = '11910001000'
+        create_bill(phone_number, 1000)
+        return lambda: Bill.data_by_number_period(phone_number, '03', '2018')
+
+
+def register_metrics():
+    @benchmark('metrics/Counter.inc', 20000)
+    def counter_inc():
+        return lambda: metrics.CALL_EVENTS_REJECTED.inc('benchmark')
+
+    @benchmark('metrics/Histogram.time', 20000)
+    def histogram_time():
+        def operation():
+            with metrics.CALL_EVENT_HANDLE_SECONDS.time('benchmark'):
+                pass
+        return operation
+
+
+register_rating()
+register_ingestion()
+register_billing()
+register_bill_reads()
+register_metrics()
+
+
+def compare(results, baseline, tolerance):
+    """Compare the results with the baseline.
+
+    Returns:
+        list: Description of the regressions.
+
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['ops'] < base['ops'] * (1 - tolerance):
+            regressions.append(
+                '{}: {:.0f} ops/s, baseline {:.0f} ops/s'.format(
+                    name, result['ops'], base['ops']
+                )
+            )
+        if result['p50'] > base['p50'] * (1 + tolerance):
+            regressions.append('{}: p50 {:.1f} us, baseline {:.1f} us'.format(
+                name, result['p50'], base['p50']
+            ))
+        # small peaks change by a few objects between runs
+        if result['peak_kib'] > base['peak_kib'] * (1 + tolerance) + 1:
+            regressions.append(
+                '{}: peak {:.1f} KiB, baseline {:.1f} KiB'.format(
+                    name, result['peak_kib'], base['peak_kib']
+                )
+            )
+    return regressions
+
+
+def git(*args, cwd=ROOT_PATH):
+    """Run a git command, returning its output."""
+    return subprocess.check_output(
+        ('git',) + args, cwd=cwd, universal_newlines=True
+    ).strip()
+
+
+def has_suite(commit):
+    """Check if the suite of a commit can save a baseline."""
+    result = subprocess.run(
+        ['git', 'show', '{}:benchmarks/suite.py'.format(commit)],
+        cwd=ROOT_PATH, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        universal_newlines=True
+    )
+    return result.returncode == 0 and '--save-baseline' in result.stdout
+
+
+def read_baseline(path):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def ref_baseline(ref, name_filter):
+    """Measure the baseline running the suite of the merge base of a ref.
+
+    The merge base (the commit the current branch started from) is checked
+    out in a temporary worktree and its suite is run in a separate process,
+    in the same machine. The database is migrated again by the suite of the
+    current tree, after the one of the merge base.
+
+    Args:
+        ref (str): Git ref of the baseline, like the main branch.
+        name_filter (str): Text in the name of the benchmarks run.
+
+    Returns:
+        dict: Results of the benchmarks by name, None if the merge base has
+            no suite saving a baseline (it is older than the suite).
+
+    Raises:
+        subprocess.CalledProcessError: Raises if git or the suite of the
+            merge base fails.
+
+    """
+    commit = git('merge-base', 'HEAD', ref)
+    if not has_suite(commit):
+        return None
+    print('Measuring the baseline of {} ({})'.format(ref, commit[:12]))
+    path = tempfile.mkdtemp(prefix='paw-baseline-')
+    worktree = os.path.join(path, 'worktree')
+    baseline_path = os.path.join(path, 'baseline.json')
+    git('worktree', 'add', '--detach', worktree, commit)
+    try:
+        env = dict(os.environ, PYTHONPATH=os.path.join(worktree, 'src'))
+        subprocess.check_call(
+            [
+                sys.executable,
+                os.path.join(worktree, 'benchmarks', 'suite.py'),
+                '--save-baseline', '--baseline', baseline_path,
+                '--filter', name_filter,
+            ],
+            cwd=worktree, env=env
+        )
+        return read_baseline(baseline_path)
+    finally:
+        git('worktree', 'remove', '--force', worktree)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--filter', default='',
+        help='Run only the benchmarks with this text in the name.'
+    )
+    parser.add_argument(
+        '--baseline', default=BASELINE_PATH, help='Path of the baseline.'
+    )
+    parser.add_argument(
+        '--baseline-ref',
+        help='Measure the baseline running first the suite of the merge '
+             'base of this git ref, instead of reading it.'
+    )
+    parser.add_argument(
+        '--save-baseline', action='store_true',
+        help='Save the results as the baseline instead of comparing them.'
+    )
+    parser.add_argument(
+        '--tolerance', type=float, default=TOLERANCE,
+        help='Max relative change accepted from the baseline.'
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline_ref:
+        baseline = ref_baseline(args.baseline_ref, args.filter)
+        if baseline is None:
+            # the suite was added after the merge base
+            if not os.path.exists(args.baseline):
+                parser.error(
+                    'the merge base of {} has no benchmark suite to measure '
+                    'the baseline, save one in this machine with '
+                    '--save-baseline (before the change) and run without '
+                    '--baseline-ref'.format(args.baseline_ref)
+                )
+            print('The merge base of {} has no benchmark suite, comparing '
+                  'with the baseline in {}'.format(
+                      args.baseline_ref, args.baseline
+                  ))
+            baseline = read_baseline(args.baseline)
+    elif not args.save_baseline and os.path.exists(args.baseline):
+        baseline = read_baseline(args.baseline)
+
+    setup_database()
+
+    results = {}
+    print('{:<52} {:>12} {:>12} {:>12} {:>10}'.format(
+        'benchmark', 'ops/s', 'p50 (us)', 'p99 (us)', 'peak KiB'
+    ))
+    for name, number, metrics_enabled, setup in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        settings.METRICS_ENABLED = metrics_enabled
+        operation = setup()
+        result = measure(operation, number)
+        # a benchmark slower than the baseline is measured again, so a
+        # regression is not a run slowed by the rest of the machine
+        for _ in range(CONFIRM_RUNS):
+            if baseline is None or \
+                    not compare({name: result}, baseline, args.tolerance):
+                break
+            result = best(result, measure(operation, number))
+        results[name] = result
+        print('{:<52} {ops:>12.1f} {p50:>12.1f} {p99:>12.1f} '
+              '{peak_kib:>10.1f}'.format(name, **result))
+
+    # enqueue the events received
+    callevent_buffer.close()
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            baseline = read_baseline(args.baseline)
+        baseline.update(results)
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('Baseline saved in {}'.format(args.baseline))
+        return 0
+
+    if baseline is None:
+        print('No baseline in {}, save one in this machine with '
+              '--save-baseline or use --baseline-ref'.format(args.baseline))
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\nREGRESSIONS (tolerance {:.0%}):'.format(args.tolerance))
+        for regression in regressions:
+            print('  ' + regression)
+        return 1
+    print('\nNo regressions (tolerance {:.0%}).'.format(args.tolerance))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,57 @@
+"""Benchmark of the parser of the timestamps.
+
+Compares ``datetime.strptime`` with the parser of ``pawapp.timestamps``,
+without the cache (every timestamp different) and with the cache (the start
+and end timestamps parsed again when the call is billed).
+
+Run with:
+
+    $ PYTHONPATH=src python benchmarks/timestamps.py
+"""
+import datetime
+import timeit
+
+from pawapp import const, timestamps
+
+
+NUMBER = 100000
+
+FIRST_DAY = datetime.datetime(2018, 3, 1)
+
+VALUES = [
+    (FIRST_DAY + datetime.timedelta(seconds=index * 7)).strftime(
+        const.TIMESTAMP_FORMAT
+    )
+    for index in range(NUMBER)
+]
+
+
+def measure(name, parse, values):
+    elapsed = timeit.timeit(lambda: [parse(value) for value in values], number=1)
+    print('{:<18} {:>10.3f}'.format(name, elapsed / len(values) * 1e6))
+    return elapsed
+
+
+def main():
+    print('{:<18} {:>10}'.format('parser', 'us / call'))
+    baseline = measure(
+        'strptime',
+        lambda value: datetime.datetime.strptime(value, const.TIMESTAMP_FORMAT),
+        VALUES
+    )
+    uncached = measure('fixed offsets', timestamps._parse, VALUES)
+
+    # each start and end timestamp is parsed when validated and when billed
+    repeated = VALUES[:const.TIMESTAMP_CACHE_SIZE // 2] * 2
+    timestamps.parse_timestamp.cache_clear()
+    cached = measure('cached (50% hits)', timestamps.parse_timestamp, repeated)
+
+    print()
+    print('speedup fixed offsets: {:.1f}x'.format(baseline / uncached))
+    print('speedup cached: {:.1f}x'.format(
+        baseline / (cached / len(repeated) * NUMBER)
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,15 +24,16 @@ def read(*names, **kwargs):
 
 # external dependencies required to run the application
 EXTERNAL_DEPENDENCIES = [
-    'django',
+    'django>=3.0,<4.0',
     'python-decouple',
     'psycopg2-binary',
     'restless',
-    'redis',
+    'redis>=4.2',
     'rq',
     'django-rq',
     'django-redis',
     'ujson',
+    'numpy',
 ]
 
 setup(
@@ -59,9 +60,12 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: Unix',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
         'Programming Language :: Python :: Implementation :: CPython',
         'Topic :: Utilities',
     ],
+    python_requires='>=3.8',
     install_requires=EXTERNAL_DEPENDENCIES,
 )
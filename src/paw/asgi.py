@@ -0,0 +1,26 @@
+"""
+ASGI config for paw project.
+
+The call events received in ``api/v0/call_events/`` are handled by the
+asynchronous ingestion application, the other requests by Django.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "paw.settings")
+
+django_application = get_asgi_application()
+
+# the ingestion uses the models, so it is imported after the django setup
+from pawapp.ingestion import CallEventIngestion  # noqa: E402
+
+application = CallEventIngestion(
+    django_application, path='/api/v0/call_events/'
+)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from decouple import config, Csv
@@ -40,6 +41,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'pawapp.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'paw.urls'
@@ -128,3 +130,20 @@ RQ_QUEUES = {
         'DEFAULT_TIMEOUT': 360,
     }
 }
+
+# metrics of the hot paths, exposed in /metrics
+METRICS_ENABLED = config('METRICS_ENABLED', cast=bool, default=True)
+
+# profiling of a sample of the requests and jobs (disabled with 0), only the
+# profiles of the ones slower than the min duration (in seconds) are kept
+PROFILING_SAMPLE_RATE = config('PROFILING_SAMPLE_RATE', cast=float, default=0)
+PROFILING_MIN_DURATION = config(
+    'PROFILING_MIN_DURATION', cast=float, default=0
+)
+PROFILING_DIR = config(
+    'PROFILING_DIR',
+    default=os.path.join(tempfile.gettempdir(), 'paw_profiles')
+)
+
+# check of the queries of the billing paths: off, log or raise
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='off')
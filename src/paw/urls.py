@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from pawapp.views import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('django-rq/', include('django_rq.urls')),
     path('api/', include('pawapp.urls')),
+    path('metrics', metrics_view),
 ]
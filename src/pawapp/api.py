@@ -1,8 +1,14 @@
+from types import GeneratorType
+
+from django.http import StreamingHttpResponse
+from restless.constants import OK
 from restless.dj import DjangoResource
 from restless.exceptions import BadRequest
 
-from .handlers import callevent_handler, bill_handler
+from . import const
+from .handlers import callevent_handler, callevent_batch_handler, bill_handler
 from .exceptions import InvalidDataException
+from .helpers import parse_json_lines
 
 
 class BaseResource(DjangoResource):
@@ -35,8 +41,38 @@ class CallEventResource(BaseResource):
             raise BadRequest(ide.errors)
 
 
+class CallEventBatchResource(BaseResource):
+    """Resource to listening batches of CallEvent requests.
+
+    The body can be a JSON array or newline-delimited JSON with one call
+    event per line.
+    """
+    def deserialize_list(self, body):
+        try:
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            return parse_json_lines(body or '')
+        except ValueError:
+            raise BadRequest(const.MESSAGE_EVENTS_INVALID_FORMAT)
+
+    def create(self):
+
+        try:
+            handler = callevent_batch_handler(self.data)
+            return handler.handle()
+        except InvalidDataException as ide:
+            raise BadRequest(ide.errors)
+
+
 class BillResource(BaseResource):
-    """Resource to listening Bill requests."""
+    """Resource to listening Bill requests.
+
+    With the query parameter ``stream``, the bill is streamed in chunks. The
+    query parameters ``limit``, ``after`` and ``fields`` return a page of
+    the calls and ``summary`` returns only the bill totals.
+    """
+    query_flags = ['stream', 'summary']
+    query_fields = ['limit', 'after', 'fields']
 
     def detail(self, phone_number, month=None, year=None):
 
@@ -45,6 +81,13 @@ class BillResource(BaseResource):
             'month': month,
             'year': year
         }
+        if self.request is not None:
+            for flag in self.query_flags:
+                if self.request.GET.get(flag):
+                    data[flag] = True
+            for field in self.query_fields:
+                if field in self.request.GET:
+                    data[field] = self.request.GET[field]
 
         try:
             handler = bill_handler(data)
@@ -52,3 +95,16 @@ class BillResource(BaseResource):
             return bill_data
         except InvalidDataException as ide:
             raise BadRequest(ide.errors)
+
+    def serialize_detail(self, data):
+        # streamed bills are already serialized
+        if isinstance(data, GeneratorType):
+            return data
+        return super().serialize_detail(data)
+
+    def build_response(self, data, status=OK):
+        if isinstance(data, GeneratorType):
+            return StreamingHttpResponse(
+                data, content_type='application/json', status=status
+            )
+        return super().build_response(data, status=status)
@@ -0,0 +1,137 @@
+"""Backfill of the datetime and cents columns of the rows already saved.
+
+The rows saved before these columns existed have them empty. They are filled
+here from the timestamp and money values of each row, in chunks read by id,
+so the backfill can run with the application online and be run again safely
+if interrupted.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from . import const
+from .helpers import money_cents
+from .models import Bill, BillItem, CallEvent
+from .timestamps import parse_timestamp_utc
+
+
+def backfill_rows(queryset, columns, fields, convert,
+                  chunk_size=const.BACKFILL_CHUNK_SIZE):
+    """Fill the fields of the rows of a queryset in chunks.
+
+    Args:
+        queryset (QuerySet): Rows to be filled.
+        columns (list): Columns read for each row, after its id.
+        fields (list): Fields filled.
+        convert (callable): Receives the id and the columns of a row and
+            returns the model instance with the fields filled, or None if the
+            row can't be filled.
+        chunk_size (int, optional): Number of rows filled at once.
+
+    Returns:
+        int: Number of rows filled.
+
+    """
+    queryset = queryset.order_by('id')
+    updated, last_id = 0, 0
+
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id)
+            .values_list('id', *columns)[:chunk_size]
+        )
+        if not chunk:
+            break
+
+        instances = [convert(*row) for row in chunk]
+        instances = [instance for instance in instances if instance]
+        with transaction.atomic():
+            queryset.model.objects.bulk_update(
+                instances, fields, batch_size=1000
+            )
+
+        updated += len(instances)
+        last_id = chunk[-1][0]
+
+    return updated
+
+
+def _call_event(event_id, call_timestamp):
+    try:
+        call_datetime = parse_timestamp_utc(call_timestamp)
+    except (TypeError, ValueError):
+        return None
+    return CallEvent(id=event_id, call_datetime=call_datetime)
+
+
+def _bill_item(item_id, from_timestamp, to_timestamp, amount):
+    try:
+        from_datetime = parse_timestamp_utc(from_timestamp)
+        to_datetime = parse_timestamp_utc(to_timestamp)
+    except (TypeError, ValueError):
+        return None
+    return BillItem(
+        id=item_id,
+        from_datetime=from_datetime,
+        to_datetime=to_datetime,
+        amount_cents=money_cents(amount)
+    )
+
+
+def _bill(bill_id, total_amount):
+    return Bill(id=bill_id, total_amount_cents=money_cents(total_amount))
+
+
+def backfill_call_events(chunk_size=const.BACKFILL_CHUNK_SIZE):
+    """Fill the call_datetime of the CallEvents from their call_timestamp.
+
+    Args:
+        chunk_size (int, optional): Number of rows filled at once.
+
+    Returns:
+        int: Number of rows filled.
+
+    """
+    return backfill_rows(
+        CallEvent.objects.filter(call_datetime__isnull=True),
+        ['call_timestamp'], ['call_datetime'], _call_event, chunk_size
+    )
+
+
+def backfill_bill_items(chunk_size=const.BACKFILL_CHUNK_SIZE):
+    """Fill the datetimes and amount in cents of the BillItems.
+
+    Args:
+        chunk_size (int, optional): Number of rows filled at once.
+
+    Returns:
+        int: Number of rows filled.
+
+    """
+    items = BillItem.objects.filter(
+        Q(from_datetime__isnull=True) |
+        Q(to_datetime__isnull=True) |
+        Q(amount_cents__isnull=True)
+    )
+    return backfill_rows(
+        items,
+        ['from_timestamp', 'to_timestamp', 'amount'],
+        ['from_datetime', 'to_datetime', 'amount_cents'],
+        _bill_item,
+        chunk_size
+    )
+
+
+def backfill_bills(chunk_size=const.BACKFILL_CHUNK_SIZE):
+    """Fill the total amount in cents of the Bills.
+
+    Args:
+        chunk_size (int, optional): Number of rows filled at once.
+
+    Returns:
+        int: Number of rows filled.
+
+    """
+    return backfill_rows(
+        Bill.objects.filter(total_amount_cents__isnull=True),
+        ['total_amount'], ['total_amount_cents'], _bill, chunk_size
+    )
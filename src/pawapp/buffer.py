@@ -0,0 +1,204 @@
+"""Coalesced enqueue of the call events.
+
+The events accepted by a process are kept in a buffer for a short window and
+enqueued together as a single batch job, so the Redis commands to write and
+push a job are sent once by window instead of once by event. The jobs are
+enqueued in a single pipelined transaction.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+import django_rq
+
+from . import const, metrics
+from .jobs import save_callevent_batch
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_batches(func, batches, queue_name='default'):
+    """Enqueue a job for each batch in a single pipelined transaction.
+
+    Args:
+        func (callable): Function of the jobs, called with each batch.
+        batches (iterable): Arguments of the jobs.
+        queue_name (str, optional): Name of the RQ queue.
+
+    Returns:
+        list: Jobs enqueued.
+
+    """
+    queue = django_rq.get_queue(queue_name)
+    with metrics.CALL_EVENT_ENQUEUE_SECONDS.time(func.__name__), \
+            queue.connection.pipeline() as pipe:
+        jobs = [
+            queue.enqueue_call(func, args=(batch,), pipeline=pipe)
+            for batch in batches
+        ]
+        pipe.execute()
+    return jobs
+
+
+class EventBuffer:
+    """Buffer of events flushed by time window or size.
+
+    A background thread flushes the events when the window of the first
+    event pending ends, or at once when the buffer reaches its max size. The
+    events pending are flushed when the process exits.
+
+    The events that could not be flushed are flushed again, every
+    ``retry_interval`` seconds, up to ``max_retries`` times, and then
+    dropped. While they are retried the buffer keeps up to ``max_pending``
+    events, and drops the ones added after. The events dropped are logged
+    and counted in ``CALL_EVENTS_DROPPED``.
+
+    Args:
+        flush (callable): Receives the list of events flushed.
+        interval (float, optional): Seconds the events are kept.
+        max_size (int, optional): Number of events flushed at once.
+        max_pending (int, optional): Number of events kept.
+        max_retries (int, optional): Retries of the events not flushed.
+        retry_interval (float, optional): Seconds between the retries.
+
+    """
+
+    def __init__(self, flush, interval=const.CALL_EVENT_BUFFER_INTERVAL,
+                 max_size=const.CALL_EVENT_BUFFER_MAX_SIZE,
+                 max_pending=const.CALL_EVENT_BUFFER_MAX_PENDING,
+                 max_retries=const.CALL_EVENT_BUFFER_MAX_RETRIES,
+                 retry_interval=const.CALL_EVENT_BUFFER_RETRY_INTERVAL):
+        self.flush = flush
+        self.interval = interval
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_interval = retry_interval
+        self.events = []
+        # flushes failed in a row, and if the events added are dropped
+        self.failures = 0
+        self.full = False
+        self.condition = threading.Condition()
+        # held while the events taken are flushed, so the process does not
+        # exit before they are enqueued
+        self.flush_lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+
+    def add(self, event):
+        """Add an event to be flushed, dropping it if the buffer is full.
+
+        Args:
+            event: Event value.
+
+        """
+        with self.condition:
+            self._start()
+            if len(self.events) >= self.max_pending:
+                # logged once until the buffer has room again
+                if not self.full:
+                    logger.error(
+                        'The buffer has %d events not flushed, dropping the '
+                        'events added.', len(self.events)
+                    )
+                    self.full = True
+                metrics.CALL_EVENTS_DROPPED.inc('buffer_full')
+                return
+            self.full = False
+            self.events.append(event)
+            if len(self.events) == 1 or len(self.events) >= self.max_size:
+                self.condition.notify()
+
+    def _start(self):
+        # the thread is not copied to the processes forked from this one
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.events = []
+        self.thread = threading.Thread(
+            target=self._run, name='event-buffer', daemon=True
+        )
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _wait(self):
+        """Wait for the window of the first event pending."""
+        with self.condition:
+            while not self.events:
+                self.condition.wait()
+            deadline = time.monotonic() + self.interval
+            while len(self.events) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+
+    def _run(self):
+        while True:
+            self._wait()
+            if not self._flush():
+                time.sleep(self.retry_interval)
+
+    def _flush(self):
+        """Flush the events pending, up to the max size.
+
+        Returns:
+            bool: False if the events could not be flushed.
+
+        """
+        with self.flush_lock:
+            with self.condition:
+                events = self.events[:self.max_size]
+                self.events = self.events[self.max_size:]
+            if not events:
+                return True
+            try:
+                self.flush(events)
+            except Exception:
+                logger.exception('Could not flush %d events.', len(events))
+                self.failures += 1
+                if self.failures > self.max_retries:
+                    logger.error(
+                        '%d events were dropped after %d retries.',
+                        len(events), self.max_retries
+                    )
+                    metrics.CALL_EVENTS_DROPPED.inc(
+                        'not_enqueued', amount=len(events)
+                    )
+                    self.failures = 0
+                else:
+                    # keep the events to be flushed again
+                    with self.condition:
+                        self.events[:0] = events
+                return False
+            self.failures = 0
+        return True
+
+    def close(self):
+        """Flush all the events pending.
+
+        Returns when the events pending and the ones taken by the thread are
+        flushed. The events that could not be flushed are lost when the
+        process exits.
+        """
+        while self.events:
+            if not self._flush():
+                logger.error('%d events were not flushed.', len(self.events))
+                metrics.CALL_EVENTS_DROPPED.inc(
+                    'not_enqueued', amount=len(self.events)
+                )
+                return
+        # wait for the events the thread is flushing
+        with self.flush_lock:
+            pass
+
+
+def enqueue_callevents(events):
+    """Enqueue a batch job saving the events."""
+    enqueue_batches(save_callevent_batch, [events])
+
+
+callevent_buffer = EventBuffer(enqueue_callevents)
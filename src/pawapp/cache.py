@@ -1,35 +1,188 @@
-"""Module to access and save data through the Django cache system."""
+"""Module to access and save data through the Django cache system.
+
+The values serialized are read and written with the Redis client of the
+cache, under the keys of the cache, so the bytes of the serializers are not
+pickled again by django-redis.
+"""
+import datetime
+import json
 import pickle
+import struct
+import time
+from decimal import Decimal
+
 from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis import get_redis_connection
+
+
+class PickleSerializer:
+    """Serializer for any object using pickle."""
+
+    def dumps(self, data):
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+class JSONSerializer:
+    """Compact serializer for JSON compatible objects, like bill documents."""
+
+    def dumps(self, data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data.decode('utf-8'))
+
+
+class RatesSerializer:
+    """Compact binary serializer for rates tables.
+
+    Each rate is saved as a fixed size record with the times as seconds of
+    the day and the rates as integer cents.
+    """
+    header = b'R1'
+    record = struct.Struct('<iiqq')
+
+    def dumps(self, data):
+        records = [
+            self.record.pack(
+                from_time.hour * 3600 + from_time.minute * 60 +
+                from_time.second,
+                to_time.hour * 3600 + to_time.minute * 60 + to_time.second,
+                int((standing_rate * 100).to_integral_value()),
+                int((minute_rate * 100).to_integral_value())
+            )
+            for from_time, to_time, standing_rate, minute_rate in data
+        ]
+        return self.header + b''.join(records)
+
+    def loads(self, data):
+        records = data[len(self.header):]
+        if (not data.startswith(self.header) or
+                len(records) % self.record.size):
+            raise ValueError('Invalid rates data.')
+
+        def to_time(seconds):
+            return datetime.time(
+                seconds // 3600, seconds % 3600 // 60, seconds % 60
+            )
+
+        return tuple(
+            (
+                to_time(from_seconds),
+                to_time(to_seconds),
+                Decimal(standing_cents).scaleb(-2),
+                Decimal(minute_cents).scaleb(-2)
+            )
+            for from_seconds, to_seconds, standing_cents, minute_cents
+            in self.record.iter_unpack(records)
+        )
+
 
+pickle_serializer = PickleSerializer()
+json_serializer = JSONSerializer()
+rates_serializer = RatesSerializer()
 
-def get_value(key):
-    """Get value from cache using pickle.
+
+def redis_timeout(timeout):
+    """Seconds to keep a value in Redis, None to keep it forever."""
+    if timeout is DEFAULT_TIMEOUT:
+        return cache.default_timeout
+    return timeout
+
+
+def get_value(key, serializer=pickle_serializer):
+    """Get value from cache using the serializer.
 
     Args:
         key (str): Cache key.
+        serializer (obj, optional): Serializer of the value, pickle by
+            default.
 
     Returns:
-        obj: Cached object.
+        obj: Cached object or None if it can't be loaded by the serializer.
 
     """
-    data = cache.get(key)
+    data = get_redis_connection('default').get(cache.make_key(key))
     if data:
-        return pickle.loads(data)
+        try:
+            return serializer.loads(data)
+        except ValueError:
+            return None
 
 
-def set_value(key, data):
-    """Set value in the cache using pickle.
+def set_value(key, data, serializer=pickle_serializer,
+              timeout=DEFAULT_TIMEOUT):
+    """Set value in the cache using the serializer.
 
     Args:
         key (str): Cache key.
         data (obj): Object to be saved.
+        serializer (obj, optional): Serializer of the value, pickle by
+            default.
+        timeout (int, optional): Seconds to keep the value, the cache
+            default timeout by default.
 
     """
     if not key or not data:
         return
 
-    cache.set(key, pickle.dumps(data))
+    get_redis_connection('default').set(
+        cache.make_key(key), serializer.dumps(data), ex=redis_timeout(timeout)
+    )
+
+
+def get_values(keys, serializer=pickle_serializer):
+    """Get many values from cache at once using the serializer.
+
+    Args:
+        keys (list): Cache keys.
+        serializer (obj, optional): Serializer of the values, pickle by
+            default.
+
+    Returns:
+        dict: Cached objects by key, without the keys not found or that
+            can't be loaded by the serializer.
+
+    """
+    if not keys:
+        return {}
+
+    values = {}
+    raw_values = get_redis_connection('default').mget(
+        [cache.make_key(key) for key in keys]
+    )
+    for key, data in zip(keys, raw_values):
+        if not data:
+            continue
+        try:
+            values[key] = serializer.loads(data)
+        except ValueError:
+            continue
+    return values
+
+
+def set_values(values, serializer=pickle_serializer, timeout=DEFAULT_TIMEOUT):
+    """Set many values in the cache at once using the serializer.
+
+    Args:
+        values (dict): Objects to be saved by key.
+        serializer (obj, optional): Serializer of the values, pickle by
+            default.
+        timeout (int, optional): Seconds to keep the values, the cache
+            default timeout by default.
+
+    """
+    if not values:
+        return
+
+    timeout = redis_timeout(timeout)
+    with get_redis_connection('default').pipeline() as pipe:
+        for key, data in values.items():
+            pipe.set(cache.make_key(key), serializer.dumps(data), ex=timeout)
+        pipe.execute()
 
 
 def clean_value(key):
@@ -42,3 +195,101 @@ def clean_value(key):
     if not key:
         return
     cache.delete(key)
+
+
+def clean_values(keys):
+    """Clean many cached values.
+
+    Args:
+        keys (list): Keys to identify the cache values.
+
+    """
+    if not keys:
+        return
+    cache.delete_many(keys)
+
+
+def get_version(key):
+    """Get the version number of a value.
+
+    Args:
+        key (str): Key of the version in the cache.
+
+    Returns:
+        int: Version number or None if the value was never changed.
+
+    """
+    return cache.get(key)
+
+
+def bump_version(key):
+    """Increment the version number of a value.
+
+    Args:
+        key (str): Key of the version in the cache.
+
+    Returns:
+        int: New version number.
+
+    """
+    cache.add(key, 0, timeout=None)
+    return cache.incr(key)
+
+
+class LocalValue:
+    """Value kept in the memory of the process.
+
+    The value is loaded again only when its version in the cache changes. To
+    avoid a cache access for every use, the version is checked at most once
+    in every check interval.
+
+    Args:
+        version_key (str): Key of the version in the cache.
+        loader (callable): Function to load the value, receives the version
+            it is loaded for (None if the value was never changed), to cache
+            the value by version.
+        check_interval (float): Seconds between the checks of the version.
+        counter (Counter, optional): Metrics counter of the uses of the value
+            kept (``local``, ``hit``) and of the loads (``local``, ``miss``).
+
+    """
+
+    def __init__(self, version_key, loader, check_interval, counter=None):
+        self.version_key = version_key
+        self.loader = loader
+        self.check_interval = check_interval
+        self.counter = counter
+        # value, version and time of the last check
+        self._state = (None, None, 0)
+
+    def get(self):
+        """Get the value, loading it if there is a new version.
+
+        Returns:
+            obj: Current value.
+
+        """
+        value, version, checked_at = self._state
+        now = time.monotonic()
+        if value and now - checked_at < self.check_interval:
+            self._count('hit')
+            return value
+
+        current_version = get_version(self.version_key)
+        if not value or current_version != version:
+            self._count('miss')
+            value = self.loader(current_version)
+            if not value:
+                return value
+        else:
+            self._count('hit')
+        self._state = (value, current_version, now)
+        return value
+
+    def _count(self, result):
+        if self.counter is not None:
+            self.counter.inc('local', result)
+
+    def clear(self):
+        """Clear the value kept in the memory."""
+        self._state = (None, None, 0)
@@ -23,16 +23,106 @@ CALL_TYPE_CHOICES = [
 ]
 
 CALL_ID_MAX_LENGTH = 32
+# max seconds between the start and end of a call, the other event of a call
+# is read from the database only in this window around the event received
+CALL_MAX_DURATION = 7 * 24 * 60 * 60
 PHONE_NUMBER_MIN_LENGTH = 10
 PHONE_NUMBER_MAX_LENGTH = 11
 
 TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# timestamps parsed kept by each process
+TIMESTAMP_CACHE_SIZE = 8192
 
-CACHE_KEY_RATES = 'connection_rates'
+# the rates are cached by version, so the rates loaded before a change are
+# not read after it
+CACHE_KEY_RATES = 'connection_rates:{version}'
+CACHE_KEY_RATES_VERSION = 'connection_rates_version'
+
+CACHE_KEY_BILL_CALLS = 'bill_calls:{phone_number}:{year}:{month}'
+CACHE_TIMEOUT_BILL = 24 * 60 * 60
+
+# Redis hashes with the events of the calls waiting for the other event,
+# expired ones are read from the database
+CACHE_KEY_OPEN_CALL = 'open_call:{call_id}'
+CACHE_TIMEOUT_OPEN_CALL = 24 * 60 * 60
+
+# seconds between checks of the rates version by each process
+RATES_CHECK_INTERVAL = 0.5
+
+CALL_EVENT_BATCH_MAX_SIZE = 10000
+CALL_EVENT_BATCH_CHUNK_SIZE = 500
+
+# window (in seconds) and size of the events enqueued together by process
+CALL_EVENT_BUFFER_INTERVAL = 0.005
+CALL_EVENT_BUFFER_MAX_SIZE = 100
+# events kept while they can't be enqueued (Redis is down), retries of each
+# flush and seconds between them, before the events are dropped
+CALL_EVENT_BUFFER_MAX_PENDING = 10000
+CALL_EVENT_BUFFER_MAX_RETRIES = 5
+CALL_EVENT_BUFFER_RETRY_INTERVAL = 1
+
+RERATE_CHUNK_SIZE = 100000
+
+BACKFILL_CHUNK_SIZE = 10000
+
+BILL_STREAM_CHUNK_SIZE = 500
+
+BILL_CALL_FIELDS = [
+    'destination',
+    'start_date',
+    'start_time',
+    'duration',
+    'price',
+]
+BILL_PAGE_SIZE = 50
+BILL_PAGE_MAX_SIZE = 1000
 
 MESSAGE_FIELD_REQUIRED = 'This field is required.'
 MESSAGE_FIELD_INVALID_VALUE = 'This field has an invalid value.'
 MESSAGE_FIELD_INVALID_FORMAT = 'This field has an invalid format.'
 MESSAGE_FIELD_INVALID_LENGTH = 'This field has an invalid length.'
+MESSAGE_EVENT_INVALID_FORMAT = 'This event has an invalid format.'
+MESSAGE_EVENTS_INVALID_FORMAT = 'The events have an invalid format.'
+MESSAGE_EVENTS_TOO_MANY = 'Too many events, the limit is {}.'
+MESSAGE_BODY_INVALID_JSON = 'Request body is not valid JSON'
+MESSAGE_BODY_TOO_LARGE = 'Request body is too large'
+MESSAGE_EVENT_NOT_ENQUEUED = 'The event could not be received, try again later.'
 MESSAGE_PERIOD_INVALID = 'Invalid period values'
 MESSAGE_PERIOD_WRONG = 'Wrong period values'
+
+# monthly partitions created after the current month, and months the
+# partitions of the call events are kept after they end
+PARTITION_MONTHS_AHEAD = 2
+CALL_EVENT_RETENTION_MONTHS = 3
+
+# items added to the totals of the bills at once, and seconds between the
+# rollups when there are no more items to add
+ROLLUP_BATCH_SIZE = 10000
+ROLLUP_INTERVAL = 1.0
+
+# Redis hash with the metrics of all the processes, seconds between the
+# flushes of the metrics of each process and upper bounds (in seconds) of the
+# buckets of the histograms
+CACHE_KEY_METRICS = 'metrics'
+METRICS_FLUSH_INTERVAL = 10.0
+METRICS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0,
+)
+
+# views of the requests profiled and lines that allocated most memory kept
+# by profile
+PROFILING_VIEWS = [
+    'BillResource',
+    'CallEventResource',
+    'CallEventBatchResource',
+]
+PROFILING_ALLOCATIONS = 20
+
+# max queries of the billing paths, checked as set by QUERY_BUDGET_MODE: the
+# most measured in the benchmarks (SQLite, that runs the savepoints and the
+# transaction of the call billed as queries), with the rates not in memory, a
+# new bill and the end not found in the open calls
+QUERY_BUDGET_SAVE_CALL = 9
+QUERY_BUDGET_SAVE_BY_CALLS = 6
+QUERY_BUDGET_BILL_DATA = 2
@@ -15,3 +15,10 @@ class RatesNotFoundException(Exception):
 
 class InvalidCallIntervalException(Exception):
     pass
+
+
+class QueryBudgetExceededException(Exception):
+
+    def __init__(self, message, queries):
+        super().__init__(message)
+        self.queries = queries
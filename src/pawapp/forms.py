@@ -1,9 +1,8 @@
 """Django forms module."""
-import datetime
-
 from django import forms
 
 from . import models, const
+from .timestamps import parse_timestamp
 
 
 class CallEventForm(forms.ModelForm):
@@ -19,9 +18,7 @@ class CallEventForm(forms.ModelForm):
         call_timestamp = cleaned_data.get('call_timestamp')
         if call_timestamp:
             try:
-                datetime.datetime.strptime(
-                    call_timestamp, const.TIMESTAMP_FORMAT
-                )
+                parse_timestamp(call_timestamp)
             except ValueError:
                 self.add_error(
                     'call_timestamp', const.MESSAGE_FIELD_INVALID_FORMAT
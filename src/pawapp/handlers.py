@@ -1,12 +1,15 @@
 """Handler module for incoming data through the API"""
 import datetime
 
-from . import const
+from . import const, metrics
 from .exceptions import InvalidDataException
-from .helpers import map_dict_fields, add_list_value, last_period
-from .jobs import save_callevent
+from .helpers import (
+    map_dict_fields, add_list_value, last_period, decode_cursor
+)
+from .buffer import callevent_buffer, enqueue_batches
+from .jobs import save_callevent_batch
 from .models import Bill
-from .forms import CallEventForm
+from .validators import callevent_validator
 
 
 class BaseDataHandler:
@@ -50,6 +53,7 @@ class CallEventHandler(BaseDataHandler):
 
     def __init__(self, data):
         super().__init__(data)
+        self.cleaned_data = {}
 
     def handle(self):
         """Process CallEvent current data.
@@ -57,32 +61,105 @@ class CallEventHandler(BaseDataHandler):
         Raises:
             InvalidDataException: Raises if data is not valid.
         """
+        with metrics.CALL_EVENT_HANDLE_SECONDS.time('single'):
+            # parse the data
+            map_dict_fields(self.data, const.API_FIELDS, const.DB_FIELDS)
 
-        # parse the data
-        map_dict_fields(self.data, const.API_FIELDS, const.DB_FIELDS)
+            self.validate()
+            if self.errors:
+                metrics.CALL_EVENTS_REJECTED.inc('single')
+                raise InvalidDataException(self.errors)
 
-        self.validate()
-        if self.errors:
-            raise InvalidDataException(self.errors)
-
-        # save data
-        self.save()
+            # save data
+            self.save()
 
     def validate(self):
         """Validate fields for current data."""
 
-        form = CallEventForm(self.data)
-        if not form.is_valid():
-            self.errors = form.errors
-            map_dict_fields(self.errors, const.DB_FIELDS, const.API_FIELDS)
+        with metrics.CALL_EVENT_VALIDATE_SECONDS.time('single'):
+            self.cleaned_data, self.errors = callevent_validator.validate(
+                self.data
+            )
 
     def save(self):
         """Save current data for CallEvent.
 
-        This function calls an async job to save the current data.
+        The data is buffered with the events received by the process in the
+        same window, and they are saved together by another job.
         """
-        # send data to be saved by another job
-        save_callevent.delay(self.data)
+        callevent_buffer.add(self.cleaned_data)
+
+
+class CallEventBatchHandler(BaseDataHandler):
+    """Handler class for a batch of CallEvent data.
+
+    The data is a list of tuples with the line number and the CallEvent
+    data of the line (None if the line could not be parsed). The errors are
+    reported by line number.
+    """
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.events = []
+
+    def handle(self):
+        """Process the batch of CallEvent data.
+
+        Returns:
+            dict: Report with the number of events accepted and rejected and
+                the errors by line number.
+
+        Raises:
+            InvalidDataException: Raises if no event of the batch is valid.
+        """
+        with metrics.CALL_EVENT_HANDLE_SECONDS.time('batch'):
+            self.validate()
+            rejected = len(self.data) - len(self.events)
+            if rejected:
+                metrics.CALL_EVENTS_REJECTED.inc('batch', amount=rejected)
+            if not self.events:
+                raise InvalidDataException(self.errors)
+
+            # save data
+            self.save()
+
+        return {
+            'accepted': len(self.events),
+            'rejected': rejected,
+            'errors': self.errors,
+        }
+
+    def validate(self):
+        """Validate fields for each event of the current data."""
+
+        if not self.data:
+            self.add_error('events', const.MESSAGE_FIELD_REQUIRED)
+            return
+        if len(self.data) > const.CALL_EVENT_BATCH_MAX_SIZE:
+            self.add_error(
+                'events',
+                const.MESSAGE_EVENTS_TOO_MANY.format(
+                    const.CALL_EVENT_BATCH_MAX_SIZE
+                )
+            )
+            return
+
+        with metrics.CALL_EVENT_VALIDATE_SECONDS.time('batch'):
+            self.events, self.errors = callevent_validator.validate_batch(
+                self.data
+            )
+
+    def save(self):
+        """Save the valid events of the current data.
+
+        The events are sent in chunks to be saved by other jobs, enqueued
+        at once.
+        """
+        chunk_size = const.CALL_EVENT_BATCH_CHUNK_SIZE
+        enqueue_batches(save_callevent_batch, [
+            self.events[index:index + chunk_size]
+            for index in range(0, len(self.events), chunk_size)
+        ])
 
 
 class BillHandler(BaseDataHandler):
@@ -90,10 +167,18 @@ class BillHandler(BaseDataHandler):
 
     def __init__(self, data):
         super().__init__(data)
+        # pagination values if a page of the bill was requested
+        self.page = None
 
     def handle(self):
         """Process Bill current data.
 
+        Returns:
+            dict: Bill data, only the totals if the data has ``summary``
+                set, a page of the calls if the data has ``limit``,
+                ``after`` or ``fields`` set, or a generator of its JSON
+                chunks if the data has ``stream`` set.
+
         Raises:
             InvalidDataException: Raises if data is not valid.
         """
@@ -109,6 +194,17 @@ class BillHandler(BaseDataHandler):
         if not month and not year:
             year, month = last_period()
 
+        if self.data.get('summary'):
+            return Bill.summary_by_number_period(phone_number, month, year)
+
+        if self.page is not None:
+            return Bill.page_by_number_period(
+                phone_number, month, year, **self.page
+            )
+
+        if self.data.get('stream'):
+            return Bill.stream_by_number_period(phone_number, month, year)
+
         bill_data = Bill.data_by_number_period(phone_number, month, year)
         return bill_data
 
@@ -145,12 +241,57 @@ class BillHandler(BaseDataHandler):
             except ValueError:
                 self.add_error('period', const.MESSAGE_FIELD_INVALID_VALUE)
 
+        self.validate_page()
+
+    def validate_page(self):
+        """Validate the pagination fields for current data."""
+
+        limit = self.data.get('limit')
+        after = self.data.get('after')
+        fields = self.data.get('fields')
+        if limit is None and after is None and fields is None:
+            return
+
+        self.page = {'limit': const.BILL_PAGE_SIZE}
+
+        if limit is not None:
+            try:
+                self.page['limit'] = int(limit)
+                if not 0 < self.page['limit'] <= const.BILL_PAGE_MAX_SIZE:
+                    self.add_error('limit', const.MESSAGE_FIELD_INVALID_VALUE)
+            except ValueError:
+                self.add_error('limit', const.MESSAGE_FIELD_INVALID_VALUE)
+
+        if after is not None:
+            try:
+                self.page['after'] = decode_cursor(after)
+                # from timestamp and id of the last call of the page
+                from_timestamp, item_id = self.page['after']
+                if not isinstance(from_timestamp, str) or \
+                        type(item_id) is not int:
+                    self.add_error('after', const.MESSAGE_FIELD_INVALID_VALUE)
+            except ValueError:
+                self.add_error('after', const.MESSAGE_FIELD_INVALID_VALUE)
+
+        if fields is not None:
+            self.page['fields'] = [
+                field.strip() for field in fields.split(',') if field.strip()
+            ]
+            if not self.page['fields'] or not set(self.page['fields']) <= set(
+                    const.BILL_CALL_FIELDS):
+                self.add_error('fields', const.MESSAGE_FIELD_INVALID_VALUE)
+
 
 def callevent_handler(data):
     """Convenient function to return CallEvent handler instance."""
     return CallEventHandler(data)
 
 
+def callevent_batch_handler(data):
+    """Convenient function to return CallEvent batch handler instance."""
+    return CallEventBatchHandler(data)
+
+
 def bill_handler(data):
     """Convenient function to return Bill handler instance."""
     return BillHandler(data)
@@ -1,5 +1,9 @@
 """Helper functions module"""
+import base64
+import binascii
 import datetime
+import json
+from decimal import Decimal
 
 
 def map_dict_fields(source, from_fields, to_fields):
@@ -47,3 +51,135 @@ def last_period():
     month_first_day = datetime.datetime.today().replace(day=1)
     last_month_day = month_first_day - datetime.timedelta(days=1)
     return last_month_day.year, last_month_day.month
+
+
+def add_months(year, month, months):
+    """Get the year and month some months after a period.
+
+    Args:
+        year (int): Year of the period.
+        month (int): Month of the period.
+        months (int): Number of months added, can be negative.
+
+    Returns:
+        tuple: Year and month of the period.
+    """
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year, month + 1
+
+
+def period_range(year, month):
+    """Get the datetimes where a period starts and the next one starts.
+
+    Args:
+        year (int): Year of the period.
+        month (int): Month of the period.
+
+    Returns:
+        tuple: Aware datetimes in UTC.
+    """
+    next_year, next_month = add_months(int(year), int(month), 1)
+    return (
+        datetime.datetime(
+            int(year), int(month), 1, tzinfo=datetime.timezone.utc
+        ),
+        datetime.datetime(
+            next_year, next_month, 1, tzinfo=datetime.timezone.utc
+        ),
+    )
+
+
+def naive_utc(value):
+    """Convert an aware datetime to a naive datetime in UTC.
+
+    Args:
+        value (datetime): Aware datetime value.
+
+    Returns:
+        datetime: Naive datetime value.
+
+    """
+    return value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def money_cents(value):
+    """Convert a money value to integer cents.
+
+    Args:
+        value (Decimal): Money value.
+
+    Returns:
+        int: Value in cents.
+
+    """
+    return int((Decimal(value) * 100).to_integral_value())
+
+
+def parse_json_lines(body):
+    """Parse a JSON array or a newline-delimited JSON text.
+
+    Args:
+        body (str): Text to be parsed.
+
+    Returns:
+        list: Tuples with the line number (or the position in the array)
+            and the parsed value. The value is None if the line is not a
+            valid JSON.
+
+    Raises:
+        ValueError: Raises if the text is a JSON array with invalid format.
+
+    """
+    body = body.strip()
+    if body.startswith('['):
+        values = json.loads(body)
+        return list(enumerate(values, 1))
+
+    lines = []
+    for line_number, line in enumerate(body.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            value = None
+        lines.append((line_number, value))
+    return lines
+
+
+def encode_cursor(*values):
+    """Encode values in an opaque cursor for pagination.
+
+    Args:
+        *values: Values of the last item of a page.
+
+    Returns:
+        str: Cursor value.
+
+    """
+    text = json.dumps(values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Decode the values of a cursor for pagination.
+
+    Args:
+        cursor (str): Cursor value.
+
+    Returns:
+        list: Values of the last item of a page.
+
+    Raises:
+        ValueError: Raises if the cursor is not valid.
+
+    """
+    try:
+        text = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        values = json.loads(text.decode('utf-8'))
+    except (binascii.Error, UnicodeError, AttributeError):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor.')
+    return values
@@ -0,0 +1,265 @@
+"""Asynchronous ingestion of the call events.
+
+ASGI application receiving the call events without a thread or a worker by
+request. The events are validated in the process and buffered for a few
+milliseconds (see ``pawapp.buffer``), then the job saving the events buffered
+is written and pushed to the RQ queue with an asynchronous Redis client, in a
+single pipelined round trip. Each request is answered once the job of its
+event is enqueued. The other requests are sent to the application wrapped (the
+Django application).
+"""
+import asyncio
+import json
+import logging
+
+import django_rq
+import redis
+from django.conf import settings
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from rq.utils import utcnow
+
+from . import const, metrics
+from .helpers import map_dict_fields
+from .jobs import save_callevent_batch
+from .validators import callevent_validator
+
+
+logger = logging.getLogger(__name__)
+
+
+JSON_HEADERS = [(b'content-type', b'application/json')]
+
+# asynchronous connections of the synchronous ones, TCP by default
+CONNECTION_CLASSES = (
+    (redis.SSLConnection, aioredis.SSLConnection),
+    (redis.UnixDomainSocketConnection, aioredis.UnixDomainSocketConnection),
+)
+
+
+def async_client(client):
+    """Asynchronous Redis client with the connection settings of a client.
+
+    The settings are read from the connection pool, so any configuration of
+    the queue by django-rq (``URL``, ``HOST`` and ``PORT`` or
+    ``USE_REDIS_CACHE``) is supported.
+
+    Args:
+        client (Redis): Synchronous Redis client.
+
+    Returns:
+        redis.asyncio.Redis: Asynchronous Redis client.
+
+    """
+    pool = client.connection_pool
+    kwargs = dict(pool.connection_kwargs)
+    # the parser of the synchronous connections can't read the asynchronous
+    kwargs.pop('parser_class', None)
+
+    connection_class = aioredis.Connection
+    for sync_class, async_class in CONNECTION_CLASSES:
+        if isinstance(pool.connection_class, type) and \
+                issubclass(pool.connection_class, sync_class):
+            connection_class = async_class
+    return aioredis.Redis(connection_pool=aioredis.ConnectionPool(
+        connection_class=connection_class, **kwargs
+    ))
+
+
+class CallEventIngestion:
+    """ASGI application receiving the call events.
+
+    Args:
+        application: ASGI application handling the other requests.
+        path (str): Path receiving the call events.
+        queue_name (str, optional): Name of the RQ queue of the jobs.
+
+    """
+
+    def __init__(self, application, path, queue_name='default'):
+        self.application = application
+        self.path = path
+        self.queue = django_rq.get_queue(queue_name)
+        self.redis = None
+        # events waiting to be enqueued, with the futures of their requests
+        self.pending = []
+        self.flush_handle = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and scope['method'] == 'POST' and \
+                scope['path'] == self.path:
+            await self.ingest(receive, send)
+        else:
+            await self.application(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Handle the startup and shutdown of the server."""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.redis is not None:
+                    await self.redis.close()
+                    self.redis = None
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def ingest(self, receive, send):
+        """Validate and enqueue the call event of the request body."""
+        body = await read_body(receive)
+        if body is None:
+            metrics.CALL_EVENTS_REJECTED.inc('async')
+            await send_json(send, 400, {
+                'error': const.MESSAGE_BODY_TOO_LARGE
+            })
+            return
+
+        try:
+            data = json.loads(body.decode('utf-8')) if body.strip() else {}
+        except ValueError:
+            metrics.CALL_EVENTS_REJECTED.inc('async')
+            await send_json(send, 400, {
+                'error': const.MESSAGE_BODY_INVALID_JSON
+            })
+            return
+        if not isinstance(data, dict):
+            metrics.CALL_EVENTS_REJECTED.inc('async')
+            await send_json(send, 400, {
+                'error': {'event': [const.MESSAGE_EVENT_INVALID_FORMAT]}
+            })
+            return
+
+        map_dict_fields(data, const.API_FIELDS, const.DB_FIELDS)
+        with metrics.CALL_EVENT_VALIDATE_SECONDS.time('async'):
+            data, errors = callevent_validator.validate(data)
+        if errors:
+            metrics.CALL_EVENTS_REJECTED.inc('async')
+            await send_json(send, 400, {'error': errors})
+            return
+
+        try:
+            await self.enqueue_event(data)
+        except RedisError:
+            logger.exception('Could not enqueue the call event.')
+            await send_json(send, 500, {
+                'error': const.MESSAGE_EVENT_NOT_ENQUEUED
+            })
+            return
+
+        await send_json(send, 201, None)
+
+    async def enqueue_event(self, event):
+        """Buffer an event and wait until the job saving it is enqueued.
+
+        The events are enqueued in a single ``save_callevent_batch`` job
+        after ``CALL_EVENT_BUFFER_INTERVAL`` seconds, or as soon as
+        ``CALL_EVENT_BUFFER_MAX_SIZE`` events are buffered.
+
+        Args:
+            event (dict): Call event validated.
+
+        Raises:
+            RedisError: If the job could not be enqueued.
+
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((event, future))
+        if len(self.pending) >= const.CALL_EVENT_BUFFER_MAX_SIZE:
+            self.flush_pending()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(
+                const.CALL_EVENT_BUFFER_INTERVAL, self.flush_pending
+            )
+        await future
+
+    def flush_pending(self):
+        """Enqueue the events buffered in a task."""
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending = self.pending, []
+        if pending:
+            asyncio.ensure_future(self.enqueue_pending(pending))
+
+    async def enqueue_pending(self, pending):
+        """Enqueue the events and resolve the futures of their requests."""
+        try:
+            await self.enqueue(
+                save_callevent_batch, [event for event, _ in pending]
+            )
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for _, future in pending:
+                if not future.done():
+                    future.set_result(None)
+
+    async def enqueue(self, func, *args):
+        """Enqueue a job as ``func.delay(*args)`` without blocking.
+
+        The job is created by RQ, so it has the format read by its workers,
+        and saved with the same commands of ``Queue.enqueue_job``.
+
+        Args:
+            func (callable): Function of the job.
+            *args: Arguments of the function.
+
+        Returns:
+            Job: Job enqueued.
+
+        """
+        if self.redis is None:
+            self.redis = async_client(self.queue.connection)
+
+        job = self.queue.create_job(func, args=args)
+        job.origin = self.queue.name
+        job.enqueued_at = utcnow()
+
+        with metrics.CALL_EVENT_ENQUEUE_SECONDS.time(func.__name__):
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.sadd(self.queue.redis_queues_keys, self.queue.key)
+                pipe.hset(job.key, mapping=job.to_dict())
+                pipe.rpush(self.queue.key, job.id)
+                await pipe.execute()
+
+        return job
+
+
+async def read_body(receive):
+    """Read the request body.
+
+    Returns:
+        bytes: Request body, None if it is larger than the size accepted.
+
+    """
+    max_size = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+    chunks, size = [], 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if max_size is not None and size > max_size:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+async def send_json(send, status, data):
+    """Send a JSON response, without a body if data is None."""
+    body = b'' if data is None else json.dumps(data).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': JSON_HEADERS + [
+            (b'content-length', str(len(body)).encode('ascii'))
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
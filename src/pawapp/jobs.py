@@ -1,17 +1,53 @@
-"""RQ job module"""
+"""RQ job module
+
+The jobs flush the metrics measured at the end, since the process forked by
+the worker for each job exits without flushing them (see ``metrics``).
+"""
+import logging
+
 from django.db import IntegrityError
 from django_rq import job
 
-from . import const
+from . import const, metrics
+from .profiling import profile_job
 from .models import CallEvent
 
 
+logger = logging.getLogger(__name__)
+
+
 @job
+@profile_job
 def save_callevent(data):
-    """Save the data using CallEvent model."""
+    """Save the data using CallEvent model.
+
+    The events that can't be saved by a conflict in the database are
+    dropped, logged and counted in the metrics.
+    """
+    try:
+        with metrics.SAVE_CALL_EVENT_SECONDS.time('save_callevent'):
+            save_bill = data.get('call_type') == const.CALL_TYPE_END
+            CallEvent.save_call(save_bill, **data)
+    except IntegrityError:
+        logger.warning(
+            'Call event %s of call %s dropped.',
+            data.get('call_type'), data.get('call_id'), exc_info=True
+        )
+        metrics.CALL_EVENTS_DROPPED.inc('integrity_error')
+    finally:
+        metrics.flush()
+
+
+@job
+@profile_job
+def save_callevent_batch(events):
+    """Save a list of data using CallEvent model.
+
+    Returns:
+        list: Call ids of the end events that could not be billed.
+    """
     try:
-        save_bill = data.get('call_type') == const.CALL_TYPE_END
-        CallEvent.save_call(save_bill, **data)
-    except IntegrityError as ie:
-        # todo: log, email, callback ?
-        pass
+        with metrics.SAVE_CALL_EVENT_SECONDS.time('save_callevent_batch'):
+            return CallEvent.save_calls(events)
+    finally:
+        metrics.flush()
@@ -0,0 +1,30 @@
+"""Command to fill the datetime and cents columns of the saved rows."""
+from django.core.management.base import BaseCommand
+
+from pawapp import const
+from pawapp.backfill import (
+    backfill_bill_items, backfill_bills, backfill_call_events
+)
+
+
+class Command(BaseCommand):
+    help = 'Fill the datetime and cents columns of the rows already saved.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=const.BACKFILL_CHUNK_SIZE,
+            help='Number of rows filled at once.'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        result = {
+            'events': backfill_call_events(chunk_size),
+            'items': backfill_bill_items(chunk_size),
+            'bills': backfill_bills(chunk_size),
+        }
+
+        self.stdout.write(
+            'Filled {events} call events, {items} bill items '
+            'and {bills} bills.'.format(**result)
+        )
@@ -0,0 +1,22 @@
+"""Command to create the next monthly partitions of the tables."""
+from django.core.management.base import BaseCommand
+
+from pawapp import const
+from pawapp.partitions import create_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the partitions of the current and the next months.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months', type=int, default=const.PARTITION_MONTHS_AHEAD,
+            help='Number of months after the current one.'
+        )
+
+    def handle(self, *args, **options):
+        created = create_partitions(options['months'])
+
+        self.stdout.write('Created {} partitions.'.format(len(created)))
+        for name in created:
+            self.stdout.write(name)
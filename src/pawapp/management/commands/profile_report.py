@@ -0,0 +1,67 @@
+"""Command to aggregate the profiles of the requests and jobs sampled."""
+import io
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from pawapp.profiling import (
+    aggregate_allocations, aggregate_stats, load_dumps
+)
+
+
+class Command(BaseCommand):
+    help = 'Show the functions with the most time and the lines with the ' \
+        'most memory allocated in the profiles sampled.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir', default=settings.PROFILING_DIR,
+            help='Directory of the profiles.'
+        )
+        parser.add_argument(
+            '--kind', choices=['request', 'job'],
+            help='Only the profiles of requests or jobs.'
+        )
+        parser.add_argument(
+            '--name',
+            help='Only the profiles of this view or job, like BillResource.'
+        )
+        parser.add_argument(
+            '--sort', default='cumulative',
+            help='Order of the functions, a pstats sort key like '
+                 'cumulative or tottime.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=30,
+            help='Number of functions, lines and profiles shown.'
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        dumps = load_dumps(options['dir'], options['kind'], options['name'])
+
+        self.stdout.write('{} profiles in {}.'.format(
+            len(dumps), options['dir']
+        ))
+        if not dumps:
+            return
+
+        self.stdout.write('\nSlowest profiles:')
+        for profile_path, data in dumps[:limit]:
+            self.stdout.write('{:>10.1f} ms {:>10.1f} KiB  {}  {}'.format(
+                data['elapsed'] * 1000, data['peak_kib'], profile_path,
+                json.dumps(data['params'], sort_keys=True)
+            ))
+
+        self.stdout.write('\nFunctions:')
+        stream = io.StringIO()
+        stats = aggregate_stats(dumps, stream=stream)
+        stats.sort_stats(options['sort']).print_stats(limit)
+        self.stdout.write(stream.getvalue())
+
+        self.stdout.write('Lines with the most memory allocated:')
+        for line, size, count in aggregate_allocations(dumps)[:limit]:
+            self.stdout.write('{:>10.1f} KiB {:>8d}  {}'.format(
+                size, count, line
+            ))
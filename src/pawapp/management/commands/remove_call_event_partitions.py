@@ -0,0 +1,43 @@
+"""Command to remove the old partitions of the call events."""
+from django.core.management.base import BaseCommand
+
+from pawapp import const
+from pawapp.partitions import remove_call_event_partitions
+
+
+class Command(BaseCommand):
+    help = 'Remove the partitions of the call events kept longer than ' \
+        'the retention, once their calls are billed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention-months', type=int,
+            default=const.CALL_EVENT_RETENTION_MONTHS,
+            help='Months the partitions are kept after they end.'
+        )
+        parser.add_argument(
+            '--archive', action='store_true',
+            help='Detach the partitions as tables instead of dropping them.'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Remove the partitions even if some calls are not billed.'
+        )
+
+    def handle(self, *args, **options):
+        result = remove_call_event_partitions(
+            options['retention_months'],
+            archive=options['archive'],
+            force=options['force']
+        )
+
+        self.stdout.write('{} {} partitions.'.format(
+            'Detached' if options['archive'] else 'Dropped',
+            len(result['removed'])
+        ))
+        for name in result['removed']:
+            self.stdout.write(name)
+        for name, calls in sorted(result['not_billed'].items()):
+            self.stdout.write(
+                'Kept {}, {} calls are not billed.'.format(name, calls)
+            )
@@ -0,0 +1,31 @@
+"""Command to rate again the bills of a period."""
+from django.core.management.base import BaseCommand, CommandError
+
+from pawapp.exceptions import RatesNotFoundException
+from pawapp.rerating import rerate_period
+
+
+class Command(BaseCommand):
+    help = 'Rate again the bill items of a period with the current rates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('year', type=int)
+        parser.add_argument('month', type=int, choices=range(1, 13))
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Number of processes rating the bills in parallel.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            result = rerate_period(
+                options['year'], options['month'],
+                processes=options['processes']
+            )
+        except RatesNotFoundException:
+            raise CommandError('There are no connection rates.')
+
+        self.stdout.write(
+            'Rated {rated} items, updated {updated} items '
+            'and {bills} bills.'.format(**result)
+        )
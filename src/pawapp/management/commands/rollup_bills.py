@@ -0,0 +1,42 @@
+"""Command to keep the totals of the bills updated with their items."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from pawapp import const
+from pawapp.rollup import rollup_items
+
+
+class Command(BaseCommand):
+    help = 'Add the bill items saved to the totals of their bills.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=const.ROLLUP_BATCH_SIZE,
+            help='Number of items added at once.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=const.ROLLUP_INTERVAL,
+            help='Seconds waited when there are no more items to add.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Add the items saved and exit, instead of running '
+                 'continuously.'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        while True:
+            result = rollup_items(batch_size)
+            if result['items']:
+                self.stdout.write(
+                    'Rolled up {items} items into {bills} bills.'.format(
+                        **result
+                    )
+                )
+            if result['items'] < batch_size:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
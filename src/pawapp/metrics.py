@@ -0,0 +1,391 @@
+"""Metrics of the hot paths, exposed in the Prometheus text format.
+
+The counters and histograms are kept in the memory of each process, so
+measuring costs only a lock and a few additions. A background thread of the
+process adds the values measured since the last flush to a Redis hash every
+``METRICS_FLUSH_INTERVAL`` seconds, and the values of all the processes (web
+servers and RQ workers) are read from there by the ``/metrics`` endpoint.
+
+The jobs run in a process forked by the RQ worker for each job, that exits
+without running the background thread, so they flush the values at the end
+(see ``jobs``).
+
+Set ``METRICS_ENABLED = False`` in the settings to measure nothing.
+"""
+import atexit
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from . import const
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(names, values):
+    """Labels of a sample in the exposition format."""
+    if not names:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+                '\n', r'\n'
+            )
+        )
+        for name, value in zip(names, values)
+    ) + '}'
+
+
+def format_value(value):
+    """Value of a sample in the exposition format."""
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """Metrics of the process and their values not flushed yet.
+
+    Args:
+        key (str): Key of the Redis hash with the values of all processes.
+        interval (float): Seconds between the flushes of the process.
+
+    """
+
+    def __init__(self, key=const.CACHE_KEY_METRICS,
+                 interval=const.METRICS_FLUSH_INTERVAL):
+        self.key = key
+        self.interval = interval
+        self.metrics = []
+        # values by sample field (name and labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.pid = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'METRICS_ENABLED', True)
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add(self, values):
+        """Add values to the samples, starting the flush thread if needed.
+
+        Args:
+            values (list): Tuples of the sample field and value added.
+
+        """
+        with self.lock:
+            # the thread and values are not copied to the processes forked
+            if self.pid != os.getpid():
+                self._start()
+            for field, value in values:
+                self.values[field] = self.values.get(field, 0) + value
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.values = {}
+        thread = threading.Thread(
+            target=self._run, name='metrics-flush', daemon=True
+        )
+        thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Add the values measured by the process to the Redis hash.
+
+        Returns:
+            bool: False if the values could not be flushed, they are kept to
+                be flushed again.
+
+        """
+        with self.lock:
+            values, self.values = self.values, {}
+        if not values:
+            return True
+
+        try:
+            with get_redis_connection('default').pipeline() as pipe:
+                for field, value in values.items():
+                    if value == int(value):
+                        pipe.hincrby(self.key, field, int(value))
+                    else:
+                        pipe.hincrbyfloat(self.key, field, value)
+                pipe.execute()
+        except Exception:
+            logger.exception('Could not flush %d metric values.', len(values))
+            self.add(values.items())
+            return False
+        return True
+
+    def collect(self):
+        """Values of all the processes in the exposition format.
+
+        Returns:
+            str: Text with the samples of each metric.
+
+        """
+        self.flush()
+        raw_values = get_redis_connection('default').hgetall(self.key)
+        values = {
+            field.decode('utf-8'): float(value)
+            for field, value in raw_values.items()
+        }
+        lines = []
+        for metric in self.metrics:
+            lines.append(
+                '# HELP {} {}'.format(metric.name, metric.description)
+            )
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            lines.extend(
+                '{} {}'.format(field, format_value(value))
+                for field, value in metric.samples(values)
+            )
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Metric:
+    """Base metric.
+
+    Args:
+        name (str): Metric name.
+        description (str): Description of the metric.
+        labels (tuple, optional): Label names.
+
+    """
+    type = None
+
+    def __init__(self, name, description, labels=(), registry=registry):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.registry = registry
+        registry.register(self)
+        # sample fields by label values, formatted once
+        self.fields = {}
+
+    def field(self, suffix, label_values, extra=()):
+        """Sample field of the label values, the name with the labels."""
+        names = self.labels + tuple(name for name, _ in extra)
+        values = tuple(label_values) + tuple(value for _, value in extra)
+        return self.name + suffix + format_labels(names, values)
+
+    def samples(self, values):
+        """Samples of the metric in the values of all the processes.
+
+        Args:
+            values (dict): Values by sample field.
+
+        Returns:
+            list: Tuples of the sample field and value, sorted.
+
+        """
+        return sorted(
+            (field, value) for field, value in values.items()
+            if field.split('{', 1)[0] == self.name
+        )
+
+
+class Counter(Metric):
+    """Counter of events."""
+    type = 'counter'
+
+    def __init__(self, name, description, labels=(), registry=registry):
+        super().__init__(name + '_total', description, labels, registry)
+
+    def inc(self, *label_values, amount=1):
+        """Increment the counter of the label values."""
+        if not self.registry.enabled:
+            return
+        field = self.fields.get(label_values)
+        if field is None:
+            field = self.fields[label_values] = self.field('', label_values)
+        self.registry.add([(field, amount)])
+
+
+class Histogram(Metric):
+    """Histogram of durations, in seconds.
+
+    Args:
+        buckets (tuple, optional): Upper bounds of the buckets.
+
+    """
+    type = 'histogram'
+
+    def __init__(self, name, description, labels=(), registry=registry,
+                 buckets=const.METRICS_BUCKETS):
+        super().__init__(name, description, labels, registry)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.bounds = [
+            format_value(bound) if bound != float('inf') else '+Inf'
+            for bound in self.buckets
+        ]
+
+    def observe(self, value, *label_values):
+        """Observe a value of the label values."""
+        if not self.registry.enabled:
+            return
+        fields = self.fields.get(label_values)
+        if fields is None:
+            fields = self.fields[label_values] = (
+                [
+                    self.field('_bucket', label_values, (('le', bound),))
+                    for bound in self.bounds
+                ],
+                self.field('_sum', label_values),
+                self.field('_count', label_values),
+            )
+        buckets, sum_field, count_field = fields
+        # only the first bucket of the value is counted here, the buckets
+        # are cumulative in the exposition
+        bucket = bisect.bisect_left(self.buckets, value)
+        self.registry.add([
+            (buckets[bucket], 1), (sum_field, value), (count_field, 1)
+        ])
+
+    def time(self, *label_values):
+        """Measure the time of a block or function.
+
+        Can be used as a context manager or a decorator.
+        """
+        return Timer(self, label_values)
+
+    def samples(self, values):
+        series = {}
+        for field, value in values.items():
+            name, _, labels = field.partition('{')
+            suffix = name[len(self.name):]
+            if not name.startswith(self.name) or \
+                    suffix not in ('_bucket', '_sum', '_count'):
+                continue
+            # labels of the series, without the bucket bound
+            labels = labels.rstrip('}')
+            bound = None
+            if suffix == '_bucket':
+                labels, _, bound = labels.rpartition('le="')
+                labels = labels.rstrip(',')
+                bound = bound.rstrip('"')
+            serie = series.setdefault(labels, {'buckets': {}})
+            if bound is None:
+                serie[suffix] = value
+            else:
+                serie['buckets'][bound] = value
+
+        samples = []
+        for labels in sorted(series):
+            serie = series[labels]
+            prefix = labels + ',' if labels else ''
+            total = 0
+            for bound in self.bounds:
+                total += serie['buckets'].get(bound, 0)
+                samples.append((
+                    '{}_bucket{{{}le="{}"}}'.format(self.name, prefix, bound),
+                    total
+                ))
+            labels = '{' + labels + '}' if labels else ''
+            for suffix in ('_sum', '_count'):
+                samples.append((
+                    self.name + suffix + labels, serie.get(suffix, 0)
+                ))
+        return samples
+
+
+class Timer:
+    """Time of a block or function observed by a histogram."""
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(
+            time.perf_counter() - self.started, *self.label_values
+        )
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with Timer(self.histogram, self.label_values):
+                return func(*args, **kwargs)
+        return timed
+
+
+def flush():
+    """Flush the values of the process."""
+    return registry.flush()
+
+
+def collect():
+    """Values of all the processes in the exposition format."""
+    return registry.collect()
+
+
+CALL_EVENT_HANDLE_SECONDS = Histogram(
+    'paw_call_event_handle_seconds',
+    'Time to validate and buffer or enqueue the call events of a request.',
+    ['handler']
+)
+CALL_EVENT_VALIDATE_SECONDS = Histogram(
+    'paw_call_event_validate_seconds',
+    'Time to validate the call events of a request.',
+    ['handler']
+)
+CALL_EVENT_ENQUEUE_SECONDS = Histogram(
+    'paw_call_event_enqueue_seconds',
+    'Time to push the jobs of the call events to the queue in Redis.',
+    ['job']
+)
+CALL_EVENTS_REJECTED = Counter(
+    'paw_call_events_rejected',
+    'Call events rejected because they are invalid.',
+    ['handler']
+)
+CALL_EVENTS_DROPPED = Counter(
+    'paw_call_events_dropped',
+    'Call events accepted but not saved or not billed.',
+    ['reason']
+)
+SAVE_CALL_EVENT_SECONDS = Histogram(
+    'paw_save_callevent_seconds',
+    'Time of the jobs saving and billing the call events.',
+    ['job']
+)
+CALCULATE_CALL_SECONDS = Histogram(
+    'paw_calculate_call_seconds',
+    'Time to read the events of a call from the database and rate it.'
+)
+RATES_CACHE = Counter(
+    'paw_rates_cache',
+    'Lookups of the rates in the memory of the process and in Redis.',
+    ['cache', 'result']
+)
+BILL_READ_SECONDS = Histogram(
+    'paw_bill_read_seconds',
+    'Time to read the calls of a bill, from the cache or the database.',
+    ['source']
+)
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='billitem',
+            index=models.Index(fields=['bill', 'from_timestamp', 'id'], name='billitem_bill_start_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0002_billitem_bill_start_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='total_amount_cents',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='amount_cents',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='from_datetime',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='billitem',
+            name='to_datetime',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='callevent',
+            name='call_datetime',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0003_datetime_cents_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billitem',
+            name='call_id',
+            field=models.CharField(blank=True, max_length=32, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,270 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:24
+
+import datetime
+import re
+
+from django.db import migrations, models
+
+# table, partition key and timestamp the key is filled from of the
+# partitioned tables
+TABLES = (
+    ('pawapp_callevent', 'call_datetime', 'call_timestamp'),
+    ('pawapp_billitem', 'to_datetime', 'to_timestamp'),
+)
+
+# max length of the names in PostgreSQL
+MAX_NAME_LENGTH = 63
+
+LEGACY_SUFFIX = '_legacy'
+
+
+def month_start(value):
+    """First day of the month of a datetime, in UTC."""
+    return datetime.datetime(
+        value.year, value.month, 1, tzinfo=datetime.timezone.utc
+    )
+
+
+def next_month(value):
+    """First day of the month after a datetime, in UTC."""
+    year, month = divmod(value.year * 12 + value.month, 12)
+    return datetime.datetime(
+        year, month + 1, 1, tzinfo=datetime.timezone.utc
+    )
+
+
+def legacy_name(name):
+    """Name of an index or constraint kept by the legacy partition."""
+    return name[:MAX_NAME_LENGTH - len(LEGACY_SUFFIX)] + LEGACY_SUFFIX
+
+
+def table_indexes(cursor, table):
+    """Indexes and unique and foreign key constraints of a table.
+
+    Returns:
+        tuple: Tuples with the name and definition of the constraints and
+            tuples with the name, unique flag and ``USING`` clause of the
+            indexes without constraints. The primary key is not included.
+
+    """
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('u', 'f') "
+        "ORDER BY conname",
+        [table]
+    )
+    constraints = cursor.fetchall()
+    cursor.execute(
+        'SELECT c.relname, x.indisunique, pg_get_indexdef(x.indexrelid) '
+        'FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid '
+        'WHERE x.indrelid = %s::regclass AND NOT EXISTS ('
+        'SELECT 1 FROM pg_constraint WHERE conindid = x.indexrelid'
+        ') ORDER BY c.relname',
+        [table]
+    )
+    indexes = [
+        (name, unique, re.search(r' USING .+$', definition).group(0))
+        for name, unique, definition in cursor.fetchall()
+    ]
+    return constraints, indexes
+
+
+def partition_table(schema_editor, table, column, timestamp_column):
+    """Replace a table by a table partitioned by range of a column.
+
+    The table is renamed and attached as the partition of the rows before
+    the current month. The rows of the current month are moved to its own
+    partition, and the rows of the next months to a default partition, until
+    their partitions are created (see ``pawapp.partitions``).
+
+    The indexes and the unique and foreign key constraints of the table are
+    created in the partitioned table with the same names, known by the
+    migrations, and the ones of the table renamed are renamed too. The
+    primary key of the partitioned table is the id with the partition key,
+    as PostgreSQL requires, so the rows without the key are filled from
+    their timestamp and the key is not null.
+    """
+    quote_name = schema_editor.quote_name
+    legacy = table + LEGACY_SUFFIX
+    execute = schema_editor.execute
+    names = {
+        'table': quote_name(table),
+        'legacy': quote_name(legacy),
+        'column': quote_name(column),
+        'timestamp': quote_name(timestamp_column),
+        'current': None,
+        'default': quote_name('{}_default'.format(table)),
+    }
+
+    execute('ALTER TABLE {table} RENAME TO {legacy}'.format(**names))
+    # the partition key is in the primary key, so it can't be empty
+    execute('UPDATE {legacy} SET {column} = {timestamp}::timestamptz '
+            'WHERE {column} IS NULL'.format(**names))
+    execute('ALTER TABLE {legacy} ALTER COLUMN {column} SET NOT NULL'.format(
+        **names
+    ))
+
+    with schema_editor.connection.cursor() as cursor:
+        constraints, indexes = table_indexes(cursor, legacy)
+        sequence = serial_sequence(cursor, legacy)
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [legacy]
+        )
+        primary_key = cursor.fetchone()
+
+    # the primary key of the partitioned table is named as the table one
+    renamed = [name for name, _ in constraints]
+    if primary_key:
+        renamed.append(primary_key[0])
+    for name in renamed:
+        execute('ALTER TABLE {} RENAME CONSTRAINT {} TO {}'.format(
+            names['legacy'], quote_name(name), quote_name(legacy_name(name))
+        ))
+    for name, _, _ in indexes:
+        execute('ALTER INDEX {} RENAME TO {}'.format(
+            quote_name(name), quote_name(legacy_name(name))
+        ))
+
+    execute(
+        'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS '
+        'INCLUDING CONSTRAINTS) PARTITION BY RANGE ({column})'.format(**names)
+    )
+    # the id sequence is dropped with the table owning it
+    if sequence:
+        execute('ALTER SEQUENCE {} OWNED BY {}.{}'.format(
+            sequence, names['table'], quote_name('id')
+        ))
+
+    for name, definition in constraints:
+        execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(
+            names['table'], quote_name(name), definition
+        ))
+    for name, unique, using in indexes:
+        execute('CREATE {}INDEX {} ON {}{}'.format(
+            'UNIQUE ' if unique else '', quote_name(name), names['table'],
+            using
+        ))
+    execute('ALTER TABLE {table} ADD PRIMARY KEY ({id}, {column})'.format(
+        id=quote_name('id'), **names
+    ))
+
+    # partitions of the current month and of the rows out of the others
+    now = datetime.datetime.now(datetime.timezone.utc)
+    start = month_start(now)
+    names['current'] = quote_name('{}_y{:04d}m{:02d}'.format(
+        table, start.year, start.month
+    ))
+    execute(
+        'CREATE TABLE {current} PARTITION OF {table} '
+        'FOR VALUES FROM (%s) TO (%s)'.format(**names),
+        [start, next_month(now)]
+    )
+    execute('CREATE TABLE {default} PARTITION OF {table} DEFAULT'.format(
+        **names
+    ))
+
+    execute(
+        'WITH moved AS (DELETE FROM {legacy} WHERE {column} >= %s '
+        'RETURNING *) '
+        'INSERT INTO {table} SELECT * FROM moved'.format(**names),
+        [start]
+    )
+    execute(
+        'ALTER TABLE {table} ATTACH PARTITION {legacy} '
+        'FOR VALUES FROM (MINVALUE) TO (%s)'.format(**names),
+        [start]
+    )
+
+
+def unpartition_table(schema_editor, table, column):
+    """Replace a partitioned table by a table with the rows of its partitions.
+
+    Reverse of ``partition_table``: the rows are copied to a new table, with
+    the indexes and constraints of the partitioned table, and the partitioned
+    table is dropped with its partitions. The partitions detached by
+    ``remove_call_event_partitions --archive`` are not copied.
+    """
+    quote_name = schema_editor.quote_name
+    execute = schema_editor.execute
+    names = {
+        'table': quote_name(table),
+        'copy': quote_name(table + '_copy'),
+        'column': quote_name(column),
+        'id': quote_name('id'),
+    }
+
+    with schema_editor.connection.cursor() as cursor:
+        constraints, indexes = table_indexes(cursor, table)
+        sequence = serial_sequence(cursor, table)
+
+    execute(
+        'CREATE TABLE {copy} (LIKE {table} INCLUDING DEFAULTS '
+        'INCLUDING CONSTRAINTS)'.format(**names)
+    )
+    execute('INSERT INTO {copy} SELECT * FROM {table}'.format(**names))
+    if sequence:
+        execute('ALTER SEQUENCE {} OWNED BY {}.{}'.format(
+            sequence, names['copy'], names['id']
+        ))
+    execute('DROP TABLE {table}'.format(**names))
+    execute('ALTER TABLE {copy} RENAME TO {table}'.format(**names))
+    execute('ALTER TABLE {table} ALTER COLUMN {column} DROP NOT NULL'.format(
+        **names
+    ))
+    execute('ALTER TABLE {table} ADD PRIMARY KEY ({id})'.format(**names))
+
+    for name, definition in constraints:
+        execute('ALTER TABLE {} ADD CONSTRAINT {} {}'.format(
+            names['table'], quote_name(name), definition
+        ))
+    for name, unique, using in indexes:
+        execute('CREATE {}INDEX {} ON {}{}'.format(
+            'UNIQUE ' if unique else '', quote_name(name), names['table'],
+            using
+        ))
+
+
+def serial_sequence(cursor, table):
+    """Name of the sequence of the ids of a table, None if it has none."""
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    return cursor.fetchone()[0]
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for values in TABLES:
+        partition_table(schema_editor, *values)
+
+
+def unpartition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column, _ in TABLES:
+        unpartition_table(schema_editor, table, column)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0004_billitem_call_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='billitem',
+            name='call_id',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='billitem',
+            unique_together={('call_id', 'to_datetime')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='callevent',
+            unique_together={('call_type', 'call_id', 'call_datetime')},
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
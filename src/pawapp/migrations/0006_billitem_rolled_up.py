@@ -0,0 +1,28 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0005_partition_tables'),
+    ]
+
+    operations = [
+        # the items saved before are already in the totals of their bills
+        migrations.AddField(
+            model_name='billitem',
+            name='rolled_up',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='billitem',
+            name='rolled_up',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='billitem',
+            index=models.Index(condition=models.Q(('rolled_up', False)), fields=['id'], name='billitem_pending_idx'),
+        ),
+    ]
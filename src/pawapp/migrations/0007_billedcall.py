@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pawapp', '0006_billitem_rolled_up'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BilledCall',
+            fields=[
+                ('call_id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+            ],
+        ),
+        # the calls billed before are the calls of the items saved
+        migrations.RunSQL(
+            'INSERT INTO pawapp_billedcall (call_id) '
+            'SELECT DISTINCT call_id FROM pawapp_billitem '
+            'WHERE call_id IS NOT NULL',
+            migrations.RunSQL.noop,
+        ),
+    ]
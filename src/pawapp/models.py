@@ -1,15 +1,32 @@
 """Django models module."""
-from datetime import datetime, timedelta
-from decimal import Decimal
-
-from django.db import models
-from django.db.models.signals import post_save
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import connection, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from . import const
 from . import exceptions
 from . import cache
+from . import metrics
+from . import pairing
+from . import rating
+from .helpers import (
+    encode_cursor, last_period, money_cents, naive_utc, period_range
+)
+from .querybudget import query_budget
+from .timestamps import parse_timestamp, parse_timestamp_utc
+
+
+logger = logging.getLogger(__name__)
 
 
 class CallEvent(models.Model):
@@ -17,6 +34,7 @@ class CallEvent(models.Model):
 
     call_type = models.CharField(max_length=5, choices=const.CALL_TYPE_CHOICES)
     call_timestamp = models.CharField(max_length=20)
+    call_datetime = models.DateTimeField(db_index=True, blank=True, null=True)
     call_id = models.CharField(
         db_index=True, max_length=const.CALL_ID_MAX_LENGTH)
     source_number = models.CharField(
@@ -34,42 +52,61 @@ class CallEvent(models.Model):
             datetime: Call_timestamp value.
 
         """
-        call_ts = self.call_timestamp
-        return datetime.strptime(call_ts, const.TIMESTAMP_FORMAT)
+        if self.call_datetime:
+            return naive_utc(self.call_datetime)
+        return parse_timestamp(self.call_timestamp)
 
     @classmethod
+    @query_budget(const.QUERY_BUDGET_SAVE_CALL)
     def save_call(cls, save_bill=False, **data):
         """Save or update CallEvent.
 
+        The event is written with a single query, as the events of a batch
+        (see ``upsert_calls``). The event is paired with the events of the open calls after it is
+        written, so a call completed by the event is billed without reading
+        its events from the database. A start event received after its end
+        bills the call, reading the end from the database only if it could
+        have expired from the open calls (see ``pairing.open_call_expired``).
+
         Args:
             save_bill (bool, optional): Should save the bill for this call
-                event.
+                event, even if it is not paired with an open call.
             **data: Arbitrary keyword arguments.
 
-        Returns:
-            CallEvent: Instance created or updated.
-
         """
         # save or update call event data
-        call_type = data.pop('call_type')
-        call_id = data.pop('call_id')
-        event, _ = cls.objects.update_or_create(
-            call_type=call_type,
-            call_id=call_id,
-            defaults=data
-        )
+        call_type = data['call_type']
+        call_id = data['call_id']
+        call_datetime = None
+        if data.get('call_timestamp'):
+            call_datetime = parse_timestamp_utc(data['call_timestamp'])
+        cls.upsert_calls([data])
+        completed = pairing.pair_events([data])
+
+        # get the calls related, from the database if they are not open
+        if call_id in completed:
+            call_events = cls.from_paired(completed[call_id])
+        elif save_bill or (call_type == const.CALL_TYPE_START and
+                           pairing.open_call_expired(call_datetime)):
+            call_events = {
+                call_event.call_type: call_event
+                for call_event in cls.objects.filter(
+                    cls.window_filter([call_datetime]), call_id=call_id
+                ).order_by('id')
+            }
+        else:
+            return
+        start_call = call_events.get(const.CALL_TYPE_START)
+        end_call = call_events.get(const.CALL_TYPE_END)
 
-        if save_bill:
+        # the end waits open for its start, that bills the call when saved
+        if start_call and end_call:
 
             # calculate the values for the current call
-            call_value, call_duration = cls.calculate_call(call_id)
-
-            # get the calls related
-            start_call = cls.objects.get(
-                call_id=call_id, call_type=const.CALL_TYPE_START
-            )
-            end_call = cls.objects.get(
-                call_id=call_id, call_type=const.CALL_TYPE_END
+            call_value, call_duration = rating.rate_call(
+                start_call.call_timestamp_datetime,
+                end_call.call_timestamp_datetime,
+                ConnectionRate.current_rates()
             )
 
             # save bill values
@@ -80,37 +117,326 @@ class CallEvent(models.Model):
                 call_value
             )
 
-        return event
+    @classmethod
+    def save_calls(cls, events):
+        """Save or update many CallEvents and bill the calls completed.
+
+        The events are saved in a single query and paired with the events of
+        the open calls. The calls ended by the events are billed with the
+        events paired, loading at once the events of the calls not found
+        open. The starts not completed by the open calls, whose ends could
+        have expired from them, bill the ends saved before, read at once
+        from the database. Calls without the start event or with an invalid
+        interval are not billed.
+
+        Args:
+            events (list): List of dicts with the CallEvent data.
+
+        Returns:
+            list: Call ids of the end events that could not be billed.
+
+        """
+        with transaction.atomic():
+            cls.upsert_calls(events)
+            completed = pairing.pair_events(events)
+            calls = {
+                call_id: cls.from_paired(call_events)
+                for call_id, call_events in completed.items()
+            }
+
+            # the other events of the calls are read only around the events
+            event_datetimes = [
+                parse_timestamp_utc(data['call_timestamp'])
+                if data.get('call_timestamp') else None
+                for data in events
+            ]
+            call_datetimes = [value for value in event_datetimes if value]
+
+            # the starts not completed bill their ends saved before, that
+            # could have expired from the open calls
+            late_start_ids = {
+                data['call_id']
+                for data, call_datetime in zip(events, event_datetimes)
+                if data['call_type'] == const.CALL_TYPE_START and
+                pairing.open_call_expired(call_datetime)
+            } - set(completed)
+            if late_start_ids:
+                calls.update(cls.ended_calls(late_start_ids, call_datetimes))
+
+            # the ends received and the ends completed by late starts
+            end_call_ids = sorted({
+                data['call_id'] for data in events
+                if data['call_type'] == const.CALL_TYPE_END
+            } | set(calls))
+            if not end_call_ids:
+                return []
+            return cls.bill_calls(end_call_ids, calls, call_datetimes)
+
+    @classmethod
+    def load_calls(cls, call_ids, call_datetimes=None):
+        """Load at once the events of the calls.
+
+        An event received again with another datetime is saved as another
+        row, the last one saved of each type is used.
+
+        Args:
+            call_ids (iterable): Call ids.
+            call_datetimes (list, optional): Datetimes of the events received
+                of the calls, the events are read only around them (see
+                ``window_filter``).
+
+        Returns:
+            dict: CallEvents by call type, by call id.
+
+        """
+        calls = {}
+        events = cls.objects.filter(
+            cls.window_filter(call_datetimes or []),
+            call_id__in=sorted(call_ids)
+        ).order_by('id')
+        for event in events:
+            calls.setdefault(event.call_id, {})[event.call_type] = event
+        return calls
+
+    @classmethod
+    def ended_calls(cls, call_ids, call_datetimes=None):
+        """Load at once the events of the calls with both events saved.
+
+        Args:
+            call_ids (iterable): Call ids.
+            call_datetimes (list, optional): Datetimes of the events received
+                of the calls (see ``load_calls``).
+
+        Returns:
+            dict: CallEvents by call type, by call id, only of the calls
+                with the start and end events.
+
+        """
+        calls = cls.load_calls(call_ids, call_datetimes)
+        return {
+            call_id: call_events for call_id, call_events in calls.items()
+            if len(call_events) == 2
+        }
+
+    @classmethod
+    def upsert_calls(cls, events):
+        """Insert or update many CallEvents in a single query.
+
+        Repeated events (same call_type and call_id) are merged, the values
+        of the last ones win. Values missing in the event do not overwrite
+        the values already saved. The events saved are identified by their
+        type, call id and datetime, as the datetime is the partition key of
+        the table.
+
+        Args:
+            events (list): List of dicts with the CallEvent data.
+
+        """
+        merged_events = OrderedDict()
+        for data in events:
+            key = (data['call_type'], data['call_id'])
+            merged_events.setdefault(key, {}).update(data)
+        if not merged_events:
+            return
+
+        for data in merged_events.values():
+            if data.get('call_timestamp'):
+                data['call_datetime'] = parse_timestamp_utc(
+                    data['call_timestamp']
+                )
+
+        quote_name = connection.ops.quote_name
+        fields = [
+            cls._meta.get_field(name)
+            for name in const.DB_FIELDS + ['call_datetime']
+        ]
+        created_at_field = cls._meta.get_field('created_at')
+        created_at = created_at_field.get_db_prep_value(
+            timezone.now(), connection
+        )
+
+        table = quote_name(cls._meta.db_table)
+        columns = [quote_name(field.column) for field in fields]
+        columns.append(quote_name(created_at_field.column))
+        updates = [
+            '{0} = COALESCE(EXCLUDED.{0}, {1}.{0})'.format(
+                quote_name(field.column), table
+            )
+            for field in fields
+            if field.name not in ('call_type', 'call_id', 'call_datetime')
+        ]
+        row = '({})'.format(', '.join(['%s'] * len(columns)))
+
+        sql = (
+            'INSERT INTO {table} ({columns}) VALUES {rows} '
+            'ON CONFLICT ({call_type}, {call_id}, {call_datetime}) '
+            'DO UPDATE SET {updates}'
+        ).format(
+            table=table,
+            columns=', '.join(columns),
+            rows=', '.join([row] * len(merged_events)),
+            call_type=quote_name('call_type'),
+            call_id=quote_name('call_id'),
+            call_datetime=quote_name('call_datetime'),
+            updates=', '.join(updates),
+        )
+
+        params = []
+        for data in merged_events.values():
+            params.extend(
+                field.get_db_prep_value(data.get(field.name), connection)
+                for field in fields
+            )
+            params.append(created_at)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    @staticmethod
+    def from_paired(call_events):
+        """CallEvents of the event data paired, without saving them.
+
+        Args:
+            call_events (dict): CallEvent data by call type.
+
+        Returns:
+            dict: CallEvents by call type.
+
+        """
+        return {
+            call_type: CallEvent(**data)
+            for call_type, data in call_events.items()
+        }
+
+    @staticmethod
+    def window_filter(call_datetimes):
+        """Filter of the events of the calls of some events by datetime.
+
+        The other event of a call is at most ``CALL_MAX_DURATION`` seconds
+        before or after the event, so only the partitions of this window
+        around the events are read. The events without the datetime are
+        kept in the default partition, and are read too.
+
+        Args:
+            call_datetimes (list): Datetimes of the events, the ones missing
+                are ignored.
+
+        Returns:
+            Q: Filter of the events, of all the events without datetimes.
+
+        """
+        call_datetimes = [value for value in call_datetimes if value]
+        if not call_datetimes:
+            return models.Q()
+        window = timedelta(seconds=const.CALL_MAX_DURATION)
+        return (
+            models.Q(
+                call_datetime__gte=min(call_datetimes) - window,
+                call_datetime__lte=max(call_datetimes) + window
+            ) |
+            models.Q(call_datetime__isnull=True)
+        )
+
+    @classmethod
+    def bill_calls(cls, call_ids, calls=None, call_datetimes=None):
+        """Save the bills for the calls, loading all the events at once.
+
+        Args:
+            call_ids (list): List of call ids.
+            calls (dict, optional): CallEvents already known, by call type,
+                by call id. Only the events of the other calls are loaded.
+            call_datetimes (list, optional): Datetimes of the events received
+                of the calls (see ``load_calls``).
+
+        The calls that could not be billed are logged and counted in the
+        metrics of the events dropped, as the ids returned are kept only as
+        the result of the job.
+
+        Returns:
+            list: Call ids that could not be billed.
+
+        Raises:
+            RatesNotFoundException: Raises if there are no rates.
+        """
+        rate_timeline = ConnectionRate.rate_timeline()
+
+        calls = dict(calls or {})
+        missing_call_ids = [
+            call_id for call_id in call_ids if len(calls.get(call_id, {})) < 2
+        ]
+        if missing_call_ids:
+            for call_id, call_events in cls.load_calls(
+                    missing_call_ids, call_datetimes).items():
+                calls.setdefault(call_id, {}).update(call_events)
+
+        not_billed = []
+        for call_id in call_ids:
+            call_events = calls.get(call_id, {})
+            start_call = call_events.get(const.CALL_TYPE_START)
+            end_call = call_events.get(const.CALL_TYPE_END)
+            if not start_call or not end_call:
+                logger.warning(
+                    'Call %s not billed, its start or end is missing.', call_id
+                )
+                metrics.CALL_EVENTS_DROPPED.inc('unpaired')
+                not_billed.append(call_id)
+                continue
+
+            try:
+                call_value, call_duration = rating.rate_call(
+                    start_call.call_timestamp_datetime,
+                    end_call.call_timestamp_datetime,
+                    rate_timeline
+                )
+            except exceptions.InvalidCallIntervalException:
+                logger.warning(
+                    'Call %s not billed, its end is before its start.', call_id
+                )
+                metrics.CALL_EVENTS_DROPPED.inc('invalid_interval')
+                not_billed.append(call_id)
+                continue
+
+            Bill.save_by_calls(start_call, end_call, call_duration, call_value)
+
+        return not_billed
 
     @classmethod
-    def interval_by_call_id(cls, call_id):
+    def interval_by_call_id(cls, call_id, call_datetime=None):
         """Return call timestamp interval.
 
         Args:
             call_id (int): Call event Id
+            call_datetime (datetime, optional): Datetime of an event of the
+                call, the events are read only around it. All the partitions
+                are read without it.
 
         Returns:
             dict: Start and end datetime
 
         """
         interval_values = {}
-        call_events = cls.objects.filter(call_id=call_id).values_list(
-            'call_type', 'call_timestamp')
-        if call_events:
-            interval_values = dict(call_events)
-            for field in ['start', 'end']:
-                call_ts = interval_values.get(field)
-                if call_ts:
-                    interval_values[field] = datetime.strptime(
-                        call_ts, const.TIMESTAMP_FORMAT)
+        call_events = cls.objects.filter(
+            cls.window_filter([call_datetime]), call_id=call_id
+        ).order_by('id').values_list(
+            'call_type', 'call_datetime', 'call_timestamp')
+        for call_type, call_dt, call_ts in call_events:
+            if call_dt:
+                interval_values[call_type] = naive_utc(call_dt)
+            elif call_ts:
+                interval_values[call_type] = parse_timestamp(call_ts)
+            else:
+                interval_values[call_type] = None
         return interval_values
 
     @classmethod
-    def calculate_call(cls, call_id):
+    @metrics.CALCULATE_CALL_SECONDS.time()
+    def calculate_call(cls, call_id, call_datetime=None):
         """Calculated the call value and duration charged.
 
         Args:
             call_id (int): Call event Id.
+            call_datetime (datetime, optional): Datetime of an event of the
+                call (see ``interval_by_call_id``).
 
         Returns:
             tuple: Two values representing the total value and
@@ -120,68 +446,25 @@ class CallEvent(models.Model):
             InvalidCallPairException: Raises if start or end calls are missing.
             InvalidCallIntervalException: Raises if end datetime is less than
                 start datetime.
+            RatesNotFoundException: Raises if there are no rates.
         """
         # get start and end events for this call
-        call_events = cls.interval_by_call_id(call_id)
+        call_events = cls.interval_by_call_id(call_id, call_datetime)
 
         # start and end being calculated
         start_call = call_events.get('start')
         end_call = call_events.get('end')
 
-        # check if the values are valid
-        if not start_call or not end_call:
-            raise exceptions.InvalidCallPairException()
-        if end_call <= start_call:
-            raise exceptions.InvalidCallIntervalException()
+        # check if the values are valid before loading the rates
+        rating.validate_interval(start_call, end_call)
 
-        # build values maps based on start and end calls datetime
-        map_interval_values = ConnectionRate.mapped_rates_interval(
-            start_call, end_call
+        return rating.rate_call(
+            start_call, end_call, ConnectionRate.current_rates()
         )
-        if not map_interval_values:
-            raise exceptions.RatesNotFoundException()
-
-        # hold the calculated values and durations
-        calculated_values, calculated_durations = [], []
-
-        def calculate_values(from_datetime, to_datetime, minute_rate):
-            """Calculate and hold values"""
-            # calculate duration for the interval
-            time_diff = (to_datetime - from_datetime)
-            duration = int(time_diff.total_seconds())
-            calculated_durations.append(duration)
-
-            # calculate the interval duration with the current minute rate
-            calculated_value = int(duration / 60) * minute_rate
-            calculated_values.append(round(Decimal(calculated_value), 2))
-
-        # navigate each values:
-        # from_datetime, to_datetime, standing_rate and minute_rate
-        for from_dt, to_dt, standing_rate, minute_rate in map_interval_values:
-
-            if not calculated_values:
-
-                if not from_dt < start_call < to_dt:
-                    continue
-
-                # append the standing rate
-                calculated_values.append(standing_rate)
-
-                from_dt = start_call
-
-            if from_dt.date() == end_call.date():
-
-                if from_dt < end_call < to_dt:
-                    calculate_values(from_dt, end_call, minute_rate)
-                    break
-
-            calculate_values(from_dt, to_dt, minute_rate)
-
-        # returns all the sum of the calculated values and durations
-        return sum(calculated_values), sum(calculated_durations)
 
     class Meta:
-        unique_together = ('call_type', 'call_id')
+        # the datetime is the partition key of the table (see partitions)
+        unique_together = ('call_type', 'call_id', 'call_datetime')
 
 
 class ConnectionRate(models.Model):
@@ -201,6 +484,9 @@ class ConnectionRate(models.Model):
     def current_rates(cls, use_cache=True):
         """Current rates available for calculation.
 
+        Using the cache, the rates are kept in the memory of the process and
+        loaded again only when their version in the cache changes.
+
         Args:
             use_cache (bool): Should use the cache.
 
@@ -208,10 +494,32 @@ class ConnectionRate(models.Model):
             list: List with dict object with the fields:
                 from_time, to_time, stangind and minute rates
 
+        """
+        if use_cache:
+            return local_rates.get()
+        return cls.load_rates(use_cache=False)
+
+    @classmethod
+    def load_rates(cls, version=None, use_cache=True):
+        """Load the rates from the cache or the database.
+
+        The rates are cached under their version, read before them, so the
+        rates read from the database before a change is committed are never
+        cached as the rates of the version after it.
+
+        Args:
+            version (int, optional): Version of the rates in the cache.
+            use_cache (bool): Should use the cache.
+
+        Returns:
+            tuple: Tuples of from_time, to_time, standing and minute rates.
+
         """
         data = None
+        key = rates_cache_key(version)
         if use_cache:
-            data = cache.get_value(const.CACHE_KEY_RATES)
+            data = cache.get_value(key, cache.rates_serializer)
+            metrics.RATES_CACHE.inc('redis', 'hit' if data else 'miss')
 
         if not data:
             values_fields = [
@@ -220,88 +528,54 @@ class ConnectionRate(models.Model):
             if rates:
                 data = tuple(rates)
                 if use_cache:
-                    cache.set_value(const.CACHE_KEY_RATES, data)
+                    cache.set_value(key, data, cache.rates_serializer)
 
         return data
 
     @classmethod
-    def mapped_rates_interval(cls, start_datetime, end_datetime):
-        """List of mapped datetime and values intervals.
+    def rate_timeline(cls):
+        """Compiled timeline of the current rates.
 
-        This method is responsible to calculate the range of intervals between
-        the start and end datetime with respective values.
-
-        Args:
-            start_datetime (datetime): Start datetime object.
-            end_datetime (datetime): End datetime object.
+        The timeline is compiled once for the same rates values.
 
         Returns:
-            list: List of intervals.
+            RateTimeline: Timeline for the current rates.
 
+        Raises:
+            RatesNotFoundException: Raises if there are no rates.
         """
-        # get the current rates
-        rates = cls.current_rates()
-        if not rates:
-            return []
-
-        # build values interval based on start and end calls datetime
-        map_interval_values = set()
-
-        current_day = start_datetime.date()
-        while current_day <= end_datetime.date():
-
-            for from_time, to_time, standing_rate, minute_rate in rates:
-
-                from_datetime = datetime.combine(current_day, from_time)
-                to_datetime = datetime.combine(current_day, to_time)
-
-                # if time is not inverse, add and continue
-                if to_time > from_time:
-                    map_interval_values.add((
-                        from_datetime,
-                        to_datetime,
-                        standing_rate,
-                        minute_rate
-                    ))
-                    continue
-
-                # if time is inverse, add datetime for the day before and after
-                # current day
-                yesterday = current_day + timedelta(days=-1)
-                yesterday_datetime = datetime.combine(yesterday, from_time)
-                tomorrow = current_day + timedelta(days=1)
-                tomorrow_datetime = datetime.combine(tomorrow, to_time)
-                map_interval_values.add(
-                    (
-                        yesterday_datetime,
-                        to_datetime,
-                        standing_rate,
-                        minute_rate
-                    )
-                )
-                map_interval_values.add(
-                    (
-                        from_datetime,
-                        tomorrow_datetime,
-                        standing_rate,
-                        minute_rate
-                    )
-                )
+        return rating.compile_rates(cls.current_rates())
 
-            current_day += timedelta(days=1)
 
-        # sort set by the datetime values
-        map_interval_values = sorted(
-            map_interval_values, key=lambda v: (v[0], v[1])
-        )
+local_rates = cache.LocalValue(
+    const.CACHE_KEY_RATES_VERSION,
+    ConnectionRate.load_rates,
+    const.RATES_CHECK_INTERVAL,
+    counter=metrics.RATES_CACHE
+)
+
+
+def rates_cache_key(version):
+    """Cache key of the rates of a version."""
+    return const.CACHE_KEY_RATES.format(version=version or 0)
+
 
-        return map_interval_values
+def clean_rates_cache():
+    """Bump the rates version and clean the rates of the previous one.
+
+    The version is bumped before the rates are cleaned, so the rates loaded
+    by a process before the change are saved in the key of the previous
+    version, not read anymore.
+    """
+    version = cache.bump_version(const.CACHE_KEY_RATES_VERSION)
+    cache.clean_value(rates_cache_key(version - 1))
 
 
 @receiver(post_save, sender=ConnectionRate)
+@receiver(post_delete, sender=ConnectionRate)
 def postsave_connectionrate_handler(sender, **kwargs):
-    """Clean cache for ConnectionRate"""
-    cache.clean_value(const.CACHE_KEY_RATES)
+    """Clean cache for ConnectionRate after the changes are committed"""
+    transaction.on_commit(clean_rates_cache)
 
 
 class Bill(models.Model):
@@ -311,17 +585,28 @@ class Bill(models.Model):
     month = models.PositiveSmallIntegerField()
     total_duration = models.PositiveIntegerField()
     total_amount = models.DecimalField(max_digits=8, decimal_places=2)
+    total_amount_cents = models.BigIntegerField(blank=True, null=True)
 
     @classmethod
+    @query_budget(const.QUERY_BUDGET_SAVE_BY_CALLS)
     def save_by_calls(cls, start_call, end_call, duration, amount):
         """Save Bill and Item based on the start and end calls.
 
+        The item is saved only once by call, so the call billed again does
+        not change the bill. Only the item is written, the totals of the bill
+        are updated later with the items rolled up (see ``pawapp.rollup``),
+        so the calls of a number billed at the same time do not wait for
+        each other.
+
         Args:
             start_call (CallEvent): CallEvent object representing the start
                 call.
             end_call (CallEvent): CallEvent object representing the end call.
             duration (int): Call duration.
             amount (float): Call value.
+
+        Returns:
+            bool: False if the call was already billed.
         """
 
         # get related bill or create a new one
@@ -329,33 +614,200 @@ class Bill(models.Model):
             phone_number=start_call.source_number,
             year=end_call.call_timestamp_datetime.year,
             month=end_call.call_timestamp_datetime.month,
-            defaults={'total_duration': 0, 'total_amount': 0}
+            defaults={
+                'total_duration': 0,
+                'total_amount': 0,
+                'total_amount_cents': 0
+            }
         )
 
-        # save bill item
-        BillItem.objects.create(
-            bill=bill,
+        # save bill item, unless the call was already billed
+        created = BillItem.insert_once(
+            bill=bill.id,
+            call_id=start_call.call_id,
             phone_number=start_call.destination_number,
             from_timestamp=start_call.call_timestamp,
             to_timestamp=end_call.call_timestamp,
+            from_datetime=parse_timestamp_utc(start_call.call_timestamp),
+            to_datetime=parse_timestamp_utc(end_call.call_timestamp),
             duration=duration,
-            amount=amount
+            amount=amount,
+            amount_cents=money_cents(amount),
+            rolled_up=False
         )
+        if not created:
+            return False
+
+        # the item is inserted without the signals of the model
+        key = cls.cache_key(bill.phone_number, bill.month, bill.year)
+        transaction.on_commit(lambda: cache.clean_value(key))
+        return True
+
+    @classmethod
+    def add_totals(cls, totals):
+        """Add durations and amounts to the totals of the bills.
+
+        The totals are incremented by the database in a single update by
+        bill, without reading them, so concurrent updates of a bill are not
+        lost. The bills are updated in order of id, so the workers updating
+        the same bills lock them in the same order.
+
+        Args:
+            totals (dict): Duration and amount to add by bill id.
+
+        Returns:
+            int: Number of bills updated.
+
+        """
+        updated = 0
+        for bill_id in sorted(totals):
+            duration, amount = totals[bill_id]
+            # bills saved before the cents column get it from the amount
+            amount_cents = Coalesce(
+                F('total_amount_cents'),
+                Cast(F('total_amount') * 100, models.BigIntegerField())
+            )
+            updated += cls.objects.filter(id=bill_id).update(
+                total_duration=F('total_duration') + duration,
+                total_amount=F('total_amount') + amount,
+                total_amount_cents=amount_cents + money_cents(amount)
+            )
+        return updated
+
+    @classmethod
+    def update_totals(cls, year, month, shard=0, shards=1):
+        """Aggregate again the totals of the bills of a period from the items.
 
-        # update bill adding current call duration and amount
-        bill.total_duration += duration
-        bill.total_amount += amount
-        bill.save()
+        Only the items already rolled up are aggregated, the others are
+        added by the rollup. The bills are locked before they are read, so
+        the items rolled up at the same time are added after they are
+        updated.
+
+        Args:
+            year (int): Year of the period.
+            month (int): Month of the period.
+            shard (int, optional): Index of the shard of bills updated.
+            shards (int, optional): Number of shards the bills are split by
+                id.
+
+        Returns:
+            int: Number of bills updated.
+
+        """
+        items = BillItem.objects.filter(
+            BillItem.period_filter(year, month), bill=OuterRef('pk'),
+            rolled_up=True
+        ).values('bill')
+        total_duration = items.annotate(total=Sum('duration')).values('total')
+        total_amount = items.annotate(total=Sum('amount')).values('total')
+        total_amount_cents = items.annotate(
+            total=Sum('amount_cents')
+        ).values('total')
+
+        bills = cls.objects.filter(year=year, month=month)
+        if shards > 1:
+            bills = bills.annotate(shard=F('id') % shards).filter(shard=shard)
+
+        with transaction.atomic():
+            list(bills.select_for_update().order_by('id').values_list('id'))
+            return bills.update(
+                total_duration=Coalesce(
+                    Subquery(
+                        total_duration, output_field=models.IntegerField()
+                    ),
+                    0
+                ),
+                total_amount=Coalesce(
+                    Subquery(total_amount, output_field=models.DecimalField()),
+                    0
+                ),
+                total_amount_cents=Coalesce(
+                    Subquery(
+                        total_amount_cents,
+                        output_field=models.BigIntegerField()
+                    ),
+                    0
+                )
+            )
 
     @classmethod
+    @query_budget(const.QUERY_BUDGET_BILL_DATA)
     def data_by_number_period(cls, phone_number, month, year):
         """Return bill data by phone_number, month and year.
 
+        The calls of the bills of closed periods are kept in the cache until
+        an item of the bill is saved.
+
+        Args:
+            phone_number (str): Phone number
+            month (str): Month
+            year (str): Year
+
+        """
+        started = time.perf_counter()
+        data = {
+            'subscriber': phone_number,
+            'period': '{}/{}'.format(month, year),
+        }
+
+        closed_period = (int(year), int(month)) <= last_period()
+        key = cls.cache_key(phone_number, month, year)
+        if closed_period:
+            calls = cache.get_value(key, cache.json_serializer)
+            if calls is not None:
+                data['calls'] = calls
+                metrics.BILL_READ_SECONDS.observe(
+                    time.perf_counter() - started, 'cache'
+                )
+                return data
+
+        query = {
+            'phone_number': phone_number,
+            'month': month,
+            'year': year
+        }
+
+        bill = get_object_or_404(cls, **query)
+
+        calls = []
+        items = bill.billitem_set.filter(BillItem.period_filter(year, month))
+        for billitem in items:
+            call = BillItem.call_data(
+                billitem.phone_number,
+                billitem.from_timestamp,
+                billitem.duration,
+                billitem.amount
+            )
+            calls.append(call)
+
+        if closed_period:
+            cache.set_value(
+                key, calls, cache.json_serializer,
+                timeout=const.CACHE_TIMEOUT_BILL
+            )
+
+        data['calls'] = calls
+        metrics.BILL_READ_SECONDS.observe(
+            time.perf_counter() - started, 'database'
+        )
+        return data
+
+    @classmethod
+    def stream_by_number_period(cls, phone_number, month, year):
+        """Return bill data by phone_number, month and year as JSON chunks.
+
+        The items are read with a server-side cursor and the JSON is
+        generated while it is consumed, so the memory used does not depend
+        on the number of items of the bill.
+
         Args:
             phone_number (str): Phone number
             month (str): Month
             year (str): Year
 
+        Returns:
+            generator: Chunks of the JSON text of the bill data.
+
         """
         query = {
             'phone_number': phone_number,
@@ -363,39 +815,248 @@ class Bill(models.Model):
             'year': year
         }
 
+        # get the bill before streaming to fail while the response can be
+        # an error
         bill = get_object_or_404(cls, **query)
 
-        data = {
+        header = json.dumps({
             'subscriber': phone_number,
             'period': '{}/{}'.format(month, year),
+        })
+        items = bill.billitem_set.filter(
+            BillItem.period_filter(year, month)
+        ).values_list(
+            'phone_number', 'from_timestamp', 'duration', 'amount'
+        ).iterator(chunk_size=const.BILL_STREAM_CHUNK_SIZE)
+
+        def generate_chunks():
+            yield header[:-1] + ', "calls": ['
+
+            calls, separator = [], ''
+            for item in items:
+                calls.append(json.dumps(BillItem.call_data(*item)))
+                if len(calls) == const.BILL_STREAM_CHUNK_SIZE:
+                    yield separator + ', '.join(calls)
+                    calls, separator = [], ', '
+            if calls:
+                yield separator + ', '.join(calls)
+
+            yield ']}'
+
+        return generate_chunks()
+
+    @classmethod
+    def page_by_number_period(cls, phone_number, month, year, limit,
+                              after=None, fields=None):
+        """Return a page of the bill data by phone_number, month and year.
+
+        The calls are ordered by their start and paginated by keyset, so
+        only the rows of the page are read. Only the columns required by
+        the fields are loaded.
+
+        Args:
+            phone_number (str): Phone number
+            month (str): Month
+            year (str): Year
+            limit (int): Number of calls of the page.
+            after (list, optional): From timestamp and id of the last call of
+                the previous page.
+            fields (list, optional): Fields of the calls, all by default.
+
+        Returns:
+            dict: Bill data with the calls of the page and the cursor of the
+                next page (None if it is the last one).
+
+        """
+        query = {
+            'phone_number': phone_number,
+            'month': month,
+            'year': year
         }
+        bill_id = get_object_or_404(
+            cls.objects.values_list('id', flat=True), **query
+        )
+
+        fields = fields or const.BILL_CALL_FIELDS
+        columns = ['from_timestamp', 'id']
+        for field in fields:
+            column = BillItem.CALL_FIELDS_COLUMNS[field]
+            if column not in columns:
+                columns.append(column)
+
+        items = BillItem.objects.filter(
+            BillItem.period_filter(year, month), bill_id=bill_id
+        )
+        if after:
+            from_timestamp, item_id = after
+            items = items.filter(
+                models.Q(from_timestamp__gt=from_timestamp) |
+                models.Q(from_timestamp=from_timestamp, id__gt=item_id)
+            )
+        rows = list(
+            items.order_by('from_timestamp', 'id')
+            .values_list(*columns)[:limit + 1]
+        )
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(*rows[-1][:2])
+
         calls = []
-        for billitem in bill.billitem_set.all():
-            str_date, str_time = billitem.from_date_and_time
-            call = {
-                'destination': billitem.phone_number,
-                'start_date': str_date,
-                'start_time': str_time,
-                'duration': billitem.repr_duration,
-                'price': '{0:.2f}'.format(billitem.amount)
-            }
-            calls.append(call)
+        for row in rows:
+            values = dict(zip(columns, row))
+            call = BillItem.call_data(
+                values.get('phone_number'),
+                values['from_timestamp'],
+                values.get('duration', 0),
+                values.get('amount', 0)
+            )
+            calls.append({field: call[field] for field in fields})
 
-        data['calls'] = calls
-        return data
+        return {
+            'subscriber': phone_number,
+            'period': '{}/{}'.format(month, year),
+            'calls': calls,
+            'next': next_cursor,
+        }
+
+    @classmethod
+    def summary_by_number_period(cls, phone_number, month, year):
+        """Return the bill totals by phone_number, month and year.
+
+        The totals are read with the items not rolled up yet in a single
+        query, so they are consistent with the items saved when it is read.
+
+        Args:
+            phone_number (str): Phone number
+            month (str): Month
+            year (str): Year
+
+        Returns:
+            dict: Bill data with the totals, without the calls.
+
+        """
+        query = {
+            'phone_number': phone_number,
+            'month': month,
+            'year': year
+        }
+        pending = BillItem.objects.filter(
+            BillItem.period_filter(year, month), bill=OuterRef('pk'),
+            rolled_up=False
+        ).values('bill')
+        bills = cls.objects.annotate(
+            pending_duration=Coalesce(
+                Subquery(
+                    pending.annotate(total=Sum('duration')).values('total')
+                ),
+                0,
+                output_field=models.IntegerField()
+            ),
+            pending_amount=Coalesce(
+                Subquery(
+                    pending.annotate(total=Sum('amount')).values('total')
+                ),
+                0,
+                output_field=models.DecimalField()
+            )
+        )
+        total_duration, total_amount, pending_duration, pending_amount = \
+            get_object_or_404(
+                bills.values_list(
+                    'total_duration', 'total_amount',
+                    'pending_duration', 'pending_amount'
+                ),
+                **query
+            )
+        total_duration += pending_duration
+        total_amount += pending_amount
+
+        return {
+            'subscriber': phone_number,
+            'period': '{}/{}'.format(month, year),
+            'total_duration': str(timedelta(seconds=total_duration)),
+            'total_price': '{0:.2f}'.format(total_amount),
+        }
+
+    @staticmethod
+    def cache_key(phone_number, month, year):
+        """Cache key of the calls of a bill."""
+        return const.CACHE_KEY_BILL_CALLS.format(
+            phone_number=phone_number, month=int(month), year=int(year)
+        )
+
+    @classmethod
+    def clean_cached_data(cls, bill_ids):
+        """Clean the calls of the bills kept in the cache.
+
+        Args:
+            bill_ids (iterable): Ids of the bills.
+
+        """
+        bills = cls.objects.filter(id__in=bill_ids).values_list(
+            'phone_number', 'month', 'year'
+        )
+        cache.clean_values([cls.cache_key(*bill) for bill in bills])
 
     class Meta:
         unique_together = ('phone_number', 'year', 'month')
 
 
+class BillItemQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Delete the items, cleaning the cached calls of their bills.
+
+        The bills are cleaned in bulk after the changes are committed, so the
+        items are deleted without the signals of the model, in a single
+        query.
+        """
+        bill_ids = set(self.values_list('bill_id', flat=True).distinct())
+        result = super().delete()
+        transaction.on_commit(lambda: Bill.clean_cached_data(bill_ids))
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class BillItem(models.Model):
     """Model representing the item of a Bill."""
+
+    # columns required by each field of the call data
+    CALL_FIELDS_COLUMNS = {
+        'destination': 'phone_number',
+        'start_date': 'from_timestamp',
+        'start_time': 'from_timestamp',
+        'duration': 'duration',
+        'price': 'amount',
+    }
+
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE)
+    call_id = models.CharField(
+        max_length=const.CALL_ID_MAX_LENGTH, blank=True, null=True
+    )
     phone_number = models.CharField(max_length=const.PHONE_NUMBER_MAX_LENGTH)
     from_timestamp = models.CharField(max_length=20)
     to_timestamp = models.CharField(max_length=20)
+    from_datetime = models.DateTimeField(db_index=True, blank=True, null=True)
+    to_datetime = models.DateTimeField(blank=True, null=True)
     duration = models.PositiveIntegerField()
     amount = models.DecimalField(max_digits=8, decimal_places=2)
+    amount_cents = models.BigIntegerField(blank=True, null=True)
+    # added to the totals of the bill (see pawapp.rollup)
+    rolled_up = models.BooleanField(default=False)
+
+    objects = BillItemQuerySet.as_manager()
+
+    def delete(self, *args, **kwargs):
+        """Delete the item, cleaning the cached calls of its bill."""
+        bill_ids = [self.bill_id]
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: Bill.clean_cached_data(bill_ids))
+        return result
 
     @property
     def repr_duration(self):
@@ -405,7 +1066,167 @@ class BillItem(models.Model):
     @property
     def from_date_and_time(self):
         """From_timestamp field splited as date and time values."""
+        if self.from_datetime:
+            from_datetime = naive_utc(self.from_datetime)
+            return [
+                from_datetime.strftime('%Y-%m-%d'),
+                from_datetime.strftime('%H:%M:%SZ')
+            ]
         values = self.from_timestamp.split('T')
         if len(values) != 2:
             return ['', '']
         return values
+
+    @classmethod
+    def insert_once(cls, **values):
+        """Insert a BillItem unless the call was already billed.
+
+        The end datetime is the partition key of the table, so the items
+        can't be unique by call. The call id is inserted in the calls billed
+        (``BilledCall``) and the item only if the call was not there, so the
+        call is billed once even if its end is received again with another
+        datetime. In PostgreSQL both are inserted by a single statement, the
+        other databases can't insert in a common table expression and run
+        two statements in a transaction.
+
+        Args:
+            **values: Values of the fields of the BillItem, with the call_id.
+
+        Returns:
+            bool: False if the call was already billed.
+
+        """
+        quote_name = connection.ops.quote_name
+        fields = [cls._meta.get_field(name) for name in values]
+        names = {
+            'table': quote_name(cls._meta.db_table),
+            'columns': ', '.join(quote_name(field.column) for field in fields),
+            'billed': quote_name(BilledCall._meta.db_table),
+            'call_id': quote_name('call_id'),
+            'id': quote_name('id'),
+        }
+        billed_sql = (
+            'INSERT INTO {billed} ({call_id}) VALUES (%s) '
+            'ON CONFLICT ({call_id}) DO NOTHING RETURNING {call_id}'
+        ).format(**names)
+        params = [
+            field.get_db_prep_save(values[field.name], connection)
+            for field in fields
+        ]
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                values_sql = ', '.join(
+                    'CAST(%s AS {})'.format(field.cast_db_type(connection))
+                    for field in fields
+                )
+                cursor.execute(
+                    'WITH billed AS (' + billed_sql + ') '
+                    'INSERT INTO {table} ({columns}) SELECT {values} '
+                    'FROM billed RETURNING {id}'.format(
+                        values=values_sql, **names
+                    ),
+                    [values['call_id']] + params
+                )
+                return cursor.fetchone() is not None
+
+            # the savepoints of a nested transaction would be two more queries
+            with transaction.atomic(savepoint=False):
+                cursor.execute(billed_sql, [values['call_id']])
+                if cursor.fetchone() is None:
+                    return False
+                cursor.execute(
+                    'INSERT INTO {table} ({columns}) VALUES ({values})'.format(
+                        values=', '.join(['%s'] * len(fields)), **names
+                    ),
+                    params
+                )
+                return True
+
+    @staticmethod
+    def period_filter(year, month):
+        """Filter of the items of a period, reading only its partition.
+
+        The items without the end datetime are kept in the default
+        partition, and are read too.
+
+        Args:
+            year (int): Year of the period.
+            month (int): Month of the period.
+
+        Returns:
+            Q: Filter of the items.
+
+        """
+        start, end = period_range(year, month)
+        return (
+            models.Q(to_datetime__gte=start, to_datetime__lt=end) |
+            models.Q(to_datetime__isnull=True)
+        )
+
+    @staticmethod
+    def call_data(phone_number, from_timestamp, duration, amount):
+        """Data of the call of an item as shown in the bill.
+
+        Args:
+            phone_number (str): Destination phone number.
+            from_timestamp (str): Timestamp of the start of the call.
+            duration (int): Call duration.
+            amount (Decimal): Call value.
+
+        Returns:
+            dict: Call data.
+
+        """
+        values = from_timestamp.split('T')
+        if len(values) != 2:
+            values = ['', '']
+        return {
+            'destination': phone_number,
+            'start_date': values[0],
+            'start_time': values[1],
+            'duration': str(timedelta(seconds=duration)),
+            'price': '{0:.2f}'.format(amount)
+        }
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['bill', 'from_timestamp', 'id'],
+                name='billitem_bill_start_idx'
+            ),
+            models.Index(
+                fields=['id'],
+                name='billitem_pending_idx',
+                condition=models.Q(rolled_up=False)
+            ),
+        ]
+        # the end datetime is the partition key of the table (see
+        # partitions)
+        unique_together = ('call_id', 'to_datetime')
+
+
+class BilledCall(models.Model):
+    """Model representing the calls billed.
+
+    The table is not partitioned, so the call id is unique by itself and each
+    call is billed once (see ``BillItem.insert_once``).
+    """
+
+    call_id = models.CharField(
+        primary_key=True, max_length=const.CALL_ID_MAX_LENGTH
+    )
+
+
+@receiver(post_save, sender=BillItem)
+def postsave_billitem_handler(sender, instance, **kwargs):
+    """Clean cached calls of the Bill after the changes are committed"""
+    bill_ids = [instance.bill_id]
+    transaction.on_commit(lambda: Bill.clean_cached_data(bill_ids))
+
+
+@receiver(post_delete, sender=Bill)
+def postdelete_bill_handler(sender, instance, **kwargs):
+    """Clean cached calls of the Bill deleted after the changes are committed"""
+    key = Bill.cache_key(instance.phone_number, instance.month, instance.year)
+    transaction.on_commit(lambda: cache.clean_value(key))
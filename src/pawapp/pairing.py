@@ -0,0 +1,135 @@
+"""Pairing of the start and end events of the calls.
+
+The events of the open calls (one event received, the other pending) are kept
+in a Redis hash by call id, with a field by call type and event value. The
+events received are added to the hashes of their calls and the hashes are
+read back in the same transaction, so when the events of a call are paired
+by two workers at the same time only the last one finds both of them. The
+calls completed are removed from the open calls and can be billed without
+reading the events again from the database.
+
+The events are paired after they are written in the database, so the worker
+not finding the other event in the open calls saved it before the other event
+was paired. The open calls are kept for ``CACHE_TIMEOUT_OPEN_CALL`` seconds
+after their last event (and can be evicted before by Redis, so it should not
+evict keys with an expiration), the calls not found open are read from the
+database only when they could have expired (see ``open_call_expired``).
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from . import const
+
+
+# fields of the events kept in the open calls
+EVENT_FIELDS = const.DB_FIELDS
+
+
+def open_call_key(call_id):
+    """Redis key of the hash of the events of an open call."""
+    return const.CACHE_KEY_OPEN_CALL.format(call_id=call_id)
+
+
+def open_call_expired(call_datetime):
+    """Check if the open call of a start event could have expired.
+
+    The end of a call is received after the call started, and its open call
+    is kept ``CACHE_TIMEOUT_OPEN_CALL`` seconds after it is received. So the
+    end of a start received less than this timeout after the call started is
+    found open, if it was received, and the database is not read.
+
+    Args:
+        call_datetime (datetime): Datetime of the start event, None if it is
+            unknown.
+
+    Returns:
+        bool: True if the end could have expired from the open calls.
+
+    """
+    if call_datetime is None:
+        return True
+    timeout = timedelta(seconds=const.CACHE_TIMEOUT_OPEN_CALL)
+    return call_datetime + timeout <= timezone.now()
+
+
+def merge_event(event, data):
+    """Update the event values, the values missing do not overwrite them."""
+    for field in EVENT_FIELDS:
+        value = data.get(field)
+        if value is not None:
+            event[field] = value
+
+
+def hash_fields(call_events):
+    """Fields of the hash of an open call with the values of its events.
+
+    Args:
+        call_events (dict): Event data by call type.
+
+    Returns:
+        dict: Values by field, named by call type and event field.
+
+    """
+    fields = {}
+    for call_type, data in call_events.items():
+        for field, value in data.items():
+            fields['{}:{}'.format(call_type, field)] = value
+    return fields
+
+
+def hash_events(fields):
+    """Event data by call type of the fields of the hash of an open call."""
+    call_events = {}
+    for name, value in fields.items():
+        call_type, _, field = name.decode('utf-8').partition(':')
+        call_events.setdefault(call_type, {})[field] = value.decode('utf-8')
+    return call_events
+
+
+def pair_events(events):
+    """Pair the events received with the events of the open calls.
+
+    The events are merged in the open calls and the open calls read in a
+    single transaction, the values missing do not overwrite the values of
+    the events already received. The calls completed are removed from the
+    open calls. An event received again after its call is completed can
+    complete it again, the calls are billed once (see
+    ``Bill.save_by_calls``).
+
+    Args:
+        events (list): List of dicts with the CallEvent data.
+
+    Returns:
+        dict: Start and end event data (dicts by call type) of the calls
+            completed, by call id.
+
+    """
+    calls = {}
+    for data in events:
+        call_events = calls.setdefault(data['call_id'], {})
+        merge_event(call_events.setdefault(data['call_type'], {}), data)
+    if not calls:
+        return {}
+
+    redis = get_redis_connection('default')
+    keys = {call_id: open_call_key(call_id) for call_id in calls}
+    with redis.pipeline() as pipe:
+        for call_id, call_events in calls.items():
+            pipe.hset(keys[call_id], mapping=hash_fields(call_events))
+            pipe.hgetall(keys[call_id])
+            pipe.expire(keys[call_id], const.CACHE_TIMEOUT_OPEN_CALL)
+        results = pipe.execute()
+
+    completed = {}
+    # the open calls read, after the fields set and before the expiration
+    for call_id, fields in zip(calls, results[1::3]):
+        call_events = hash_events(fields)
+        if const.CALL_TYPE_START in call_events and \
+                const.CALL_TYPE_END in call_events:
+            completed[call_id] = call_events
+
+    if completed:
+        redis.delete(*[keys[call_id] for call_id in completed])
+    return completed
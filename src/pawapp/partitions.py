@@ -0,0 +1,311 @@
+"""Monthly partitions of the call events and bill items tables.
+
+In PostgreSQL the CallEvent table is partitioned by month of the event
+datetime and the BillItem table by month of the call end datetime (the period
+of its bill), so the queries of a period read only its partition and the old
+call events are removed dropping their partitions instead of deleting rows.
+
+The rows saved before the month the tables were partitioned are kept in a
+``_legacy`` partition, the rows of that month in its own partition, and the
+rows out of the monthly partitions created (or without the datetime) in a
+``_default`` partition. The other databases keep the tables without
+partitions.
+"""
+import re
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import const
+from .helpers import add_months, period_range
+from .models import BilledCall, BillItem, CallEvent
+from .timestamps import parse_timestamp_utc
+
+
+# tables partitioned and the column of their partition key
+PARTITIONED_TABLES = (
+    (CallEvent._meta.db_table, 'call_datetime'),
+    (BillItem._meta.db_table, 'to_datetime'),
+)
+
+BOUND_PATTERN = re.compile(r'FROM \((.+)\) TO \((.+)\)')
+
+
+def partition_name(table, year, month):
+    """Name of the partition of a month of a table."""
+    return '{}_y{:04d}m{:02d}'.format(table, year, month)
+
+
+def default_partition_name(table):
+    """Name of the default partition of a table."""
+    return '{}_default'.format(table)
+
+
+def parse_bound(value):
+    """Datetime of a bound of a range partition, None if it is unbounded.
+
+    The bounds are shown in the time zone of the connection (UTC).
+    """
+    if value in ('MINVALUE', 'MAXVALUE'):
+        return None
+    value = value.strip("'")
+    return parse_timestamp_utc('{}T{}Z'.format(value[:10], value[11:19]))
+
+
+def is_partitioned(table):
+    """Check if a table is partitioned.
+
+    Args:
+        table (str): Table name.
+
+    Returns:
+        bool: False if the table is not partitioned or the database is not
+            PostgreSQL.
+
+    """
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = %s::regclass',
+            [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table):
+    """List the range partitions of a table, without the default one.
+
+    Args:
+        table (str): Table name.
+
+    Returns:
+        list: Tuples with the name, start and end datetime of each partition
+            (None if it is unbounded).
+
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) '
+            'FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass ORDER BY c.relname',
+            [table]
+        )
+        rows = cursor.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match:
+            start, end = match.groups()
+            partitions.append((name, parse_bound(start), parse_bound(end)))
+    return partitions
+
+
+def overlaps(start, end, partition_start, partition_end):
+    """Check if a range overlaps the range of a partition."""
+    return (
+        (partition_start is None or partition_start < end) and
+        (partition_end is None or start < partition_end)
+    )
+
+
+def create_partition(table, column, year, month):
+    """Create the partition of a month of a table.
+
+    The rows of the month saved in the default partition, while the month
+    had no partition, are moved to the partition created.
+
+    Args:
+        table (str): Table name.
+        column (str): Column of the partition key.
+        year (int): Year of the partition.
+        month (int): Month of the partition.
+
+    Returns:
+        str: Name of the partition.
+
+    """
+    quote_name = connection.ops.quote_name
+    name = partition_name(table, year, month)
+    names = {
+        'table': quote_name(table),
+        'partition': quote_name(name),
+        'default': quote_name(default_partition_name(table)),
+        'column': quote_name(column),
+    }
+    start, end = period_range(year, month)
+    month_rows = '{column} >= %s AND {column} < %s'.format(**names)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM {default} WHERE '.format(**names) + month_rows +
+            ' LIMIT 1',
+            [start, end]
+        )
+        move_rows = cursor.fetchone() is not None
+
+        # the default partition can't have rows of a partition created
+        if move_rows:
+            cursor.execute(
+                'ALTER TABLE {table} DETACH PARTITION {default}'.format(
+                    **names
+                )
+            )
+        cursor.execute(
+            'CREATE TABLE {partition} PARTITION OF {table} '
+            'FOR VALUES FROM (%s) TO (%s)'.format(**names),
+            [start, end]
+        )
+        if move_rows:
+            cursor.execute(
+                'WITH moved AS (DELETE FROM {default} WHERE '.format(**names) +
+                month_rows +
+                ' RETURNING *) INSERT INTO {table} SELECT * FROM moved'.format(
+                    **names
+                ),
+                [start, end]
+            )
+            cursor.execute(
+                'ALTER TABLE {table} ATTACH PARTITION {default} '
+                'DEFAULT'.format(**names)
+            )
+
+    return name
+
+
+def create_partitions(months_ahead=const.PARTITION_MONTHS_AHEAD):
+    """Create the partitions of the current month and the next ones.
+
+    The months that already have a partition are skipped, so it can be run
+    again safely.
+
+    Args:
+        months_ahead (int, optional): Number of months after the current one.
+
+    Returns:
+        list: Names of the partitions created.
+
+    """
+    today = timezone.now()
+    created = []
+    for table, column in PARTITIONED_TABLES:
+        if not is_partitioned(table):
+            continue
+
+        partitions = list_partitions(table)
+        for months in range(months_ahead + 1):
+            year, month = add_months(today.year, today.month, months)
+            start, end = period_range(year, month)
+            if any(overlaps(start, end, partition_start, partition_end)
+                   for _, partition_start, partition_end in partitions):
+                continue
+            created.append(create_partition(table, column, year, month))
+
+    return created
+
+
+def unbilled_calls(partition):
+    """Count the calls of a partition of events with both events not billed.
+
+    The other event of each call is read only in the window of
+    ``CALL_MAX_DURATION`` around the event, so the other partitions are not
+    scanned.
+
+    Args:
+        partition (str): Name of the partition of the CallEvent table.
+
+    Returns:
+        int: Number of calls.
+
+    """
+    quote_name = connection.ops.quote_name
+    window = timedelta(seconds=const.CALL_MAX_DURATION)
+    sql = (
+        'SELECT COUNT(DISTINCT e.{call_id}) FROM {partition} e '
+        'WHERE EXISTS ('
+        'SELECT 1 FROM {events} o '
+        'WHERE o.{call_id} = e.{call_id} AND o.{call_type} <> e.{call_type} '
+        'AND o.{call_datetime} BETWEEN '
+        'e.{call_datetime} - %s AND e.{call_datetime} + %s'
+        ') AND NOT EXISTS ('
+        'SELECT 1 FROM {billed} b WHERE b.{call_id} = e.{call_id}'
+        ')'
+    ).format(
+        partition=quote_name(partition),
+        events=quote_name(CallEvent._meta.db_table),
+        billed=quote_name(BilledCall._meta.db_table),
+        call_id=quote_name('call_id'),
+        call_type=quote_name('call_type'),
+        call_datetime=quote_name('call_datetime'),
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [window, window])
+        return cursor.fetchone()[0]
+
+
+def remove_call_event_partitions(
+        retention_months=const.CALL_EVENT_RETENTION_MONTHS, archive=False,
+        force=False):
+    """Remove the partitions of the call events kept longer than retention.
+
+    The partitions ended at least ``retention_months`` months before the
+    current month are removed once all their calls are billed. The events
+    without the other event of the call are removed too, they can't be
+    billed anymore. The calls of the partitions are removed from the
+    BilledCall table in the same transaction: without their events they
+    can't be billed again, so the table keeps only the calls of the
+    partitions kept.
+
+    Args:
+        retention_months (int, optional): Months the partitions are kept
+            after they end.
+        archive (bool, optional): Detach the partitions from the table,
+            keeping them as tables to be archived, instead of dropping them.
+        force (bool, optional): Remove the partitions even if some calls
+            are not billed.
+
+    Returns:
+        dict: Names of the partitions removed and number of calls not billed
+            by partition kept.
+
+    """
+    table = CallEvent._meta.db_table
+    result = {'removed': [], 'not_billed': {}}
+    if not is_partitioned(table):
+        return result
+
+    today = timezone.now()
+    cutoff, _ = period_range(
+        *add_months(today.year, today.month, -retention_months)
+    )
+    quote_name = connection.ops.quote_name
+
+    for name, _, end in list_partitions(table):
+        if end is None or end > cutoff:
+            continue
+        if not force:
+            not_billed = unbilled_calls(name)
+            if not_billed:
+                result['not_billed'][name] = not_billed
+                continue
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM {billed} WHERE {call_id} IN ('
+                'SELECT {call_id} FROM {partition})'.format(
+                    billed=quote_name(BilledCall._meta.db_table),
+                    partition=quote_name(name),
+                    call_id=quote_name('call_id'),
+                )
+            )
+            cursor.execute('ALTER TABLE {} DETACH PARTITION {}'.format(
+                quote_name(table), quote_name(name)
+            ))
+            if not archive:
+                cursor.execute('DROP TABLE {}'.format(quote_name(name)))
+        result['removed'].append(name)
+
+    return result
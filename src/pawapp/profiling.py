@@ -0,0 +1,284 @@
+"""Sampled profiling of the requests and jobs.
+
+A sample of the requests of the API resources (``PROFILING_VIEWS``) and of
+the jobs saving the call events are run with cProfile and tracemalloc, and
+the dumps are written in ``PROFILING_DIR``: the ``.prof`` file with the
+profile (read by ``pstats``) and a ``.json`` file with the parameters of the
+request or job, the time spent and the lines that allocated most memory.
+
+The profiling is disabled by default. Set ``PROFILING_SAMPLE_RATE`` in the
+settings to the fraction of the requests and jobs profiled (like ``0.01``),
+and ``PROFILING_MIN_DURATION`` to keep only the dumps of the slow ones. The
+requests and jobs not sampled only cost a random number, and only one of
+them is profiled at a time in each process.
+
+The dumps of all the processes are aggregated by the ``profile_report``
+command.
+"""
+import cProfile
+import datetime
+import functools
+import glob
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from . import const
+
+
+logger = logging.getLogger(__name__)
+
+# one profile at a time by process, cProfile and tracemalloc are global
+profile_lock = threading.Lock()
+
+dump_numbers = itertools.count()
+
+
+def sampled():
+    """Check if the current request or job should be profiled."""
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+class Profile:
+    """Profile of a block with cProfile and tracemalloc.
+
+    The dump is written when the block ends, if it took at least
+    ``PROFILING_MIN_DURATION`` seconds. If other block is being profiled by
+    the process, this one is not.
+
+    Args:
+        kind (str): Kind of the block profiled (``request`` or ``job``).
+        name (str): Name of the view or job.
+        params (dict): Parameters of the request or job.
+
+    """
+
+    def __init__(self, kind, name, params):
+        self.kind = kind
+        self.name = name
+        self.params = params
+        self.profiler = None
+        # memory traced by this profile, not by other tool
+        self.tracing = False
+        self.started = None
+        self.elapsed = None
+
+    def __enter__(self):
+        if not profile_lock.acquire(blocking=False):
+            return self
+        self.tracing = not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # other profiler is running in this process
+            self._stop()
+            return self
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is None:
+            return
+        self.profiler.disable()
+        self.elapsed = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        self._stop()
+
+        if self.elapsed < settings.PROFILING_MIN_DURATION:
+            return
+        try:
+            self.dump(snapshot, peak)
+        except OSError:
+            logger.exception('Could not write the profile of %s.', self.name)
+
+    def _stop(self):
+        if self.tracing:
+            tracemalloc.stop()
+        profile_lock.release()
+
+    def dump(self, snapshot, peak):
+        """Write the profile and its data in the directory of the dumps.
+
+        Returns:
+            str: Path of the profile, without the extension.
+
+        """
+        os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+        path = os.path.join(settings.PROFILING_DIR, '{}-{}-{}-{}-{}'.format(
+            self.kind, self.name,
+            datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S'),
+            os.getpid(), next(dump_numbers)
+        ))
+
+        self.profiler.dump_stats(path + '.prof')
+        allocations = [
+            {
+                'line': str(stat.traceback),
+                'size_kib': stat.size / 1024.0,
+                'count': stat.count,
+            }
+            for stat in snapshot.statistics('lineno')[
+                :const.PROFILING_ALLOCATIONS
+            ]
+        ]
+        with open(path + '.json', 'w') as data_file:
+            json.dump({
+                'kind': self.kind,
+                'name': self.name,
+                'params': self.params,
+                'elapsed': self.elapsed,
+                'peak_kib': peak / 1024.0,
+                'allocations': allocations,
+            }, data_file, indent=2, default=str)
+        return path
+
+
+class ProfilingMiddleware:
+    """Profile a sample of the requests of the API resources.
+
+    The view is resolved only for the requests sampled, so the others cost
+    only a random number. The bills streamed are profiled only until the
+    response starts.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sampled():
+            return self.get_response(request)
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return self.get_response(request)
+        name = getattr(match.func, '__name__', '')
+        if name not in const.PROFILING_VIEWS:
+            return self.get_response(request)
+
+        params = {
+            'method': request.method,
+            'path': request.path,
+            'query': dict(request.GET.lists()),
+            'kwargs': match.kwargs,
+            'content_length': request.META.get('CONTENT_LENGTH'),
+        }
+        with Profile('request', name, params):
+            response = self.get_response(request)
+            params['status'] = response.status_code
+        return response
+
+
+def describe(value):
+    """Value of a job argument kept in the dump, lists only by length."""
+    if isinstance(value, (list, tuple)):
+        return '<{} items>'.format(len(value))
+    return value
+
+
+def profile_job(func):
+    """Profile a sample of the runs of a job.
+
+    Used below the ``job`` decorator, so the function of the jobs enqueued
+    is the one profiled.
+    """
+    @functools.wraps(func)
+    def profiled(*args, **kwargs):
+        if not sampled():
+            return func(*args, **kwargs)
+
+        params = {
+            'args': [describe(arg) for arg in args],
+            'kwargs': {key: describe(value) for key, value in kwargs.items()},
+        }
+        with Profile('job', func.__name__, params):
+            return func(*args, **kwargs)
+    return profiled
+
+
+def load_dumps(directory, kind=None, name=None):
+    """Load the dumps of a directory.
+
+    Args:
+        directory (str): Directory of the dumps.
+        kind (str, optional): Only the dumps of this kind.
+        name (str, optional): Only the dumps of this view or job.
+
+    Returns:
+        list: Tuples with the path of the profile and its data, sorted by the
+            time spent, the slowest first.
+
+    """
+    dumps = []
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        profile_path = path[:-len('.json')] + '.prof'
+        if not os.path.exists(profile_path):
+            continue
+        try:
+            with open(path) as data_file:
+                data = json.load(data_file)
+        except ValueError:
+            continue
+        if kind and data.get('kind') != kind:
+            continue
+        if name and data.get('name') != name:
+            continue
+        dumps.append((profile_path, data))
+    dumps.sort(key=lambda dump: dump[1].get('elapsed', 0), reverse=True)
+    return dumps
+
+
+def aggregate_stats(dumps, stream=None):
+    """Profile stats of all the dumps together.
+
+    Args:
+        dumps (list): Dumps loaded by ``load_dumps``.
+        stream (file, optional): Stream the stats are printed to.
+
+    Returns:
+        pstats.Stats: Stats of the functions in all the dumps, None if there
+            are no dumps.
+
+    """
+    if not dumps:
+        return None
+    stats = pstats.Stats(dumps[0][0], stream=stream)
+    for profile_path, _ in dumps[1:]:
+        stats.add(profile_path)
+    return stats
+
+
+def aggregate_allocations(dumps):
+    """Memory allocated by line in all the dumps.
+
+    Returns:
+        list: Tuples of the line and its total size (in KiB) and count of
+            allocations, the largest first.
+
+    """
+    lines = {}
+    for _, data in dumps:
+        for allocation in data.get('allocations', []):
+            size, count = lines.get(allocation['line'], (0, 0))
+            lines[allocation['line']] = (
+                size + allocation['size_kib'], count + allocation['count']
+            )
+    return sorted(
+        ((line, size, count) for line, (size, count) in lines.items()),
+        key=lambda allocation: allocation[1], reverse=True
+    )
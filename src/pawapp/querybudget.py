@@ -0,0 +1,117 @@
+"""Budget of the database queries of a block or function.
+
+The queries run in the block are counted with a wrapper of the database
+connection, so the billing paths can't silently add round trips. A block is
+over its budget if it runs more queries than the max or the same query more
+than once (the same SQL with other parameters, like the queries of a loop).
+The transaction statements are not checked for repetition.
+
+``QUERY_BUDGET_MODE`` in the settings sets what happens then: ``raise`` (in
+the tests and benchmarks) raises ``QueryBudgetExceededException``, ``log``
+logs a warning with the queries repeated and ``off`` (the default) does not
+count the queries at all.
+"""
+import functools
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+
+from .exceptions import QueryBudgetExceededException
+
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+
+def budget_mode():
+    return getattr(settings, 'QUERY_BUDGET_MODE', 'off')
+
+
+class QueryBudget:
+    """Count the queries of a block and check them against the budget.
+
+    Can be used as a context manager or a decorator.
+
+    Args:
+        max_queries (int): Max number of queries of the block.
+        name (str, optional): Name of the block in the reports, the name of
+            the function decorated by default.
+        using (str, optional): Alias of the database.
+
+    """
+
+    def __init__(self, max_queries, name=None, using='default'):
+        self.max_queries = max_queries
+        self.name = name
+        self.using = using
+        self.mode = 'off'
+        self.queries = []
+        self.wrapper = None
+
+    def __enter__(self):
+        self.mode = budget_mode()
+        if self.mode == 'off':
+            return self
+        self.queries = []
+        self.wrapper = connections[self.using].execute_wrapper(self.record)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        if self.wrapper is None:
+            return
+        self.wrapper.__exit__(exc_type, *exc_info)
+        self.wrapper = None
+        # the errors of the block are not hidden by the budget
+        if exc_type is None:
+            self.check()
+
+    def __call__(self, func):
+        name = self.name or func.__qualname__
+
+        @functools.wraps(func)
+        def budgeted(*args, **kwargs):
+            with QueryBudget(self.max_queries, name, self.using):
+                return func(*args, **kwargs)
+        budgeted.query_budget = self
+        return budgeted
+
+    def record(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Queries run more than once, without the transaction statements.
+
+        Returns:
+            list: Tuples of the SQL and the number of times it was run.
+
+        """
+        counts = Counter(
+            sql for sql in self.queries
+            if not sql.lstrip().upper().startswith(TRANSACTION_STATEMENTS)
+        )
+        return [(sql, count) for sql, count in counts.items() if count > 1]
+
+    def check(self):
+        """Raise or log if the queries are over the budget."""
+        repeated = self.repeated()
+        if len(self.queries) <= self.max_queries and not repeated:
+            return
+
+        message = 'Query budget of {} exceeded: {} queries, max {}.'.format(
+            self.name, len(self.queries), self.max_queries
+        )
+        for sql, count in repeated:
+            message += '\nRepeated {} times: {}'.format(count, sql)
+        if self.mode == 'raise':
+            raise QueryBudgetExceededException(message, self.queries)
+        logger.warning(message)
+
+
+def query_budget(max_queries, name=None, using='default'):
+    """Budget of the queries of a block or function (see ``QueryBudget``)."""
+    return QueryBudget(max_queries, name, using)
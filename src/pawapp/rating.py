@@ -0,0 +1,91 @@
+"""Rating engine to calculate the value and duration of calls.
+
+The functions of this module work only with the values received, so calls
+can be priced without accessing the database or the cache.
+"""
+from . import exceptions
+from .timeline import RateTimeline, compile_timeline
+
+
+def compile_rates(rates):
+    """Compile the rates table in a timeline.
+
+    Args:
+        rates (iterable|RateTimeline): Tuples of from_time, to_time,
+            standing_rate and minute_rate or a timeline already compiled.
+
+    Returns:
+        RateTimeline: Compiled timeline.
+
+    Raises:
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    if isinstance(rates, RateTimeline):
+        return rates
+    if not rates:
+        raise exceptions.RatesNotFoundException()
+    return compile_timeline(tuple(rates))
+
+
+def validate_interval(start_datetime, end_datetime):
+    """Validate the start and end datetime of a call.
+
+    Args:
+        start_datetime (datetime): Start datetime of the call.
+        end_datetime (datetime): End datetime of the call.
+
+    Raises:
+        InvalidCallPairException: Raises if start or end datetime are missing.
+        InvalidCallIntervalException: Raises if end datetime is less than
+            start datetime.
+    """
+    if not start_datetime or not end_datetime:
+        raise exceptions.InvalidCallPairException()
+    if end_datetime <= start_datetime:
+        raise exceptions.InvalidCallIntervalException()
+
+
+def rate_call(start_datetime, end_datetime, rates):
+    """Calculate the value and duration charged for a call.
+
+    Args:
+        start_datetime (datetime): Start datetime of the call.
+        end_datetime (datetime): End datetime of the call.
+        rates (iterable|RateTimeline): Rates table or compiled timeline.
+
+    Returns:
+        tuple: Two values representing the total value and duration
+            calculated.
+
+    Raises:
+        InvalidCallPairException: Raises if start or end datetime are missing.
+        InvalidCallIntervalException: Raises if end datetime is less than
+            start datetime.
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    validate_interval(start_datetime, end_datetime)
+    return compile_rates(rates).price(start_datetime, end_datetime)
+
+
+def rate_calls(intervals, rates):
+    """Calculate the value and duration charged for many calls.
+
+    The rates are compiled only once for all the calls.
+
+    Args:
+        intervals (iterable): Tuples of start and end datetime of the calls.
+        rates (iterable|RateTimeline): Rates table or compiled timeline.
+
+    Yields:
+        tuple: Total value and duration calculated for each call.
+
+    Raises:
+        InvalidCallPairException: Raises if start or end datetime are missing.
+        InvalidCallIntervalException: Raises if end datetime is less than
+            start datetime.
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    rate_timeline = compile_rates(rates)
+    for start_datetime, end_datetime in intervals:
+        validate_interval(start_datetime, end_datetime)
+        yield rate_timeline.price(start_datetime, end_datetime)
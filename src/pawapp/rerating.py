@@ -0,0 +1,238 @@
+"""Bulk re-rating of the calls of a billing period.
+
+The calls are priced with NumPy array operations over the compiled rates
+timeline, so a whole period can be rated again after the rates change.
+"""
+import multiprocessing
+from decimal import Decimal
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import F
+
+from . import const, exceptions, rating
+from .models import Bill, BillItem, ConnectionRate
+from .timeline import SECONDS_PER_DAY
+
+
+def to_cents(values):
+    """Convert money values to an array of integer cents.
+
+    Args:
+        values (iterable): Decimal values.
+
+    Returns:
+        numpy.ndarray: Values in cents.
+
+    """
+    return np.array(
+        [int((value * 100).to_integral_value()) for value in values],
+        dtype=np.int64
+    )
+
+
+def parse_timestamps(values):
+    """Convert timestamps in the API format to a datetime64 array.
+
+    Args:
+        values (iterable): Timestamps as string (see TIMESTAMP_FORMAT).
+
+    Returns:
+        numpy.ndarray: Array of datetime64 values.
+
+    """
+    # without the timezone designator, numpy parses them as UTC
+    return np.array([value[:19] for value in values], dtype='datetime64[s]')
+
+
+def price_arrays(rates, starts, ends):
+    """Calculate the value and duration of many calls with array operations.
+
+    The result is the same of ``RateTimeline.price`` for each call.
+
+    Args:
+        rates (iterable|RateTimeline): Rates table or compiled timeline.
+        starts (numpy.ndarray): Start datetime64 of the calls.
+        ends (numpy.ndarray): End datetime64 of the calls.
+
+    Returns:
+        tuple: Arrays of values (in cents) and durations (in seconds).
+
+    Raises:
+        InvalidCallIntervalException: Raises if any end datetime is less than
+            its start datetime.
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    rate_timeline = rating.compile_rates(rates)
+    starts = starts.astype('datetime64[s]').astype(np.int64)
+    ends = ends.astype('datetime64[s]').astype(np.int64)
+    if np.any(ends <= starts):
+        raise exceptions.InvalidCallIntervalException()
+
+    boundaries = np.array(rate_timeline.boundaries, dtype=np.int64)
+    lengths = np.array(rate_timeline.lengths, dtype=np.int64)
+    standing_rates = to_cents(rate_timeline.standing_rates)
+    minute_rates = to_cents(rate_timeline.minute_rates)
+    size = len(boundaries)
+
+    # accumulated charges of the full segments in the day
+    charges = np.concatenate(([0], np.cumsum(lengths // 60 * minute_rates)))
+    day_charge = charges[-1]
+
+    def locate(seconds):
+        """Global index and start of the segment for each value."""
+        cycles, offsets = np.divmod(seconds - boundaries[0], SECONDS_PER_DAY)
+        index = np.searchsorted(
+            boundaries, offsets + boundaries[0], side='right'
+        ) - 1
+        segment_start = seconds - offsets - boundaries[0] + boundaries[index]
+        return cycles * size + index, segment_start
+
+    def charge_until(index):
+        """Charge of all the full segments before the global indexes."""
+        cycles, index = np.divmod(index, size)
+        return cycles * day_charge + charges[index]
+
+    start_index, start_segment = locate(starts)
+    end_index, end_segment = locate(ends)
+    start_position = start_index % size
+    end_position = end_index % size
+    start_minute_rate = minute_rates[start_position]
+
+    same_segment = start_index == end_index
+    segment_end = start_segment + lengths[start_position]
+    crossing_values = (
+        (segment_end - starts) // 60 * start_minute_rate +
+        charge_until(end_index) - charge_until(start_index + 1) +
+        (ends - end_segment) // 60 * minute_rates[end_position]
+    )
+    values = standing_rates[start_position] + np.where(
+        same_segment,
+        (ends - starts) // 60 * start_minute_rate,
+        crossing_values
+    )
+
+    return values, ends - starts
+
+
+def rerate_shard(year, month, rates, shard=0, shards=1,
+                 chunk_size=const.RERATE_CHUNK_SIZE):
+    """Rate again the bill items of a shard of the bills of a period.
+
+    The bills are split in shards by id, so each shard has its own bills
+    and items and the shards can be rated in parallel without sharing rows.
+    The items are processed in chunks and only the changed ones are saved,
+    cleaning the cached calls of their bills. The totals of the bills are
+    aggregated again from their items at the end, so the process can be run
+    again safely if interrupted.
+
+    Args:
+        year (int): Year of the period.
+        month (int): Month of the period.
+        rates (iterable|RateTimeline): Rates table or compiled timeline.
+        shard (int, optional): Index of the shard rated.
+        shards (int, optional): Number of shards.
+        chunk_size (int, optional): Number of items rated at once.
+
+    Returns:
+        dict: Number of items rated, items updated and bills updated.
+
+    Raises:
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    rate_timeline = rating.compile_rates(rates)
+
+    items = BillItem.objects.filter(
+        BillItem.period_filter(year, month),
+        bill__year=year, bill__month=month
+    )
+    if shards > 1:
+        items = items.annotate(shard=F('bill_id') % shards).filter(shard=shard)
+    items = items.order_by('id')
+    rated, updated, last_id = 0, 0, 0
+
+    while True:
+        chunk = list(items.filter(id__gt=last_id).values_list(
+            'id', 'bill_id', 'from_timestamp', 'to_timestamp', 'duration',
+            'amount', 'amount_cents'
+        )[:chunk_size])
+        if not chunk:
+            break
+
+        (ids, bill_ids, from_timestamps, to_timestamps, durations,
+         amounts, amounts_cents) = zip(*chunk)
+        values, new_durations = price_arrays(
+            rate_timeline,
+            parse_timestamps(from_timestamps),
+            parse_timestamps(to_timestamps)
+        )
+
+        # items saved before the cents column are saved with it too
+        changed = np.flatnonzero(
+            (values != to_cents(amounts)) |
+            (new_durations != np.array(durations, dtype=np.int64)) |
+            np.array([cents is None for cents in amounts_cents], dtype=bool)
+        )
+        changed_items = [
+            BillItem(
+                id=ids[index],
+                duration=int(new_durations[index]),
+                amount=Decimal(int(values[index])).scaleb(-2),
+                amount_cents=int(values[index])
+            )
+            for index in changed
+        ]
+        with transaction.atomic():
+            BillItem.objects.bulk_update(
+                changed_items, ['duration', 'amount', 'amount_cents'],
+                batch_size=1000
+            )
+        # the bulk update does not send signals to clean the cached bills
+        Bill.clean_cached_data({bill_ids[index] for index in changed})
+
+        rated += len(chunk)
+        updated += len(changed_items)
+        last_id = ids[-1]
+
+    bills = Bill.update_totals(year, month, shard=shard, shards=shards)
+
+    return {'rated': rated, 'updated': updated, 'bills': bills}
+
+
+def rerate_period(year, month, processes=1,
+                  chunk_size=const.RERATE_CHUNK_SIZE):
+    """Rate again all the bill items of a period with the current rates.
+
+    With more than one process, the bills are split in one shard by process
+    and each process rates the items of its shard.
+
+    Args:
+        year (int): Year of the period.
+        month (int): Month of the period.
+        processes (int, optional): Number of processes rating the items.
+        chunk_size (int, optional): Number of items rated at once.
+
+    Returns:
+        dict: Number of items rated, items updated and bills updated.
+
+    Raises:
+        RatesNotFoundException: Raises if there are no rates.
+    """
+    rate_timeline = ConnectionRate.rate_timeline()
+    if processes <= 1:
+        return rerate_shard(year, month, rate_timeline, chunk_size=chunk_size)
+
+    # the processes can't share the database connections of this one
+    connections.close_all()
+
+    arguments = [
+        (year, month, rate_timeline, shard, processes, chunk_size)
+        for shard in range(processes)
+    ]
+    with multiprocessing.get_context('fork').Pool(processes) as pool:
+        results = pool.starmap(rerate_shard, arguments)
+
+    return {
+        key: sum(result[key] for result in results)
+        for key in ('rated', 'updated', 'bills')
+    }
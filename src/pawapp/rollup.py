@@ -0,0 +1,53 @@
+"""Rollup of the bill items into the totals of their bills.
+
+The billing of a call only appends its BillItem, so the calls of a number
+billed at the same time do not update (and wait for) the same Bill row. The
+items not rolled up yet are added to the totals of their bills in batches,
+with a single update by bill, by a process running the rollup continuously
+(see the command ``rollup_bills``).
+
+The items are taken and marked in the same transaction that updates the
+totals, so each item is added once even with many processes running the
+rollup, and the items of the transactions not committed yet are taken by the
+next rollups.
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from . import const
+from .models import Bill, BillItem
+
+
+def rollup_items(batch_size=const.ROLLUP_BATCH_SIZE):
+    """Add a batch of the items not rolled up to the totals of their bills.
+
+    The items locked by another rollup are skipped.
+
+    Args:
+        batch_size (int, optional): Max number of items added.
+
+    Returns:
+        dict: Number of items rolled up and bills updated.
+
+    """
+    with transaction.atomic():
+        item_ids = list(
+            BillItem.objects.filter(rolled_up=False)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not item_ids:
+            return {'items': 0, 'bills': 0}
+
+        items = BillItem.objects.filter(id__in=item_ids)
+        totals = {
+            row['bill_id']: (row['duration'], row['amount'])
+            for row in items.order_by().values('bill_id').annotate(
+                duration=Sum('duration'), amount=Sum('amount')
+            )
+        }
+        items.update(rolled_up=True)
+        bills = Bill.add_totals(totals)
+
+    return {'items': len(item_ids), 'bills': bills}
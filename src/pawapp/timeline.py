@@ -0,0 +1,202 @@
+"""Compiled timeline of the connection rates.
+
+The rates configured in the admin are ranges of time in the day. This module
+compiles them once into a sorted list of boundaries (seconds of the day) with
+the respective standing and minute rates, so a call can be priced locating
+its start and end segments by bisection, whatever the number of days it
+spans.
+"""
+from bisect import bisect_right
+from decimal import Decimal
+from functools import lru_cache
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+NO_RATE = Decimal('0')
+
+
+def seconds_of_day(value):
+    """Seconds elapsed since the midnight for a time or datetime value.
+
+    Args:
+        value (time|datetime): Time value.
+
+    Returns:
+        int: Seconds of the day.
+
+    """
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def absolute_seconds(value):
+    """Seconds elapsed since the start of the calendar for a datetime value.
+
+    Args:
+        value (datetime): Datetime value.
+
+    Returns:
+        int: Absolute seconds.
+
+    """
+    return value.toordinal() * SECONDS_PER_DAY + seconds_of_day(value)
+
+
+def charge_minutes(seconds, minute_rate):
+    """Charge the full minutes elapsed in seconds with minute_rate.
+
+    Args:
+        seconds (int): Seconds elapsed.
+        minute_rate (Decimal): Rate charged by minute.
+
+    Returns:
+        Decimal: Value charged.
+
+    """
+    return round(Decimal((seconds // 60) * minute_rate), 2)
+
+
+def _rate_covers(from_seconds, to_seconds, point):
+    """Check if the rate range of time covers the point of the day."""
+    if from_seconds < to_seconds:
+        return from_seconds <= point < to_seconds
+    # ranges crossing the midnight (or the whole day)
+    return point >= from_seconds or point < to_seconds
+
+
+class RateTimeline:
+    """Immutable timeline of the rates along the day.
+
+    The day is split in segments between every ``from_time`` and ``to_time``
+    of the rates. A segment crossing the midnight is kept as a single segment,
+    so its minutes are charged as a whole. Periods of the day not covered by
+    any rate are not charged.
+
+    Args:
+        rates (iterable): Tuples of from_time, to_time, standing_rate and
+            minute_rate.
+
+    """
+
+    __slots__ = (
+        'boundaries', 'lengths', 'standing_rates', 'minute_rates',
+        '_charges', '_day_charge'
+    )
+
+    def __init__(self, rates):
+        rates = [
+            (seconds_of_day(from_time), seconds_of_day(to_time),
+             standing_rate, minute_rate)
+            for from_time, to_time, standing_rate, minute_rate in rates
+        ]
+        if not rates:
+            raise ValueError('At least one rate is required.')
+
+        boundaries = sorted(
+            {rate[0] for rate in rates} | {rate[1] for rate in rates}
+        )
+        # the last segment ends in the first boundary of the next day
+        ends = boundaries[1:] + [boundaries[0] + SECONDS_PER_DAY]
+
+        lengths, standing_rates, minute_rates = [], [], []
+        for start, end in zip(boundaries, ends):
+            standing_rate, minute_rate = NO_RATE, NO_RATE
+            for from_seconds, to_seconds, standing, minute in rates:
+                if _rate_covers(from_seconds, to_seconds, start):
+                    standing_rate, minute_rate = standing, minute
+                    break
+            lengths.append(end - start)
+            standing_rates.append(standing_rate)
+            minute_rates.append(minute_rate)
+
+        # accumulated charges of the full segments in the day
+        charges = [NO_RATE]
+        for length, minute_rate in zip(lengths, minute_rates):
+            charges.append(charges[-1] + charge_minutes(length, minute_rate))
+
+        self.boundaries = tuple(boundaries)
+        self.lengths = tuple(lengths)
+        self.standing_rates = tuple(standing_rates)
+        self.minute_rates = tuple(minute_rates)
+        self._charges = tuple(charges)
+        self._day_charge = charges[-1]
+
+    def __len__(self):
+        return len(self.boundaries)
+
+    def locate(self, seconds):
+        """Locate the segment for an absolute seconds value.
+
+        Args:
+            seconds (int): Absolute seconds (see ``absolute_seconds``).
+
+        Returns:
+            tuple: Global index of the segment (counting from the start of
+                the calendar) and its absolute start in seconds.
+
+        """
+        first = self.boundaries[0]
+        cycle, offset = divmod(seconds - first, SECONDS_PER_DAY)
+        index = bisect_right(self.boundaries, offset + first) - 1
+        segment_start = seconds - offset - first + self.boundaries[index]
+        return cycle * len(self.boundaries) + index, segment_start
+
+    def _charge_until(self, index):
+        """Charge of all the full segments before the global index."""
+        cycles, index = divmod(index, len(self.boundaries))
+        return cycles * self._day_charge + self._charges[index]
+
+    def price(self, start_datetime, end_datetime):
+        """Calculate the value and duration of a call.
+
+        The standing rate charged is the one of the segment where the call
+        started. Each segment charges its full minutes with its minute rate.
+
+        Args:
+            start_datetime (datetime): Start datetime of the call.
+            end_datetime (datetime): End datetime of the call.
+
+        Returns:
+            tuple: Total value and duration (in seconds) of the call.
+
+        """
+        start = absolute_seconds(start_datetime)
+        end = absolute_seconds(end_datetime)
+
+        start_index, start_segment = self.locate(start)
+        end_index, end_segment = self.locate(end)
+        size = len(self.boundaries)
+
+        start_position = start_index % size
+        value = self.standing_rates[start_position]
+        minute_rate = self.minute_rates[start_position]
+
+        if start_index == end_index:
+            value += charge_minutes(end - start, minute_rate)
+        else:
+            segment_end = start_segment + self.lengths[start_position]
+            value += charge_minutes(segment_end - start, minute_rate)
+            value += (
+                self._charge_until(end_index) -
+                self._charge_until(start_index + 1)
+            )
+            value += charge_minutes(
+                end - end_segment, self.minute_rates[end_index % size]
+            )
+
+        return value, end - start
+
+
+@lru_cache(maxsize=8)
+def compile_timeline(rates):
+    """Compile the rates in a timeline, reusing already compiled ones.
+
+    Args:
+        rates (tuple): Tuples of from_time, to_time, standing_rate and
+            minute_rate.
+
+    Returns:
+        RateTimeline: Compiled timeline.
+
+    """
+    return RateTimeline(rates)
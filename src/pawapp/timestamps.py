@@ -0,0 +1,69 @@
+"""Parser of the timestamps received by the API.
+
+The timestamps have the fixed format ``%Y-%m-%dT%H:%M:%SZ`` (see
+TIMESTAMP_FORMAT), so each part is read from its fixed position instead of
+matching the format with ``datetime.strptime``. The start and end timestamps
+of a call are parsed when the events are validated and again when the call is
+billed, so the last values parsed are kept in an LRU cache.
+"""
+import datetime
+from functools import lru_cache
+
+from . import const
+
+
+# every digit of a valid timestamp is masked to 0 to compare its format
+_DIGITS_MASK = str.maketrans('123456789', '000000000')
+_FORMAT_MASK = '0000-00-00T00:00:00Z'
+
+UTC = datetime.timezone.utc
+
+
+def _parse(value):
+    """Parse a timestamp without the cache."""
+    if not isinstance(value, str) or \
+            value.translate(_DIGITS_MASK) != _FORMAT_MASK:
+        raise ValueError('Invalid timestamp: {!r}'.format(value))
+
+    # datetime validates the ranges of the values (month, day, hour...)
+    return datetime.datetime(
+        int(value[0:4]), int(value[5:7]), int(value[8:10]),
+        int(value[11:13]), int(value[14:16]), int(value[17:19])
+    )
+
+
+@lru_cache(maxsize=const.TIMESTAMP_CACHE_SIZE)
+def parse_timestamp(value):
+    """Parse a timestamp in the API format to a naive datetime in UTC.
+
+    The result is the same of ``datetime.strptime(value, TIMESTAMP_FORMAT)``
+    for timestamps with all the digits, e.g. ``2018-03-01T10:00:00Z``.
+
+    Args:
+        value (str): Timestamp.
+
+    Returns:
+        datetime: Datetime value.
+
+    Raises:
+        ValueError: Raises if the timestamp has an invalid format or value.
+
+    """
+    return _parse(value)
+
+
+def parse_timestamp_utc(value):
+    """Parse a timestamp in the API format to an aware datetime in UTC.
+
+    Args:
+        value (str): Timestamp.
+
+    Returns:
+        datetime: Datetime value.
+
+    Raises:
+        ValueError: Raises if the timestamp has an invalid format or value.
+
+    """
+    return parse_timestamp(value).replace(tzinfo=UTC)
+
@@ -0,0 +1,197 @@
+"""Validation of the CallEvent data received by the API.
+
+The rules of each field are compiled once from the CallEvent model, so the
+events are validated without building a ``CallEventForm`` for each one. The
+errors and their messages are the same of the form.
+"""
+from django import forms
+from django.core import validators
+
+from . import const
+from .helpers import map_dict_fields
+from .models import CallEvent
+from .timestamps import parse_timestamp
+
+
+EMPTY_VALUES = validators.EMPTY_VALUES
+
+MESSAGE_REQUIRED = forms.Field.default_error_messages['required']
+MESSAGE_INVALID_CHOICE = forms.ChoiceField.default_error_messages[
+    'invalid_choice'
+]
+MESSAGE_MAX_LENGTH = validators.MaxLengthValidator.message
+MESSAGE_NULL_CHARACTERS = validators.ProhibitNullCharactersValidator.message
+
+PHONE_FIELDS = ('source_number', 'destination_number')
+
+
+class FieldRule:
+    """Compiled rules of a CallEvent field.
+
+    Args:
+        name (str): Field name in the model.
+        api_name (str): Field name in the API.
+        required (bool): Should the field have a value.
+        max_length (int): Max length of the value.
+        choices (frozenset, optional): Values accepted, any value if None.
+
+    """
+
+    __slots__ = ('name', 'api_name', 'required', 'max_length', 'choices')
+
+    def __init__(self, name, api_name, required, max_length, choices=None):
+        self.name = name
+        self.api_name = api_name
+        self.required = required
+        self.max_length = max_length
+        self.choices = choices
+
+    @classmethod
+    def from_model(cls, name, api_name):
+        """Compile the rules of a field of the CallEvent model."""
+        field = CallEvent._meta.get_field(name)
+        choices = None
+        if field.choices:
+            choices = frozenset(str(value) for value, _ in field.choices)
+        return cls(name, api_name, not field.blank, field.max_length, choices)
+
+    def clean(self, value, errors):
+        """Clean the value of the field as done by the form field.
+
+        Args:
+            value: Value received.
+            errors (list): List where the errors of the value are added.
+
+        Returns:
+            str: Cleaned value, None if it is empty or invalid.
+
+        """
+        if self.choices is not None:
+            value = '' if value in EMPTY_VALUES else str(value)
+        elif value not in EMPTY_VALUES:
+            value = str(value).strip()
+
+        if value in EMPTY_VALUES:
+            if self.required:
+                errors.append(str(MESSAGE_REQUIRED))
+            return None
+
+        if self.choices is not None:
+            if value not in self.choices:
+                errors.append(str(MESSAGE_INVALID_CHOICE % {'value': value}))
+                return None
+            return value
+
+        if len(value) > self.max_length:
+            errors.append(str(MESSAGE_MAX_LENGTH % {
+                'limit_value': self.max_length,
+                'show_value': len(value),
+                'value': value,
+            }))
+        if '\x00' in value:
+            errors.append(str(MESSAGE_NULL_CHARACTERS))
+        return None if errors else value
+
+
+class CallEventValidator:
+    """Validator of the CallEvent data.
+
+    Args:
+        fields (list, optional): Field names in the model.
+        api_fields (list, optional): Field names in the API, in the same
+            order of the fields.
+
+    """
+
+    def __init__(self, fields=None, api_fields=None):
+        self.fields = fields or const.DB_FIELDS
+        self.api_fields = api_fields or const.API_FIELDS
+        self.rules = [
+            FieldRule.from_model(name, api_name)
+            for name, api_name in zip(self.fields, self.api_fields)
+        ]
+
+    def validate(self, data):
+        """Validate the data of an event, with the model field names.
+
+        The values are cleaned as done by the form (e.g. stripped), so the
+        cleaned data is the one saved.
+
+        Args:
+            data (dict): CallEvent data.
+
+        Returns:
+            tuple: Dict with the cleaned data, without the empty values, and
+                dict with the error messages by field name in the API, empty
+                if the data is valid.
+
+        """
+        cleaned_data, field_errors = {}, {}
+        for rule in self.rules:
+            errors = []
+            value = rule.clean(data.get(rule.name), errors)
+            if errors:
+                field_errors[rule.name] = errors
+            elif value is not None:
+                cleaned_data[rule.name] = value
+
+        # validate timestamp format
+        call_timestamp = cleaned_data.get('call_timestamp')
+        if call_timestamp:
+            try:
+                parse_timestamp(call_timestamp)
+            except ValueError:
+                field_errors['call_timestamp'] = [
+                    const.MESSAGE_FIELD_INVALID_FORMAT
+                ]
+
+        # validate if phone numbers is required and valid
+        call_type = cleaned_data.get('call_type')
+        for field in PHONE_FIELDS:
+            if field in field_errors:
+                continue
+            value = cleaned_data.get(field)
+            if not value:
+                if call_type == const.CALL_TYPE_START:
+                    field_errors[field] = [const.MESSAGE_FIELD_REQUIRED]
+            elif not value.isdigit() or \
+                    len(value) < const.PHONE_NUMBER_MIN_LENGTH:
+                field_errors[field] = [const.MESSAGE_FIELD_INVALID_VALUE]
+
+        return cleaned_data, {
+            rule.api_name: field_errors[rule.name]
+            for rule in self.rules if rule.name in field_errors
+        }
+
+    def validate_batch(self, lines):
+        """Validate the events of a batch, with the API field names.
+
+        The field names of each event are changed to the model field names.
+
+        Args:
+            lines (list): Tuples with the line number and the CallEvent data
+                of the line (None if the line could not be parsed).
+
+        Returns:
+            tuple: List with the cleaned data of the valid events and dict
+                with the errors by line number.
+
+        """
+        events, errors = [], {}
+        for line_number, data in lines:
+            if not isinstance(data, dict):
+                errors[line_number] = {
+                    'event': [const.MESSAGE_EVENT_INVALID_FORMAT]
+                }
+                continue
+
+            map_dict_fields(data, self.api_fields, self.fields)
+            cleaned_data, event_errors = self.validate(data)
+            if event_errors:
+                errors[line_number] = event_errors
+            else:
+                events.append(cleaned_data)
+        return events, errors
+
+
+callevent_validator = CallEventValidator()
@@ -0,0 +1,9 @@
+"""Django views module."""
+from django.http import HttpResponse
+
+from . import metrics
+
+
+def metrics_view(request):
+    """Metrics of all the processes in the Prometheus text format."""
+    return HttpResponse(metrics.collect(), content_type=metrics.CONTENT_TYPE)
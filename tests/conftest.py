@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def disable_metrics(settings):
+    """Measure nothing in the tests, except the tests of the metrics"""
+    settings.METRICS_ENABLED = False
+
+
+@pytest.fixture(autouse=True)
+def raise_over_query_budget(settings):
+    """Fail the tests running more queries than the budget"""
+    settings.QUERY_BUDGET_MODE = 'raise'
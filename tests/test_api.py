@@ -3,7 +3,7 @@ from unittest.mock import patch, Mock
 from restless.exceptions import BadRequest
 
 from pawapp.exceptions import InvalidDataException
-from pawapp.api import CallEventResource, BillResource
+from pawapp.api import CallEventResource, CallEventBatchResource, BillResource
 
 
 def test_callevent_create_without_data():
@@ -29,6 +29,49 @@ def test_call_event_create_with_bad_data(callevent_handler):
     assert bad_request
 
 
+@pytest.mark.parametrize('body,expected', [
+    (b'', []),
+    (b'[{"call_id": "1"}, {"call_id": "2"}]', [(1, {'call_id': '1'}), (2, {'call_id': '2'})]),
+    (b'{"call_id": "1"}\n\n{"call_id": "2"}', [(1, {'call_id': '1'}), (3, {'call_id': '2'})]),
+])
+def test_callevent_batch_deserialize(body, expected):
+    """Test batch endpoint body parsing"""
+    resource = CallEventBatchResource()
+    assert resource.deserialize_list(body) == expected
+
+
+@pytest.mark.parametrize('body', [b'[{"call_id": "1"},', b'\xff'])
+def test_callevent_batch_deserialize_invalid(body):
+    """Test batch endpoint with a body that can't be parsed"""
+    resource = CallEventBatchResource()
+    with pytest.raises(BadRequest):
+        resource.deserialize_list(body)
+
+
+@patch('pawapp.api.callevent_batch_handler')
+def test_callevent_batch_create(callevent_batch_handler):
+    """Test batch endpoint returning the report"""
+    handler_mock = Mock(**{'handle.return_value': {'accepted': 1}})
+    callevent_batch_handler.return_value = handler_mock
+
+    resource = CallEventBatchResource()
+    resource.data = [(1, {'call_id': '1'})]
+    assert resource.create() == {'accepted': 1}
+    callevent_batch_handler.assert_called_once_with([(1, {'call_id': '1'})])
+
+
+@patch('pawapp.api.callevent_batch_handler')
+def test_callevent_batch_create_with_bad_data(callevent_batch_handler):
+    """Test batch endpoint without valid events"""
+    handler_mock = Mock(**{'handle.side_effect': InvalidDataException({1: {}})})
+    callevent_batch_handler.return_value = handler_mock
+
+    resource = CallEventBatchResource()
+    resource.data = [(1, None)]
+    with pytest.raises(BadRequest):
+        resource.create()
+
+
 @patch('pawapp.api.bill_handler')
 def test_bill_detail_raise_exception(bill_handler):
     """Test method call raise exception"""
@@ -58,3 +101,45 @@ def test_bill_detail_valid(bill_handler):
     bill_handler.assert_called_once_with(
         {'phone_number': '321', 'month': None, 'year': None}
     )
+
+
+@patch('pawapp.api.bill_handler')
+def test_bill_detail_stream(bill_handler):
+    """Test bill streamed when requested"""
+    chunks = (chunk for chunk in ['{"calls": [', ']}'])
+    handler_mock = Mock(**{'handle.return_value': chunks})
+    bill_handler.return_value = handler_mock
+
+    resource = BillResource()
+    resource.request = Mock(GET={'stream': '1'})
+    res = resource.detail('321', '03', '2018')
+    bill_handler.assert_called_once_with(
+        {'phone_number': '321', 'month': '03', 'year': '2018', 'stream': True}
+    )
+
+    assert resource.serialize_detail(res) is chunks
+    response = resource.build_response(res)
+    assert response.streaming
+    assert b''.join(response.streaming_content) == b'{"calls": []}'
+
+
+def test_bill_build_response_not_streamed():
+    """Test bill response not streamed by default"""
+    resource = BillResource()
+    response = resource.build_response('{}')
+    assert not response.streaming
+    assert response.content == b'{}'
+
+
+@patch('pawapp.api.bill_handler')
+def test_bill_detail_page_parameters(bill_handler):
+    """Test pagination and summary parameters sent to the handler"""
+    bill_handler.return_value = Mock(**{'handle.return_value': {}})
+
+    resource = BillResource()
+    resource.request = Mock(GET={'limit': '10', 'fields': 'price', 'summary': '1', 'other': '1'})
+    resource.detail('321')
+    bill_handler.assert_called_once_with({
+        'phone_number': '321', 'month': None, 'year': None,
+        'summary': True, 'limit': '10', 'fields': 'price'
+    })
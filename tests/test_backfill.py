@@ -0,0 +1,68 @@
+"""Module to test the backfill of the datetime and cents columns"""
+import datetime
+from decimal import Decimal
+
+from unittest.mock import Mock, patch
+
+from pawapp import backfill
+from pawapp.models import BillItem
+
+
+UTC = datetime.timezone.utc
+
+
+def _queryset(chunks):
+    queryset = Mock()
+    queryset.order_by.return_value = queryset
+    queryset.filter.return_value = queryset
+    queryset.values_list.return_value.__getitem__ = Mock(side_effect=chunks)
+    return queryset
+
+
+@patch('pawapp.backfill.transaction')
+def test_backfill_rows_in_chunks(transaction):
+    """Test the rows are read by id and filled in chunks"""
+    queryset = _queryset([
+        [(1, '2018-03-12T10:34:11Z'), (2, 'invalid')],
+        [(5, '2018-03-12T10:40:11Z')],
+        [],
+    ])
+
+    updated = backfill.backfill_rows(
+        queryset, ['call_timestamp'], ['call_datetime'],
+        backfill._call_event, chunk_size=2
+    )
+
+    assert updated == 2
+    assert [call[1] for call in queryset.filter.call_args_list] == [
+        {'id__gt': 0}, {'id__gt': 2}, {'id__gt': 5}
+    ]
+    bulk_update = queryset.model.objects.bulk_update
+    assert bulk_update.call_count == 2
+    events = bulk_update.call_args_list[0][0][0]
+    assert [event.id for event in events] == [1]
+    assert events[0].call_datetime == datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC)
+
+
+def test_bill_item_columns():
+    """Test the columns filled for a bill item"""
+    item = backfill._bill_item(
+        3, '2018-03-12T10:34:11Z', '2018-03-12T10:40:11Z', Decimal('0.90')
+    )
+
+    assert isinstance(item, BillItem)
+    assert item.id == 3
+    assert item.from_datetime == datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC)
+    assert item.to_datetime == datetime.datetime(2018, 3, 12, 10, 40, 11, tzinfo=UTC)
+    assert item.amount_cents == 90
+
+
+@patch('pawapp.backfill.backfill_rows')
+def test_backfill_bills(backfill_rows):
+    """Test the bills filled with the total in cents"""
+    backfill_rows.return_value = 4
+
+    assert backfill.backfill_bills(10) == 4
+    _, columns, fields, convert, chunk_size = backfill_rows.call_args[0]
+    assert (columns, fields, chunk_size) == (['total_amount'], ['total_amount_cents'], 10)
+    assert convert(7, Decimal('12.5')).total_amount_cents == 1250
@@ -0,0 +1,156 @@
+"""Module to test the coalesced enqueue of the call events"""
+import threading
+
+from unittest.mock import Mock, patch
+
+from pawapp.buffer import EventBuffer, enqueue_batches, enqueue_callevents
+from pawapp.jobs import save_callevent_batch
+
+
+class Recorder:
+    """Flush function recording the events flushed."""
+
+    def __init__(self, expected):
+        self.batches = []
+        self.expected = expected
+        self.done = threading.Event()
+
+    def __call__(self, events):
+        self.batches.append(events)
+        if sum(len(batch) for batch in self.batches) >= self.expected:
+            self.done.set()
+
+
+def test_buffer_flush_by_window():
+    """Test the events of the same window are flushed together"""
+    recorder = Recorder(3)
+    buffer = EventBuffer(recorder, interval=0.2, max_size=100)
+
+    for index in range(3):
+        buffer.add(index)
+
+    assert recorder.done.wait(5)
+    assert recorder.batches == [[0, 1, 2]]
+
+
+def test_buffer_flush_by_size():
+    """Test the events are flushed without waiting the window when full"""
+    recorder = Recorder(5)
+    buffer = EventBuffer(recorder, interval=60, max_size=5)
+
+    for index in range(5):
+        buffer.add(index)
+
+    assert recorder.done.wait(5)
+    assert recorder.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_buffer_flush_failed_kept():
+    """Test the events not flushed are flushed again"""
+    calls = []
+
+    def flush(events):
+        calls.append(list(events))
+        if len(calls) == 1:
+            raise ConnectionError()
+
+    buffer = EventBuffer(flush, interval=60, max_size=10)
+    buffer.events = [1, 2]
+
+    assert not buffer._flush()
+    buffer.events.append(3)
+    assert buffer._flush()
+    assert calls == [[1, 2], [1, 2, 3]]
+
+
+@patch('pawapp.buffer.metrics.CALL_EVENTS_DROPPED')
+def test_buffer_flush_failed_dropped(dropped):
+    """Test the events not flushed after the retries are dropped"""
+    flush = Mock(side_effect=ConnectionError())
+    buffer = EventBuffer(flush, interval=60, max_size=10, max_retries=2)
+    buffer.events = [1, 2]
+
+    assert not buffer._flush()
+    assert not buffer._flush()
+    assert buffer.events == [1, 2]
+    dropped.inc.assert_not_called()
+
+    assert not buffer._flush()
+    assert buffer.events == []
+    dropped.inc.assert_called_once_with('not_enqueued', amount=2)
+    assert buffer.failures == 0
+
+
+@patch('pawapp.buffer.logger')
+@patch('pawapp.buffer.metrics.CALL_EVENTS_DROPPED')
+def test_buffer_full_dropped(dropped, logger):
+    """Test the events added to a full buffer are dropped"""
+    buffer = EventBuffer(Mock(), interval=60, max_pending=2)
+    buffer._start = Mock()
+    buffer.events = [1, 2]
+
+    buffer.add(3)
+    buffer.add(4)
+    assert buffer.events == [1, 2]
+    assert dropped.inc.call_count == 2
+    dropped.inc.assert_called_with('buffer_full')
+    logger.error.assert_called_once()
+
+    buffer.events = [1]
+    buffer.add(5)
+    assert buffer.events == [1, 5]
+    assert not buffer.full
+
+
+def test_buffer_close_flushes_pending():
+    """Test the events pending are flushed when the buffer is closed"""
+    flush = Mock()
+    buffer = EventBuffer(flush, interval=60, max_size=2)
+    buffer.events = [1, 2, 3]
+
+    buffer.close()
+    assert [call[0][0] for call in flush.call_args_list] == [[1, 2], [3]]
+    assert buffer.events == []
+
+
+def test_buffer_close_waits_flushing():
+    """Test the buffer is closed once the events taken by the thread are flushed"""
+    started, release = threading.Event(), threading.Event()
+    flushed = []
+
+    def flush(events):
+        started.set()
+        release.wait(5)
+        flushed.extend(events)
+
+    buffer = EventBuffer(flush, interval=60)
+    buffer.events = [1]
+    thread = threading.Thread(target=buffer._flush)
+    thread.start()
+    started.wait(5)
+    threading.Timer(0.05, release.set).start()
+
+    buffer.close()
+    assert flushed == [1]
+    thread.join()
+
+
+@patch('pawapp.buffer.django_rq')
+def test_enqueue_batches_single_pipeline(django_rq):
+    """Test the jobs of the batches are enqueued in a single pipeline"""
+    queue = django_rq.get_queue.return_value
+    pipe = queue.connection.pipeline.return_value.__enter__.return_value
+
+    enqueue_batches(save_callevent_batch, [[1], [2, 3]])
+    assert queue.enqueue_call.call_count == 2
+    queue.enqueue_call.assert_called_with(save_callevent_batch, args=([2, 3],), pipeline=pipe)
+    pipe.execute.assert_called_once_with()
+
+
+@patch('pawapp.buffer.enqueue_batches')
+def test_enqueue_callevents(enqueue_batches):
+    """Test the events buffered are saved by a single batch job"""
+    enqueue_callevents([{'call_id': '1'}, {'call_id': '2'}])
+    enqueue_batches.assert_called_once_with(
+        save_callevent_batch, [[{'call_id': '1'}, {'call_id': '2'}]]
+    )
@@ -0,0 +1,162 @@
+"""Module to test the cache access"""
+import datetime
+import pickle
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pawapp import cache
+
+
+RATES = (
+    (datetime.time(6, 00), datetime.time(22, 00, 30), Decimal('0.36'), Decimal('0.09')),
+    (datetime.time(22, 00, 30), datetime.time(6, 00), Decimal('12.5'), Decimal('0')),
+)
+
+
+def test_rates_serializer():
+    """Test rates saved in the compact format"""
+    data = cache.rates_serializer.dumps(RATES)
+    assert len(data) == 2 + 2 * 24
+
+    rates = cache.rates_serializer.loads(data)
+    assert rates == RATES
+    assert str(rates[1][2]) == '12.50'
+
+
+@pytest.mark.parametrize('data', [b'', b'R1' + b'0' * 10, pickle.dumps(RATES)])
+def test_rates_serializer_invalid_data(data):
+    with pytest.raises(ValueError):
+        cache.rates_serializer.loads(data)
+
+
+@pytest.mark.parametrize('serializer,value', [
+    (cache.pickle_serializer, RATES),
+    (cache.json_serializer, {'calls': [{'price': '1.20'}], 'period': '3/2018'}),
+])
+def test_serializers(serializer, value):
+    assert serializer.loads(serializer.dumps(value)) == value
+
+
+@patch('pawapp.cache.get_redis_connection')
+@patch('pawapp.cache.cache')
+def test_get_value_with_serializer(django_cache, get_redis_connection):
+    """Test the value is read with the key of the cache, without unpickling"""
+    django_cache.make_key.side_effect = lambda key: ':1:' + key
+    redis = get_redis_connection.return_value
+    redis.get.return_value = cache.rates_serializer.dumps(RATES)
+    assert cache.get_value('rates', cache.rates_serializer) == RATES
+    redis.get.assert_called_once_with(':1:rates')
+
+    # values saved in other formats are not loaded
+    redis.get.return_value = pickle.dumps(RATES)
+    assert cache.get_value('rates', cache.rates_serializer) is None
+
+
+@patch('pawapp.cache.get_redis_connection')
+@patch('pawapp.cache.cache')
+def test_set_value_with_serializer(django_cache, get_redis_connection):
+    """Test the bytes of the serializer are written as they are"""
+    django_cache.make_key.side_effect = lambda key: ':1:' + key
+    django_cache.default_timeout = 300
+
+    cache.set_value('rates', RATES, cache.rates_serializer)
+    get_redis_connection.return_value.set.assert_called_once_with(
+        ':1:rates', cache.rates_serializer.dumps(RATES), ex=300
+    )
+
+
+@patch('pawapp.cache.get_redis_connection')
+@patch('pawapp.cache.cache')
+def test_get_values_with_serializer(django_cache, get_redis_connection):
+    django_cache.make_key.side_effect = lambda key: ':1:' + key
+    redis = get_redis_connection.return_value
+    redis.mget.return_value = [b'{"a":1}', None, b'\x80']
+
+    values = cache.get_values(['a', 'b', 'c'], cache.json_serializer)
+    assert values == {'a': {'a': 1}}
+    redis.mget.assert_called_once_with([':1:a', ':1:b', ':1:c'])
+
+
+@patch('pawapp.cache.get_redis_connection')
+@patch('pawapp.cache.cache')
+def test_set_values_with_serializer(django_cache, get_redis_connection):
+    django_cache.make_key.side_effect = lambda key: ':1:' + key
+    pipe = get_redis_connection.return_value.pipeline.return_value.__enter__.return_value
+
+    cache.set_values({'a': {'a': 1}}, cache.json_serializer, timeout=None)
+    pipe.set.assert_called_once_with(':1:a', b'{"a":1}', ex=None)
+    pipe.execute.assert_called_once_with()
+
+
+@patch('pawapp.cache.time')
+@patch('pawapp.cache.get_version')
+def test_local_value_checks_version_by_interval(get_version, time):
+    """Test the version is checked only after the interval"""
+    loader = Mock(side_effect=['first', 'second'])
+    get_version.return_value = 1
+    time.monotonic.return_value = 10
+    local_value = cache.LocalValue('version', loader, 0.5)
+
+    assert local_value.get() == 'first'
+    assert local_value.get() == 'first'
+    get_version.assert_called_once_with('version')
+
+    # same version after the interval
+    time.monotonic.return_value = 10.5
+    assert local_value.get() == 'first'
+    assert get_version.call_count == 2
+    loader.assert_called_once_with(1)
+
+    # new version after the interval
+    get_version.return_value = 2
+    time.monotonic.return_value = 11
+    assert local_value.get() == 'second'
+    loader.assert_called_with(2)
+
+
+@patch('pawapp.cache.get_version')
+def test_local_value_without_value(get_version):
+    """Test empty values are not kept"""
+    loader = Mock(side_effect=[None, 'value'])
+    local_value = cache.LocalValue('version', loader, 10)
+
+    assert local_value.get() is None
+    assert local_value.get() == 'value'
+    assert local_value.get() == 'value'
+    assert loader.call_count == 2
+
+
+@patch('pawapp.cache.get_version')
+def test_local_value_counter(get_version):
+    """Test the uses of the value kept and the loads are counted"""
+    counter = Mock()
+    local_value = cache.LocalValue('version', Mock(return_value='value'), 10,
+                                   counter=counter)
+
+    local_value.get()
+    local_value.get()
+    assert [call[0] for call in counter.inc.call_args_list] == [
+        ('local', 'miss'), ('local', 'hit')
+    ]
+
+
+@patch('pawapp.cache.get_version')
+def test_local_value_clear(get_version):
+    """Test value loaded again after clear"""
+    loader = Mock(side_effect=['first', 'second'])
+    local_value = cache.LocalValue('version', loader, 10)
+
+    assert local_value.get() == 'first'
+    local_value.clear()
+    assert local_value.get() == 'second'
+
+
+@patch('pawapp.cache.cache')
+def test_bump_version(django_cache):
+    django_cache.incr.return_value = 3
+
+    assert cache.bump_version('version') == 3
+    django_cache.add.assert_called_once_with('version', 0, timeout=None)
+    django_cache.incr.assert_called_once_with('version')
@@ -1,11 +1,13 @@
+import datetime
 from unittest.mock import Mock, patch
 
 import pytest
 
 from pawapp.exceptions import InvalidDataException
 from pawapp import const
-from pawapp.handlers import callevent_handler, bill_handler
-from pawapp.helpers import map_dict_fields
+from pawapp.handlers import callevent_handler, callevent_batch_handler, bill_handler
+from pawapp.helpers import map_dict_fields, encode_cursor
+from pawapp.jobs import save_callevent_batch
 
 
 @patch('pawapp.handlers.map_dict_fields')
@@ -34,6 +36,20 @@ def test_calleventhandler_handle_raise_validation_exception(map_dict_fields):
     map_dict_fields.assert_called_once_with({'testing': 'ok'}, const.API_FIELDS, const.DB_FIELDS)
 
 
+@patch('pawapp.handlers.callevent_buffer')
+def test_calleventhandler_save_buffered(callevent_buffer):
+    """Test the cleaned CallEvent data buffered to be saved with other events"""
+    handler = callevent_handler({
+        'call_type': 'end', 'call_timestamp': ' 2018-03-12T10:40:11Z ', 'call_id': ' 1',
+    })
+
+    handler.validate()
+    handler.save()
+    callevent_buffer.add.assert_called_once_with({
+        'call_type': 'end', 'call_timestamp': '2018-03-12T10:40:11Z', 'call_id': '1',
+    })
+
+
 @pytest.mark.parametrize('data,expected_errors', [
     ({}, ['type', 'timestamp', 'call_id']),
     ({'type': 'a'}, ['type', 'timestamp', 'call_id']),
@@ -73,6 +89,109 @@ def test_calleventhandler_validate_required(data, expected_errors):
         assert key in handler.errors
 
 
+VALID_START_EVENT = {
+    'type': const.CALL_TYPE_START,
+    'timestamp': '2018-03-12T10:34:11Z',
+    'call_id': '1',
+    'source': '11911111111',
+    'destination': '11922222222',
+}
+
+
+@patch('pawapp.handlers.enqueue_batches')
+def test_calleventbatchhandler_handle(enqueue_batches):
+    """Test CallEvent batch handle reporting errors by line"""
+    data = [
+        (1, dict(VALID_START_EVENT)),
+        (2, None),
+        (4, {'type': const.CALL_TYPE_END, 'call_id': '1'}),
+        (5, dict(VALID_START_EVENT, call_id='2')),
+    ]
+    handler = callevent_batch_handler(data)
+
+    report = handler.handle()
+    assert report['accepted'] == 2
+    assert report['rejected'] == 2
+    assert list(report['errors'].keys()) == [2, 4]
+    assert report['errors'][2] == {'event': [const.MESSAGE_EVENT_INVALID_FORMAT]}
+    assert list(report['errors'][4].keys()) == ['timestamp']
+
+    enqueue_batches.assert_called_once()
+    func, batches = enqueue_batches.call_args[0]
+    assert func is save_callevent_batch
+    events, = batches
+    assert [event['call_id'] for event in events] == ['1', '2']
+    assert events[0]['source_number'] == '11911111111'
+
+
+@patch('pawapp.jobs.metrics')
+@patch('pawapp.models.CallEvent.bill_calls', return_value=[])
+@patch('pawapp.models.pairing.pair_events', return_value={})
+@patch('pawapp.models.transaction')
+@patch('pawapp.models.connection')
+@patch('pawapp.handlers.enqueue_batches')
+def test_calleventbatchhandler_padded_values_saved(enqueue_batches, connection, transaction, pair_events,
+                                                   bill_calls, metrics):
+    """Test the padded values of a batch cleaned before the job saves them"""
+    connection.ops.quote_name = lambda name: '"{}"'.format(name)
+    connection.ops.adapt_datetimefield_value = lambda value: value
+    cursor = connection.cursor.return_value.__enter__.return_value
+    handler = callevent_batch_handler([
+        (1, {'type': const.CALL_TYPE_END, 'timestamp': ' 2018-03-12T10:40:11Z ', 'call_id': ' 1 '}),
+    ])
+
+    assert handler.handle()['accepted'] == 1
+    events, = enqueue_batches.call_args[0][1]
+    assert save_callevent_batch(events) == []
+
+    params = cursor.execute.call_args[0][1]
+    assert params[:3] == ['end', '2018-03-12T10:40:11Z', '1']
+    assert params[5] == datetime.datetime(2018, 3, 12, 10, 40, 11, tzinfo=datetime.timezone.utc)
+    bill_calls.assert_called_once()
+    assert bill_calls.call_args[0][0] == ['1']
+
+
+@patch('pawapp.handlers.metrics')
+@patch('pawapp.handlers.enqueue_batches')
+def test_calleventbatchhandler_handle_counts_rejected(enqueue_batches, metrics):
+    """Test the events rejected of a batch are counted"""
+    handler = callevent_batch_handler([
+        (1, dict(VALID_START_EVENT)), (2, None), (3, {'type': 'a'})
+    ])
+
+    handler.handle()
+    metrics.CALL_EVENTS_REJECTED.inc.assert_called_once_with('batch', amount=2)
+    metrics.CALL_EVENT_HANDLE_SECONDS.time.assert_called_once_with('batch')
+
+
+@pytest.mark.parametrize('data', [
+    [],
+    [(1, None), (2, {'type': 'a'})],
+    [(line, {}) for line in range(const.CALL_EVENT_BATCH_MAX_SIZE + 1)],
+])
+@patch('pawapp.handlers.enqueue_batches')
+def test_calleventbatchhandler_handle_raise_exception(enqueue_batches, data):
+    """Test CallEvent batch handle without valid events"""
+    handler = callevent_batch_handler(data)
+
+    with pytest.raises(InvalidDataException):
+        handler.handle()
+    enqueue_batches.assert_not_called()
+
+
+@patch('pawapp.handlers.const.CALL_EVENT_BATCH_CHUNK_SIZE', 2)
+@patch('pawapp.handlers.enqueue_batches')
+def test_calleventbatchhandler_save_chunks(enqueue_batches):
+    """Test CallEvent batch save sending the events in chunks"""
+    handler = callevent_batch_handler([])
+    handler.events = [{'call_id': str(index)} for index in range(5)]
+
+    handler.save()
+    enqueue_batches.assert_called_once()
+    chunks = enqueue_batches.call_args[0][1]
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
 @patch('pawapp.handlers.Bill')
 @patch('pawapp.handlers.last_period')
 def test_billhandler_handle_raise_exception(last_period, model_bill):
@@ -104,6 +223,19 @@ def test_billhandler_handle_calls(last_period, model_bill):
     model_bill.data_by_number_period.assert_called_once_with(1, 2, 3)
 
 
+@patch('pawapp.handlers.Bill')
+@patch('pawapp.handlers.last_period')
+def test_billhandler_handle_stream(last_period, model_bill):
+    """Test Bill handle streaming the bill"""
+    model_bill.stream_by_number_period = Mock(return_value='chunks')
+    handler = bill_handler({'phone_number': 1, 'month': 2, 'year': 3, 'stream': True})
+    handler.validate = Mock()
+
+    assert handler.handle() == 'chunks'
+    model_bill.stream_by_number_period.assert_called_once_with(1, 2, 3)
+    model_bill.data_by_number_period.assert_not_called()
+
+
 @patch('pawapp.handlers.Bill')
 @patch('pawapp.handlers.last_period')
 def test_billhandler_handle_without_period(last_period, model_bill):
@@ -145,3 +277,59 @@ def test_billhandler_validate_data(last_period, phone_number, month, year, error
     assert len(errors) == len(handler.errors)
     for error, values in handler.errors.items():
         assert values == errors[error]
+
+
+@pytest.mark.parametrize('data,page,errors', [
+    ({}, None, []),
+    ({'limit': '10'}, {'limit': 10}, []),
+    ({'fields': 'price, destination'}, {'limit': 50, 'fields': ['price', 'destination']}, []),
+    (
+        {'after': encode_cursor('2018-03-01T10:00:00Z', 3)},
+        {'limit': 50, 'after': ['2018-03-01T10:00:00Z', 3]},
+        []
+    ),
+    ({'limit': '0'}, None, ['limit']),
+    ({'limit': '1001'}, None, ['limit']),
+    ({'limit': 'a'}, None, ['limit']),
+    ({'after': 'a'}, None, ['after']),
+    ({'after': encode_cursor(1)}, None, ['after']),
+    ({'after': encode_cursor('2018-03-01T10:00:00Z', 'abc')}, None, ['after']),
+    ({'after': encode_cursor('2018-03-01T10:00:00Z', True)}, None, ['after']),
+    ({'after': encode_cursor(3, '2018-03-01T10:00:00Z')}, None, ['after']),
+    ({'after': encode_cursor('2018-03-01T10:00:00Z', 3, 4)}, None, ['after']),
+    ({'fields': 'price,source'}, None, ['fields']),
+    ({'fields': ','}, None, ['fields']),
+])
+def test_billhandler_validate_page(data, page, errors):
+    """Test Bill validate pagination data"""
+    handler = bill_handler(data)
+    handler.validate_page()
+
+    assert sorted(handler.errors.keys()) == errors
+    if page is not None:
+        assert handler.page == page
+
+
+@patch('pawapp.handlers.Bill')
+@patch('pawapp.handlers.last_period')
+def test_billhandler_handle_page(last_period, model_bill):
+    """Test Bill handle returning a page of the bill"""
+    model_bill.page_by_number_period = Mock(return_value='page')
+    handler = bill_handler({'phone_number': 1, 'month': 2, 'year': 3})
+    handler.validate = Mock()
+    handler.page = {'limit': 10}
+
+    assert handler.handle() == 'page'
+    model_bill.page_by_number_period.assert_called_once_with(1, 2, 3, limit=10)
+
+
+@patch('pawapp.handlers.Bill')
+@patch('pawapp.handlers.last_period')
+def test_billhandler_handle_summary(last_period, model_bill):
+    """Test Bill handle returning the totals of the bill"""
+    model_bill.summary_by_number_period = Mock(return_value='summary')
+    handler = bill_handler({'phone_number': 1, 'month': 2, 'year': 3, 'summary': True})
+    handler.validate = Mock()
+
+    assert handler.handle() == 'summary'
+    model_bill.summary_by_number_period.assert_called_once_with(1, 2, 3)
@@ -1,3 +1,6 @@
+import datetime
+from decimal import Decimal
+
 import pytest
 
 from pawapp import helpers
@@ -35,3 +38,65 @@ def test_add_list_value():
     assert len(source) == 2
     assert source['test'] == ['new item', 'second value']
     assert source['new'] == ['another']
+
+
+@pytest.mark.parametrize('body,expected', [
+    ('', []),
+    ('[]', []),
+    ('[{"id": 1}, 2]', [(1, {'id': 1}), (2, 2)]),
+    ('{"id": 1}\n{"id": 2}\n', [(1, {'id': 1}), (2, {'id': 2})]),
+    ('{"id": 1}\n\n{"id": 3', [(1, {'id': 1}), (3, None)]),
+])
+def test_parse_json_lines(body, expected):
+    assert helpers.parse_json_lines(body) == expected
+
+
+def test_parse_json_lines_invalid_array():
+    with pytest.raises(ValueError):
+        helpers.parse_json_lines('[{"id": 1}')
+
+
+@pytest.mark.parametrize('values', [('2018-03-01T10:00:00Z', 12), (1,), ()])
+def test_cursor(values):
+    cursor = helpers.encode_cursor(*values)
+    assert helpers.decode_cursor(cursor) == list(values)
+
+
+@pytest.mark.parametrize('cursor', ['zz', 'eyJhIjogMX0=', '//8=', None])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        helpers.decode_cursor(cursor)
+
+
+def test_naive_utc():
+    value = datetime.datetime(2018, 3, 12, 7, 34, 11, tzinfo=datetime.timezone(datetime.timedelta(hours=-3)))
+    assert helpers.naive_utc(value) == datetime.datetime(2018, 3, 12, 10, 34, 11)
+
+
+@pytest.mark.parametrize('value,expected', [
+    (Decimal('1.17'), 117),
+    (Decimal('0'), 0),
+    (Decimal('66742.11'), 6674211),
+    (3, 300),
+])
+def test_money_cents(value, expected):
+    assert helpers.money_cents(value) == expected
+
+
+@pytest.mark.parametrize('year,month,months,expected', [
+    (2018, 3, 1, (2018, 4)),
+    (2018, 12, 1, (2019, 1)),
+    (2018, 1, -1, (2017, 12)),
+    (2018, 3, -15, (2016, 12)),
+    (2018, 3, 0, (2018, 3)),
+])
+def test_add_months(year, month, months, expected):
+    assert helpers.add_months(year, month, months) == expected
+
+
+def test_period_range():
+    utc = datetime.timezone.utc
+    assert helpers.period_range('2018', '12') == (
+        datetime.datetime(2018, 12, 1, tzinfo=utc),
+        datetime.datetime(2019, 1, 1, tzinfo=utc),
+    )
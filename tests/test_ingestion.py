@@ -0,0 +1,224 @@
+"""Module to test the asynchronous ingestion of the call events"""
+import asyncio
+import json
+
+import pytest
+import redis
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError
+from unittest.mock import Mock, patch
+
+from pawapp import const
+from pawapp.ingestion import CallEventIngestion, async_client
+from pawapp.jobs import save_callevent, save_callevent_batch
+
+
+PATH = '/api/v0/call_events/'
+
+VALID_END_EVENT = {
+    'type': const.CALL_TYPE_END,
+    'timestamp': '2018-03-12T10:40:11Z',
+    'call_id': '1',
+}
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def request(application, body, method='POST', path=PATH):
+    """Send a request to the application, returning status and body."""
+    messages = [
+        {'type': 'http.request', 'body': chunk, 'more_body': True}
+        for chunk in body
+    ]
+    messages[-1]['more_body'] = False
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path}
+    run(application(scope, receive, send))
+    return sent
+
+
+async def fake_enqueue(func, *args):
+    pass
+
+
+def ingestion(application=None):
+    ingestion = CallEventIngestion(application or Mock(), PATH)
+    ingestion.enqueue = Mock(side_effect=fake_enqueue)
+    return ingestion
+
+
+def test_ingest_valid_event():
+    """Test the valid event is enqueued to be saved"""
+    application = ingestion()
+
+    sent = request(application, [json.dumps(VALID_END_EVENT).encode('utf-8')])
+    assert sent[0]['status'] == 201
+    assert sent[1]['body'] == b''
+    application.enqueue.assert_called_once_with(save_callevent_batch, [{
+        'call_type': const.CALL_TYPE_END,
+        'call_timestamp': '2018-03-12T10:40:11Z',
+        'call_id': '1',
+    }])
+
+
+def test_ingest_events_single_job():
+    """Test the events received together are enqueued in a single job"""
+    application = ingestion()
+    events = [
+        dict(VALID_END_EVENT, call_id=str(call_id)) for call_id in range(3)
+    ]
+
+    async def receive_all():
+        await asyncio.gather(*(
+            application.enqueue_event(event) for event in events
+        ))
+
+    run(receive_all())
+    application.enqueue.assert_called_once_with(save_callevent_batch, events)
+
+
+@patch('pawapp.ingestion.const.CALL_EVENT_BUFFER_MAX_SIZE', 2)
+def test_ingest_events_max_size():
+    """Test the events are enqueued when the buffer is full"""
+    application = ingestion()
+    events = [
+        dict(VALID_END_EVENT, call_id=str(call_id)) for call_id in range(3)
+    ]
+
+    async def receive_all():
+        await asyncio.gather(*(
+            application.enqueue_event(event) for event in events
+        ))
+
+    run(receive_all())
+    assert application.enqueue.call_args_list == [
+        ((save_callevent_batch, events[:2]),),
+        ((save_callevent_batch, events[2:]),),
+    ]
+
+
+def test_ingest_enqueue_error():
+    """Test the error enqueuing is logged and not sent to the client"""
+    application = ingestion()
+    application.enqueue.side_effect = ConnectionError('redis:6379 refused')
+
+    with patch('pawapp.ingestion.logger') as logger:
+        sent = request(
+            application, [json.dumps(VALID_END_EVENT).encode('utf-8')]
+        )
+    assert sent[0]['status'] == 500
+    assert json.loads(sent[1]['body'].decode('utf-8')) == {
+        'error': const.MESSAGE_EVENT_NOT_ENQUEUED
+    }
+    logger.exception.assert_called_once()
+
+
+@pytest.mark.parametrize('body,error', [
+    ([b'{"type": ', b'"end"'], const.MESSAGE_BODY_INVALID_JSON),
+    ([b'[1]'], {'event': [const.MESSAGE_EVENT_INVALID_FORMAT]}),
+    ([b''], {
+        'type': [const.MESSAGE_FIELD_REQUIRED],
+        'timestamp': [const.MESSAGE_FIELD_REQUIRED],
+        'call_id': [const.MESSAGE_FIELD_REQUIRED],
+    }),
+    ([b'{"type": "end", ', b'"call_id": "1"}'], {'timestamp': [const.MESSAGE_FIELD_REQUIRED]}),
+])
+def test_ingest_invalid_event(body, error):
+    """Test the invalid events are not enqueued"""
+    application = ingestion()
+
+    sent = request(application, body)
+    assert sent[0]['status'] == 400
+    assert json.loads(sent[1]['body'].decode('utf-8')) == {'error': error}
+    application.enqueue.assert_not_called()
+
+
+@patch('pawapp.ingestion.settings.DATA_UPLOAD_MAX_MEMORY_SIZE', 10)
+def test_ingest_body_too_large():
+    """Test the body larger than the size accepted is not read"""
+    application = ingestion()
+
+    sent = request(application, [b'{"type": ', b'"end"}'])
+    assert sent[0]['status'] == 400
+    application.enqueue.assert_not_called()
+
+
+@pytest.mark.parametrize('method,path', [('GET', PATH), ('POST', '/api/v0/bills/1/')])
+def test_other_requests(method, path):
+    """Test the other requests are sent to the application wrapped"""
+    async def wrapped(scope, receive, send):
+        await send({'type': 'wrapped'})
+
+    sent = request(ingestion(wrapped), [b''], method=method, path=path)
+    assert sent == [{'type': 'wrapped'}]
+
+
+class FakePipeline:
+
+    def __init__(self):
+        self.commands = []
+        self.executed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        self.executed = True
+
+
+@patch('pawapp.ingestion.async_client')
+def test_enqueue_single_pipeline(async_client):
+    """Test the job is saved and pushed to the queue in a single pipeline"""
+    pipeline = FakePipeline()
+    async_client.return_value.pipeline.return_value = pipeline
+    application = CallEventIngestion(Mock(), PATH)
+
+    job = run(application.enqueue(save_callevent, {'call_id': '1'}))
+    assert pipeline.executed
+    assert [command[0] for command in pipeline.commands] == ['sadd', 'hset', 'rpush']
+    assert pipeline.commands[1][1] == (job.key,)
+    assert pipeline.commands[2][1] == (application.queue.key, job.id)
+    assert job.func_name == 'pawapp.jobs.save_callevent'
+    assert job.args == ({'call_id': '1'},)
+    assert job.origin == application.queue.name
+
+
+@pytest.mark.parametrize('client,connection_class,kwargs', [
+    (redis.Redis(host='redis', port=6380, db=2), aioredis.Connection, {'host': 'redis', 'port': 6380, 'db': 2}),
+    (redis.Redis.from_url('redis://:secret@redis:6379/0'), aioredis.Connection, {'host': 'redis', 'password': 'secret'}),
+    (redis.Redis(unix_socket_path='/tmp/redis.sock'), aioredis.UnixDomainSocketConnection, {'path': '/tmp/redis.sock'}),
+    (redis.Redis(host='redis', ssl=True), aioredis.SSLConnection, {'host': 'redis'}),
+])
+def test_async_client(client, connection_class, kwargs):
+    """Test the asynchronous client connects as the client of the queue"""
+    pool = async_client(client).connection_pool
+    assert pool.connection_class is connection_class
+    for name, value in kwargs.items():
+        assert pool.connection_kwargs[name] == value
+
+
+def test_async_client_without_sync_parser():
+    """Test the parser of the synchronous client is not used"""
+    client = redis.Redis(connection_pool=redis.ConnectionPool(
+        host='redis', parser_class=redis.connection.PythonParser
+    ))
+    assert 'parser_class' not in async_client(client).connection_pool.connection_kwargs
@@ -0,0 +1,167 @@
+"""Module to test the metrics of the hot paths"""
+from unittest.mock import Mock, patch
+
+import pytest
+from django.db import IntegrityError
+
+from pawapp import metrics
+from pawapp.jobs import save_callevent
+from pawapp.views import metrics_view
+
+
+@pytest.fixture
+def registry(settings):
+    settings.METRICS_ENABLED = True
+    registry = metrics.Registry(key='metrics', interval=3600)
+    # as started in this process, without the flush thread
+    registry.pid = metrics.os.getpid()
+    return registry
+
+
+@pytest.fixture
+def redis():
+    with patch('pawapp.metrics.get_redis_connection') as connection:
+        yield connection.return_value
+
+
+def test_counter_inc(registry):
+    counter = metrics.Counter('paw_events', 'Events.', ['type'], registry)
+
+    counter.inc('start')
+    counter.inc('start', amount=2)
+    counter.inc('a"b')
+    assert counter.name == 'paw_events_total'
+    assert registry.values == {
+        'paw_events_total{type="start"}': 3,
+        'paw_events_total{type="a\\"b"}': 1,
+    }
+
+
+def test_histogram_observe(registry):
+    histogram = metrics.Histogram(
+        'paw_seconds', 'Seconds.', registry=registry, buckets=(0.1, 1)
+    )
+
+    histogram.observe(0.05)
+    histogram.observe(0.1)
+    histogram.observe(5)
+    assert registry.values == {
+        'paw_seconds_bucket{le="0.1"}': 2,
+        'paw_seconds_bucket{le="+Inf"}': 1,
+        'paw_seconds_sum': 5.15,
+        'paw_seconds_count': 3,
+    }
+
+
+@patch('pawapp.metrics.time')
+def test_histogram_time(time, registry):
+    """Test the time of blocks and functions observed"""
+    histogram = metrics.Histogram(
+        'paw_seconds', 'Seconds.', ['step'], registry, buckets=(1,)
+    )
+    time.perf_counter.side_effect = [10, 10.5, 20, 22]
+
+    with histogram.time('block'):
+        pass
+
+    @histogram.time('function')
+    def function():
+        return 'result'
+
+    assert function() == 'result'
+    assert registry.values['paw_seconds_sum{step="block"}'] == 0.5
+    assert registry.values['paw_seconds_sum{step="function"}'] == 2
+    assert registry.values['paw_seconds_bucket{step="function",le="+Inf"}'] == 1
+
+
+def test_metrics_disabled(registry, settings):
+    settings.METRICS_ENABLED = False
+    metrics.Counter('paw_events', 'Events.', registry=registry).inc()
+    metrics.Histogram('paw_seconds', 'Seconds.', registry=registry).observe(1)
+    assert registry.values == {}
+
+
+def test_registry_values_not_copied_to_forked_process(registry):
+    registry.values = {'paw_events_total': 1}
+    registry.pid = -1
+
+    with patch.object(registry, '_run'), \
+            patch('pawapp.metrics.atexit') as atexit:
+        registry.add([('paw_events_total', 2)])
+    assert registry.values == {'paw_events_total': 2}
+    atexit.register.assert_called_once_with(registry.flush)
+
+
+def test_registry_flush(registry, redis):
+    registry.values = {'paw_events_total': 3, 'paw_seconds_sum': 0.25}
+    pipe = redis.pipeline.return_value.__enter__.return_value
+
+    assert registry.flush()
+    pipe.hincrby.assert_called_once_with('metrics', 'paw_events_total', 3)
+    pipe.hincrbyfloat.assert_called_once_with(
+        'metrics', 'paw_seconds_sum', 0.25
+    )
+    pipe.execute.assert_called_once_with()
+    assert registry.values == {}
+
+
+def test_registry_flush_failed_kept(registry, redis):
+    registry.values = {'paw_events_total': 3}
+    redis.pipeline.side_effect = ConnectionError()
+
+    assert not registry.flush()
+    registry.add([('paw_events_total', 1)])
+    assert registry.values == {'paw_events_total': 4}
+
+
+def test_registry_collect(registry, redis):
+    """Test the values of all processes in the exposition format"""
+    metrics.Counter('paw_events', 'Events.', ['type'], registry)
+    metrics.Histogram(
+        'paw_seconds', 'Seconds.', ['step'], registry, buckets=(0.1, 1)
+    )
+    redis.hgetall.return_value = {
+        b'paw_events_total{type="start"}': b'3',
+        b'paw_seconds_bucket{step="a",le="0.1"}': b'2',
+        b'paw_seconds_bucket{step="a",le="+Inf"}': b'1',
+        b'paw_seconds_sum{step="a"}': b'5.15',
+        b'paw_seconds_count{step="a"}': b'3',
+        b'other': b'1',
+    }
+
+    assert registry.collect() == '\n'.join([
+        '# HELP paw_events_total Events.',
+        '# TYPE paw_events_total counter',
+        'paw_events_total{type="start"} 3',
+        '# HELP paw_seconds Seconds.',
+        '# TYPE paw_seconds histogram',
+        'paw_seconds_bucket{step="a",le="0.1"} 2',
+        'paw_seconds_bucket{step="a",le="1"} 2',
+        'paw_seconds_bucket{step="a",le="+Inf"} 3',
+        'paw_seconds_sum{step="a"} 5.15',
+        'paw_seconds_count{step="a"} 3',
+    ]) + '\n'
+    redis.hgetall.assert_called_once_with('metrics')
+
+
+@patch('pawapp.views.metrics')
+def test_metrics_view(metrics_module):
+    metrics_module.collect.return_value = '# HELP paw_events_total Events.\n'
+    metrics_module.CONTENT_TYPE = metrics.CONTENT_TYPE
+
+    response = metrics_view(Mock())
+    assert response.content == b'# HELP paw_events_total Events.\n'
+    assert response['Content-Type'] == metrics.CONTENT_TYPE
+
+
+@patch('pawapp.jobs.metrics')
+@patch('pawapp.jobs.CallEvent')
+def test_save_callevent_dropped_counted(CallEvent, metrics_module):
+    """Test the events not saved by a conflict are counted as dropped"""
+    CallEvent.save_call.side_effect = IntegrityError()
+
+    save_callevent({'call_type': 'end', 'call_id': '1'})
+    metrics_module.CALL_EVENTS_DROPPED.inc.assert_called_once_with(
+        'integrity_error'
+    )
+    metrics_module.flush.assert_called_once_with()
@@ -1,11 +1,18 @@
 """Module to test models"""
 import datetime
+import json
 from decimal import Decimal
 
 import pytest
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLWrapper
+from django.db.models import F, Q
+from django.db.models.signals import post_delete
 from unittest.mock import Mock, patch
 
-from pawapp.models import CallEvent, ConnectionRate
+from pawapp.helpers import decode_cursor
+from pawapp.models import (
+    Bill, BillItem, CallEvent, ConnectionRate, clean_rates_cache, postsave_billitem_handler
+)
 from pawapp.exceptions import (
     InvalidCallPairException, InvalidCallIntervalException, RatesNotFoundException
 )
@@ -159,34 +166,704 @@ def test_calculate_call_with_rates_not_found(current_rates, interval_by_call_id)
     with pytest.raises(RatesNotFoundException):
         CallEvent.calculate_call('1')
 
+UTC = datetime.timezone.utc
+
+
 @pytest.mark.parametrize('db_values,expected_start,expected_end', [
     (
-        (('start', '2018-03-23T10:23:42Z'), ('end', '2018-05-23T22:54:03Z')),
+        (('start', None, '2018-03-23T10:23:42Z'), ('end', None, '2018-05-23T22:54:03Z')),
         datetime.datetime(2018, 3, 23, 10, 23, 42),
         datetime.datetime(2018, 5, 23, 22, 54, 3)
     ),
     (
-        (('start', '2018-01-11T05:45:42Z'), ('end', '2018-01-12T07:32:03Z')),
+        (('start', None, '2018-01-11T05:45:42Z'), ('end', None, '2018-01-12T07:32:03Z')),
         datetime.datetime(2018, 1, 11, 5, 45, 42),
         datetime.datetime(2018, 1, 12, 7, 32, 3)
     ),
     (
-        (('start', '2018-03-23T10:23:42Z'), ('ends', '2018-05-23T22:54:03Z')),
+        (('start', None, '2018-03-23T10:23:42Z'), ('ends', None, '2018-05-23T22:54:03Z')),
         datetime.datetime(2018, 3, 23, 10, 23, 42),
         None
     ),
     (
-        (('end', '2018-05-23T22:54:03Z'),),
+        (('end', None, '2018-05-23T22:54:03Z'),),
         None,
         datetime.datetime(2018, 5, 23, 22, 54, 3)
     ),
+    (
+        (
+            ('start', datetime.datetime(2018, 3, 23, 10, 23, 42, tzinfo=UTC), '2018-03-23T10:23:42Z'),
+            ('end', datetime.datetime(2018, 5, 23, 22, 54, 3, tzinfo=UTC), '2018-05-23T22:54:03Z')
+        ),
+        datetime.datetime(2018, 3, 23, 10, 23, 42),
+        datetime.datetime(2018, 5, 23, 22, 54, 3)
+    ),
 
 ])
 @patch('pawapp.models.CallEvent.objects.filter')
 def test_interval_by_call_id(callevent_filter, db_values, expected_start, expected_end):
-    values_list_mock = Mock(**{'values_list.return_value': db_values})
-    callevent_filter.return_value = values_list_mock
+    callevent_filter.return_value.order_by.return_value.values_list.return_value = db_values
 
     call_interval = CallEvent.interval_by_call_id('1')
     assert call_interval.get('start') == expected_start
     assert call_interval.get('end') == expected_end
+    callevent_filter.assert_called_once_with(Q(), call_id='1')
+    callevent_filter.return_value.order_by.assert_called_once_with('id')
+
+
+@patch('pawapp.models.CallEvent.objects.filter')
+def test_interval_by_call_id_window(callevent_filter):
+    """Test the events read only in the window around the event datetime"""
+    callevent_filter.return_value.order_by.return_value.values_list.return_value = []
+    call_datetime = datetime.datetime(2018, 3, 12, 10, 0, tzinfo=UTC)
+
+    CallEvent.interval_by_call_id('1', call_datetime)
+    callevent_filter.assert_called_once_with(CallEvent.window_filter([call_datetime]), call_id='1')
+
+
+def test_window_filter():
+    """Test the window around the datetimes, with the events without datetime"""
+    assert CallEvent.window_filter([]) == Q()
+    assert CallEvent.window_filter([None]) == Q()
+
+    window_filter = CallEvent.window_filter([
+        datetime.datetime(2018, 3, 12, 10, 0, tzinfo=UTC),
+        None,
+        datetime.datetime(2018, 3, 10, 10, 0, tzinfo=UTC),
+    ])
+    assert window_filter == Q(
+        call_datetime__gte=datetime.datetime(2018, 3, 3, 10, 0, tzinfo=UTC),
+        call_datetime__lte=datetime.datetime(2018, 3, 19, 10, 0, tzinfo=UTC)
+    ) | Q(call_datetime__isnull=True)
+
+
+def _call_event(call_type, call_timestamp, call_id='1'):
+    return CallEvent(
+        call_type=call_type,
+        call_id=call_id,
+        call_timestamp=call_timestamp,
+        source_number='11911111111',
+        destination_number='11922222222'
+    )
+
+
+@patch('pawapp.models.connection')
+def test_upsert_calls_merge_events(connection):
+    """Test many events saved with a single query"""
+    connection.ops.quote_name = lambda name: '"{}"'.format(name)
+    cursor = connection.cursor.return_value.__enter__.return_value
+
+    CallEvent.upsert_calls([
+        {'call_type': 'start', 'call_id': '1', 'call_timestamp': '2018-03-12T10:34:11Z', 'source_number': '11911111111'},
+        {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:40:11Z'},
+        {'call_type': 'start', 'call_id': '1', 'destination_number': '11922222222'},
+    ])
+
+    cursor.execute.assert_called_once()
+    sql, params = cursor.execute.call_args[0]
+    assert sql.startswith('INSERT INTO "pawapp_callevent"')
+    assert 'ON CONFLICT ("call_type", "call_id", "call_datetime") DO UPDATE' in sql
+    assert len(params) == 14
+    assert params[:5] == ['start', '2018-03-12T10:34:11Z', '1', '11911111111', '11922222222']
+    assert params[7:12] == ['end', '2018-03-12T10:40:11Z', '1', None, None]
+    # the first value adapted is the created_at of the events
+    adapted_datetimes = connection.ops.adapt_datetimefield_value.call_args_list
+    assert adapted_datetimes[1][0][0] == datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC)
+    assert adapted_datetimes[2][0][0] == datetime.datetime(2018, 3, 12, 10, 40, 11, tzinfo=UTC)
+
+
+@patch('pawapp.models.connection')
+def test_upsert_calls_without_events(connection):
+    """Test no query is done without events"""
+    CallEvent.upsert_calls([])
+    connection.cursor.assert_not_called()
+
+
+@patch('pawapp.models.transaction')
+@patch('pawapp.models.CallEvent.ended_calls')
+@patch('pawapp.models.pairing.pair_events')
+@patch('pawapp.models.CallEvent.bill_calls')
+@patch('pawapp.models.CallEvent.upsert_calls')
+def test_save_calls_bill_ended_calls(upsert_calls, bill_calls, pair_events, ended_calls, transaction):
+    """Test only the calls ended are billed, with the events paired"""
+    events = [
+        {'call_type': 'end', 'call_id': '2', 'call_timestamp': '2018-03-12T10:40:11Z'},
+        {'call_type': 'start', 'call_id': '3'},
+        {'call_type': 'end', 'call_id': '1'},
+    ]
+    bill_calls.return_value = ['2']
+    ended_calls.return_value = {}
+    pair_events.return_value = {'1': {
+        'start': {'call_type': 'start', 'call_id': '1', 'source_number': '11911111111'},
+        'end': {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:40:11Z'},
+    }}
+
+    assert CallEvent.save_calls(events) == ['2']
+    upsert_calls.assert_called_once_with(events)
+    pair_events.assert_called_once_with(events)
+    call_datetimes = [datetime.datetime(2018, 3, 12, 10, 40, 11, tzinfo=UTC)]
+    ended_calls.assert_called_once_with({'3'}, call_datetimes)
+    call_ids, calls, window_datetimes = bill_calls.call_args[0]
+    assert call_ids == ['1', '2']
+    assert window_datetimes == call_datetimes
+    assert list(calls.keys()) == ['1']
+    assert calls['1']['start'].source_number == '11911111111'
+    assert calls['1']['end'].call_timestamp == '2018-03-12T10:40:11Z'
+
+
+@patch('pawapp.models.metrics.CALL_EVENTS_DROPPED')
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects.filter')
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_bill_calls(current_rates, callevent_filter, save_by_calls, events_dropped):
+    """Test the calls are billed loading the events at once"""
+    current_rates.return_value = [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+    callevent_filter.return_value.order_by.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z', '1'),
+        _call_event('end', '2018-03-12T10:10:30Z', '1'),
+        _call_event('end', '2018-03-12T10:10:30Z', '2'),
+        _call_event('start', '2018-03-12T10:10:30Z', '3'),
+        _call_event('end', '2018-03-12T10:00:00Z', '3'),
+    ]
+
+    not_billed = CallEvent.bill_calls(['1', '2', '3'])
+    assert not_billed == ['2', '3']
+    callevent_filter.assert_called_once_with(Q(), call_id__in=['1', '2', '3'])
+    callevent_filter.return_value.order_by.assert_called_once_with('id')
+    save_by_calls.assert_called_once()
+    start_call, end_call, duration, value = save_by_calls.call_args[0][:4]
+    assert (start_call.call_type, end_call.call_type) == ('start', 'end')
+    assert duration == 630
+    assert value == Decimal('1.26')
+    assert events_dropped.inc.call_args_list == [(('unpaired',),), (('invalid_interval',),)]
+
+
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects.filter')
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_bill_calls_known_events(current_rates, callevent_filter, save_by_calls):
+    """Test only the events of the calls not known are loaded"""
+    current_rates.return_value = [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+    callevent_filter.return_value.order_by.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z', '2'),
+        _call_event('end', '2018-03-12T10:10:30Z', '2'),
+    ]
+    calls = {'1': {
+        'start': _call_event('start', '2018-03-12T10:00:00Z', '1'),
+        'end': _call_event('end', '2018-03-12T10:01:00Z', '1'),
+    }}
+
+    assert CallEvent.bill_calls(['1', '2'], calls) == []
+    callevent_filter.assert_called_once_with(Q(), call_id__in=['2'])
+    assert save_by_calls.call_count == 2
+
+
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_bill_calls_with_rates_not_found(current_rates):
+    """Test calls can't be billed without rates"""
+    current_rates.return_value = None
+
+    with pytest.raises(RatesNotFoundException):
+        CallEvent.bill_calls(['1'])
+
+
+@patch('pawapp.models.last_period')
+@patch('pawapp.models.get_object_or_404')
+@patch('pawapp.models.cache')
+def test_data_by_number_period_closed_period_cached(cache, get_object_or_404, last_period):
+    """Test the calls of closed periods are read from the cache"""
+    last_period.return_value = (2018, 3)
+    cache.get_value.return_value = [{'price': '1.20'}]
+
+    data = Bill.data_by_number_period('11911111111', '03', '2018')
+    assert data == {
+        'subscriber': '11911111111',
+        'period': '03/2018',
+        'calls': [{'price': '1.20'}]
+    }
+    cache.get_value.assert_called_once_with('bill_calls:11911111111:2018:3', cache.json_serializer)
+    get_object_or_404.assert_not_called()
+
+
+@patch('pawapp.models.last_period')
+@patch('pawapp.models.get_object_or_404')
+@patch('pawapp.models.cache')
+def test_data_by_number_period_closed_period_not_cached(cache, get_object_or_404, last_period):
+    """Test the calls of closed periods are saved in the cache"""
+    last_period.return_value = (2018, 3)
+    cache.get_value.return_value = None
+    billitem = BillItem(
+        phone_number='11922222222', from_timestamp='2018-03-01T10:00:00Z',
+        to_timestamp='2018-03-01T10:10:00Z', duration=600, amount=Decimal('1.2')
+    )
+    get_object_or_404.return_value = Mock(**{'billitem_set.filter.return_value': [billitem]})
+
+    data = Bill.data_by_number_period('11911111111', 2, 2018)
+    calls = [{
+        'destination': '11922222222',
+        'start_date': '2018-03-01',
+        'start_time': '10:00:00Z',
+        'duration': '0:10:00',
+        'price': '1.20'
+    }]
+    assert data['calls'] == calls
+    cache.set_value.assert_called_once_with(
+        'bill_calls:11911111111:2018:2', calls, cache.json_serializer, timeout=86400
+    )
+
+
+@patch('pawapp.models.last_period')
+@patch('pawapp.models.get_object_or_404')
+@patch('pawapp.models.cache')
+def test_data_by_number_period_open_period(cache, get_object_or_404, last_period):
+    """Test the calls of open periods are not cached"""
+    last_period.return_value = (2018, 3)
+    get_object_or_404.return_value = Mock(**{'billitem_set.filter.return_value': []})
+
+    data = Bill.data_by_number_period('11911111111', '04', '2018')
+    assert data['calls'] == []
+    cache.get_value.assert_not_called()
+    cache.set_value.assert_not_called()
+
+
+@pytest.mark.parametrize('items_count', [0, 1, 2, 5])
+@patch('pawapp.models.const.BILL_STREAM_CHUNK_SIZE', 2)
+@patch('pawapp.models.get_object_or_404')
+def test_stream_by_number_period(get_object_or_404, items_count):
+    """Test the bill streamed as JSON chunks"""
+    items = [
+        ('11922222222', '2018-03-01T10:00:00Z', 600 + index, Decimal('1.2'))
+        for index in range(items_count)
+    ]
+    values_list = Mock(**{'iterator.return_value': iter(items)})
+    bill = Mock(**{'billitem_set.filter.return_value.values_list.return_value': values_list})
+    get_object_or_404.return_value = bill
+
+    chunks = list(Bill.stream_by_number_period('11911111111', '03', '2018'))
+    values_list.iterator.assert_called_once_with(chunk_size=2)
+    assert len(chunks) == 2 + (items_count + 1) // 2
+
+    data = json.loads(''.join(chunks))
+    assert data['subscriber'] == '11911111111'
+    assert data['period'] == '03/2018'
+    assert [call['duration'] for call in data['calls']] == [
+        '0:10:{:02d}'.format(index) for index in range(items_count)
+    ]
+    assert all(call['price'] == '1.20' for call in data['calls'])
+
+
+@pytest.mark.parametrize('limit,after,fields,expected_columns,has_next', [
+    (2, None, None, ['from_timestamp', 'id', 'phone_number', 'duration', 'amount'], True),
+    (3, ['2018-03-01T09:00:00Z', 1], ['price'], ['from_timestamp', 'id', 'amount'], False),
+])
+@patch('pawapp.models.BillItem.objects.filter')
+@patch('pawapp.models.get_object_or_404')
+def test_page_by_number_period(get_object_or_404, billitem_filter, limit, after, fields, expected_columns, has_next):
+    """Test a page of the bill read by keyset"""
+    get_object_or_404.return_value = 7
+    all_rows = {
+        'from_timestamp': ['2018-03-01T10:00:00Z', '2018-03-01T11:00:00Z', '2018-03-01T12:00:00Z'],
+        'id': [3, 2, 5],
+        'phone_number': ['11922222222'] * 3,
+        'duration': [60, 120, 180],
+        'amount': [Decimal('1'), Decimal('2'), Decimal('3')],
+    }
+    rows = list(zip(*[all_rows[column] for column in expected_columns]))
+    items = billitem_filter.return_value
+    items.filter.return_value = items
+    items.order_by.return_value.values_list.return_value = rows
+
+    data = Bill.page_by_number_period('11911111111', '03', '2018', limit, after, fields)
+    billitem_filter.assert_called_once_with(BillItem.period_filter(2018, 3), bill_id=7)
+    assert items.filter.called == bool(after)
+    items.order_by.assert_called_once_with('from_timestamp', 'id')
+    items.order_by.return_value.values_list.assert_called_once_with(*expected_columns)
+
+    assert len(data['calls']) == min(limit, 3)
+    if fields:
+        assert data['calls'][0] == {'price': '1.00'}
+    else:
+        assert data['calls'][1] == {
+            'destination': '11922222222',
+            'start_date': '2018-03-01',
+            'start_time': '11:00:00Z',
+            'duration': '0:02:00',
+            'price': '2.00'
+        }
+    if has_next:
+        assert decode_cursor(data['next']) == ['2018-03-01T11:00:00Z', 2]
+    else:
+        assert data['next'] is None
+
+
+@patch('pawapp.models.get_object_or_404')
+def test_summary_by_number_period(get_object_or_404):
+    """Test only the totals of the bill, with the items not rolled up"""
+    get_object_or_404.return_value = (3600, Decimal('12.1'), 61, Decimal('0.4'))
+
+    data = Bill.summary_by_number_period('11911111111', '03', '2018')
+    assert data == {
+        'subscriber': '11911111111',
+        'period': '03/2018',
+        'total_duration': '1:01:01',
+        'total_price': '12.50',
+    }
+
+
+@pytest.mark.parametrize('call_datetime,call_timestamp', [
+    (None, '2018-03-12T10:34:11Z'),
+    (datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC), ''),
+])
+def test_call_timestamp_datetime(call_datetime, call_timestamp):
+    """Test the datetime of the event read from the column or the timestamp"""
+    event = CallEvent(call_timestamp=call_timestamp, call_datetime=call_datetime)
+    assert event.call_timestamp_datetime == datetime.datetime(2018, 3, 12, 10, 34, 11)
+
+
+@pytest.mark.parametrize('from_datetime,from_timestamp', [
+    (None, '2018-03-12T10:34:11Z'),
+    (datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC), ''),
+])
+def test_from_date_and_time(from_datetime, from_timestamp):
+    """Test the date and time of the item read from the column or the timestamp"""
+    item = BillItem(from_timestamp=from_timestamp, from_datetime=from_datetime)
+    assert item.from_date_and_time == ['2018-03-12', '10:34:11Z']
+
+
+@pytest.mark.parametrize('created', [True, False])
+@patch('pawapp.models.transaction')
+@patch('pawapp.models.Bill.add_totals')
+@patch('pawapp.models.BillItem.insert_once')
+@patch('pawapp.models.Bill.objects.get_or_create')
+def test_save_by_calls(bill_get_or_create, insert_once, add_totals, transaction, created):
+    """Test only the item saved, once by call, with the datetime and cents columns"""
+    bill = Mock(id=3, total_duration=60, total_amount=Decimal('1.20'), phone_number='11911111111', month=3, year=2018)
+    bill_get_or_create.return_value = (bill, False)
+    insert_once.return_value = created
+
+    assert Bill.save_by_calls(
+        _call_event('start', '2018-03-12T10:34:11Z'),
+        _call_event('end', '2018-03-12T10:40:11Z'),
+        360,
+        Decimal('0.90')
+    ) is created
+
+    item_data = insert_once.call_args[1]
+    assert item_data['bill'] == 3
+    assert item_data['call_id'] == '1'
+    assert item_data['from_datetime'] == datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=UTC)
+    assert item_data['to_datetime'] == datetime.datetime(2018, 3, 12, 10, 40, 11, tzinfo=UTC)
+    assert item_data['amount_cents'] == 90
+    assert item_data['rolled_up'] is False
+    assert transaction.on_commit.called == created
+    add_totals.assert_not_called()
+    bill.save.assert_not_called()
+
+
+@patch('pawapp.models.ConnectionRate.objects.values_list')
+@patch('pawapp.models.cache')
+def test_load_rates_cached_by_version(model_cache, values_list):
+    """Test the rates loaded from the database cached under their version"""
+    model_cache.get_value.return_value = None
+    values_list.return_value = [
+        (datetime.time(6, 00), datetime.time(22, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+
+    data = ConnectionRate.load_rates(3)
+    model_cache.get_value.assert_called_once_with('connection_rates:3', model_cache.rates_serializer)
+    model_cache.set_value.assert_called_once_with('connection_rates:3', data, model_cache.rates_serializer)
+
+
+@patch('pawapp.models.cache')
+def test_clean_rates_cache(model_cache):
+    """Test the version bumped before the rates of the previous version are cleaned"""
+    calls = []
+    model_cache.bump_version.side_effect = lambda key: calls.append(key) or 4
+    model_cache.clean_value.side_effect = calls.append
+
+    clean_rates_cache()
+    assert calls == ['connection_rates_version', 'connection_rates:3']
+
+
+@patch('pawapp.models.transaction.on_commit', side_effect=lambda func: func())
+@patch('pawapp.models.Bill.clean_cached_data')
+def test_postsave_billitem_handler(clean_cached_data, on_commit):
+    """Test the cached calls cleaned by the bill id, without reading the bill"""
+    postsave_billitem_handler(BillItem, BillItem(bill_id=5))
+    clean_cached_data.assert_called_once_with([5])
+
+
+@patch('pawapp.models.transaction.on_commit', side_effect=lambda func: func())
+@patch('pawapp.models.Bill.clean_cached_data')
+@patch('django.db.models.QuerySet.delete', return_value=(3, {}))
+@patch('pawapp.models.BillItemQuerySet.values_list')
+def test_billitem_queryset_delete(values_list, delete, clean_cached_data, on_commit):
+    """Test the items deleted in bulk clean the cached calls of their bills once"""
+    values_list.return_value.distinct.return_value = [3, 5]
+
+    assert BillItem.objects.filter(bill_id__in=[3, 5]).delete() == (3, {})
+    values_list.assert_called_once_with('bill_id', flat=True)
+    clean_cached_data.assert_called_once_with({3, 5})
+    # without receivers the items are deleted without being read
+    assert not post_delete.has_listeners(BillItem)
+
+
+@patch('pawapp.models.Bill.objects.filter')
+def test_add_totals(bill_filter):
+    """Test the totals incremented by the database, in order of bill id"""
+    bill_filter.return_value.update.return_value = 1
+
+    assert Bill.add_totals({
+        5: (60, Decimal('0.54')),
+        3: (360, Decimal('0.90')),
+    }) == 2
+
+    assert [c[1] for c in bill_filter.call_args_list] == [{'id': 3}, {'id': 5}]
+    values = bill_filter.return_value.update.call_args_list[0][1]
+    assert values['total_duration'] == F('total_duration') + 360
+    assert values['total_amount'] == F('total_amount') + Decimal('0.90')
+    assert str(values['total_amount_cents']).endswith('+ Value(90)')
+
+
+@pytest.mark.parametrize('row,created', [((7,), True), (None, False)])
+@patch('pawapp.models.connection')
+def test_billitem_insert_once(connection, row, created):
+    """Test the item inserted with the call billed in a single statement"""
+    connection.vendor = 'postgresql'
+    connection.ops.quote_name = lambda name: '"{}"'.format(name)
+    connection.ops.validate_autopk_value = lambda value: value
+    connection.ops.cast_data_types = {}
+    connection.data_types = PostgreSQLWrapper.data_types
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = row
+
+    assert BillItem.insert_once(bill=3, call_id='1', duration=60) is created
+    cursor.execute.assert_called_once()
+    sql, params = cursor.execute.call_args[0]
+    assert sql == (
+        'WITH billed AS (INSERT INTO "pawapp_billedcall" ("call_id") VALUES (%s) '
+        'ON CONFLICT ("call_id") DO NOTHING RETURNING "call_id") '
+        'INSERT INTO "pawapp_billitem" ("bill_id", "call_id", "duration") '
+        'SELECT CAST(%s AS integer), CAST(%s AS varchar(32)), CAST(%s AS integer) '
+        'FROM billed RETURNING "id"'
+    )
+    assert params == ['1', 3, '1', 60]
+
+
+@pytest.mark.parametrize('row,created', [(('1',), True), (None, False)])
+@patch('pawapp.models.transaction')
+@patch('pawapp.models.connection')
+def test_billitem_insert_once_other_databases(connection, transaction, row, created):
+    """Test the item inserted only if the call was not billed, in a transaction"""
+    connection.vendor = 'sqlite'
+    connection.ops.quote_name = lambda name: '"{}"'.format(name)
+    connection.ops.validate_autopk_value = lambda value: value
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = row
+
+    assert BillItem.insert_once(bill=3, call_id='1', duration=60) is created
+    transaction.atomic.assert_called_once_with(savepoint=False)
+    executed = [call[0] for call in cursor.execute.call_args_list]
+    assert executed[0] == (
+        'INSERT INTO "pawapp_billedcall" ("call_id") VALUES (%s) '
+        'ON CONFLICT ("call_id") DO NOTHING RETURNING "call_id"',
+        ['1']
+    )
+    assert executed[1:] == ([(
+        'INSERT INTO "pawapp_billitem" ("bill_id", "call_id", "duration") VALUES (%s, %s, %s)',
+        [3, '1', 60]
+    )] if created else [])
+
+
+@patch('pawapp.models.CallEvent.upsert_calls')
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects')
+@patch('pawapp.models.pairing.pair_events')
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_save_call_bill_paired(current_rates, pair_events, callevent_objects, save_by_calls, upsert_calls):
+    """Test the call completed by the event billed without reading the events"""
+    current_rates.return_value = [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+    pair_events.return_value = {'1': {
+        'start': {'call_type': 'start', 'call_id': '1', 'call_timestamp': '2018-03-12T10:00:00Z',
+                  'source_number': '11911111111', 'destination_number': '11922222222'},
+        'end': {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:10:30Z'},
+    }}
+
+    CallEvent.save_call(True, call_type='end', call_id='1', call_timestamp='2018-03-12T10:10:30Z')
+    pair_events.assert_called_once_with([
+        {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:10:30Z'}
+    ])
+    callevent_objects.filter.assert_not_called()
+    start_call, end_call, duration, value = save_by_calls.call_args[0]
+    assert start_call.source_number == '11911111111'
+    assert (duration, value) == (630, Decimal('1.26'))
+
+
+@patch('pawapp.models.CallEvent.upsert_calls')
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects')
+@patch('pawapp.models.pairing.pair_events')
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_save_call_bill_not_paired(current_rates, pair_events, callevent_objects, save_by_calls, upsert_calls):
+    """Test the events of the call not found open read in a single query"""
+    current_rates.return_value = [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+    pair_events.return_value = {}
+    events = callevent_objects.filter.return_value.order_by
+    events.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z'),
+        _call_event('end', '2018-03-12T10:10:30Z'),
+    ]
+
+    CallEvent.save_call(True, call_type='end', call_id='1', call_timestamp='2018-03-12T10:10:30Z')
+    callevent_objects.filter.assert_called_once_with(
+        CallEvent.window_filter([datetime.datetime(2018, 3, 12, 10, 10, 30, tzinfo=UTC)]), call_id='1'
+    )
+    events.assert_called_once_with('id')
+    save_by_calls.assert_called_once()
+
+    # the end waits for its start
+    save_by_calls.reset_mock()
+    events.return_value = [_call_event('end', '2018-03-12T10:10:30Z')]
+    CallEvent.save_call(True, call_type='end', call_id='1', call_timestamp='2018-03-12T10:10:30Z')
+    save_by_calls.assert_not_called()
+
+
+@patch('pawapp.models.CallEvent.upsert_calls')
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects')
+@patch('pawapp.models.pairing.pair_events')
+@patch('pawapp.models.ConnectionRate.current_rates')
+def test_save_call_late_start(current_rates, pair_events, callevent_objects, save_by_calls, upsert_calls):
+    """Test the start received after its end bills the call"""
+    current_rates.return_value = [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('0.36'), Decimal('0.09')),
+    ]
+    pair_events.return_value = {}
+
+    # the end is not saved yet
+    events = callevent_objects.filter.return_value.order_by
+    events.return_value = [_call_event('start', '2018-03-12T10:00:00Z')]
+    CallEvent.save_call(False, call_type='start', call_id='1', call_timestamp='2018-03-12T10:00:00Z')
+    callevent_objects.filter.assert_called_once_with(
+        CallEvent.window_filter([datetime.datetime(2018, 3, 12, 10, 0, tzinfo=UTC)]), call_id='1'
+    )
+    save_by_calls.assert_not_called()
+
+    # the end saved is not open anymore
+    events.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z'),
+        _call_event('end', '2018-03-12T10:10:30Z'),
+    ]
+    CallEvent.save_call(False, call_type='start', call_id='1', call_timestamp='2018-03-12T10:00:00Z')
+    save_by_calls.assert_called_once()
+
+    callevent_objects.filter.reset_mock()
+    save_by_calls.reset_mock()
+    pair_events.return_value = {'1': {
+        'start': {'call_type': 'start', 'call_id': '1', 'call_timestamp': '2018-03-12T10:00:00Z'},
+        'end': {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:10:30Z'},
+    }}
+    CallEvent.save_call(False, call_type='start', call_id='1', call_timestamp='2018-03-12T10:00:00Z')
+    callevent_objects.filter.assert_not_called()
+    save_by_calls.assert_called_once()
+
+
+@patch('pawapp.models.CallEvent.upsert_calls')
+@patch('pawapp.pairing.timezone.now', return_value=datetime.datetime(2018, 3, 12, 10, 0, 5, tzinfo=UTC))
+@patch('pawapp.models.Bill.save_by_calls')
+@patch('pawapp.models.CallEvent.objects')
+@patch('pawapp.models.pairing.pair_events', return_value={})
+def test_save_call_start_in_order(pair_events, callevent_objects, save_by_calls, now, upsert_calls):
+    """Test the start of a call just started waits open without reading its end"""
+
+    CallEvent.save_call(False, call_type='start', call_id='1', call_timestamp='2018-03-12T10:00:00Z')
+    callevent_objects.filter.assert_not_called()
+    save_by_calls.assert_not_called()
+
+
+@patch('pawapp.models.CallEvent.objects')
+@patch('pawapp.models.CallEvent.upsert_calls')
+@patch('pawapp.models.pairing.pair_events')
+def test_save_call_pairs_after_writing(pair_events, upsert_calls, callevent_objects):
+    """Test the event is paired only after its row is written, in a single query"""
+    steps = []
+    upsert_calls.side_effect = lambda events: steps.append('write')
+    pair_events.side_effect = lambda events: steps.append('pair') or {}
+
+    CallEvent.save_call(False, call_type='start', call_id='1', call_timestamp='2018-03-12T10:00:00Z')
+    assert steps == ['write', 'pair']
+    event = {'call_type': 'start', 'call_id': '1', 'call_timestamp': '2018-03-12T10:00:00Z'}
+    upsert_calls.assert_called_once_with([event])
+    pair_events.assert_called_once_with([event])
+
+
+@patch('pawapp.models.transaction')
+@patch('pawapp.models.CallEvent.ended_calls')
+@patch('pawapp.models.pairing.pair_events')
+@patch('pawapp.models.CallEvent.bill_calls')
+@patch('pawapp.models.CallEvent.upsert_calls')
+def test_save_calls_bill_late_starts(upsert_calls, bill_calls, pair_events, ended_calls, transaction):
+    """Test the calls completed by late starts are billed, open or not"""
+    pair_events.return_value = {'3': {
+        'start': {'call_type': 'start', 'call_id': '3'},
+        'end': {'call_type': 'end', 'call_id': '3'},
+    }}
+    ended_calls.return_value = {'5': {
+        'start': _call_event('start', '2018-03-12T10:00:00Z', '5'),
+        'end': _call_event('end', '2018-03-12T10:10:30Z', '5'),
+    }}
+    bill_calls.return_value = []
+
+    with patch('pawapp.pairing.timezone.now', return_value=datetime.datetime(2018, 3, 13, 10, 0, tzinfo=UTC)):
+        CallEvent.save_calls([
+            {'call_type': 'start', 'call_id': '3'},
+            {'call_type': 'start', 'call_id': '4', 'call_timestamp': '2018-03-12T10:00:00Z'},
+            {'call_type': 'start', 'call_id': '5'},
+            {'call_type': 'start', 'call_id': '6', 'call_timestamp': '2018-03-12T10:00:01Z'},
+        ])
+    # the end of the call 6, started less than a day ago, would be open
+    ended_calls.assert_called_once_with({'4', '5'}, [
+        datetime.datetime(2018, 3, 12, 10, 0, tzinfo=UTC), datetime.datetime(2018, 3, 12, 10, 0, 1, tzinfo=UTC)
+    ])
+    call_ids, calls, _ = bill_calls.call_args[0]
+    assert call_ids == ['3', '5']
+    assert sorted(calls.keys()) == ['3', '5']
+
+
+@patch('pawapp.models.CallEvent.objects.filter')
+def test_ended_calls(callevent_filter):
+    """Test only the calls with both events saved are loaded"""
+    callevent_filter.return_value.order_by.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z', '1'),
+        _call_event('end', '2018-03-12T10:10:30Z', '1'),
+        _call_event('start', '2018-03-12T10:00:00Z', '2'),
+    ]
+
+    calls = CallEvent.ended_calls({'2', '1'})
+    callevent_filter.assert_called_once_with(Q(), call_id__in=['1', '2'])
+    assert list(calls.keys()) == ['1']
+    assert sorted(calls['1'].keys()) == ['end', 'start']
+
+
+@patch('pawapp.models.CallEvent.objects.filter')
+def test_load_calls_last_event_wins(callevent_filter):
+    """Test the last event saved of each type used, read in order of id"""
+    callevent_filter.return_value.order_by.return_value = [
+        _call_event('start', '2018-03-12T10:00:00Z', '1'),
+        _call_event('end', '2018-03-12T10:10:30Z', '1'),
+        _call_event('end', '2018-03-12T10:20:30Z', '1'),
+    ]
+    call_datetime = datetime.datetime(2018, 3, 12, 10, 20, 30, tzinfo=UTC)
+
+    calls = CallEvent.load_calls(['1'], [call_datetime])
+    callevent_filter.assert_called_once_with(CallEvent.window_filter([call_datetime]), call_id__in=['1'])
+    callevent_filter.return_value.order_by.assert_called_once_with('id')
+    assert calls['1']['end'].call_timestamp == '2018-03-12T10:20:30Z'
@@ -0,0 +1,75 @@
+"""Module to test the pairing of the call events"""
+import datetime
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+
+from pawapp.pairing import open_call_expired, open_call_key, pair_events
+
+
+START = {
+    'call_type': 'start', 'call_id': '1', 'call_timestamp': '2018-03-12T10:00:00Z',
+    'source_number': '11911111111', 'destination_number': '11922222222',
+}
+END = {'call_type': 'end', 'call_id': '1', 'call_timestamp': '2018-03-12T10:10:30Z'}
+
+
+@pytest.fixture
+def redis():
+    redis = fakeredis.FakeRedis()
+    with patch('pawapp.pairing.get_redis_connection', return_value=redis):
+        yield redis
+
+
+def test_pair_events_in_batch(redis):
+    """Test the events of the same batch paired"""
+    completed = pair_events([START, dict(END, call_id='2'), END])
+    assert list(completed.keys()) == ['1']
+    assert completed['1']['start'] == START
+    assert completed['1']['end'] == END
+
+    assert not redis.exists(open_call_key('1'))
+    assert redis.hgetall(open_call_key('2')) == {
+        b'end:call_type': b'end', b'end:call_id': b'2', b'end:call_timestamp': b'2018-03-12T10:10:30Z',
+    }
+    assert redis.ttl(open_call_key('2')) == 24 * 60 * 60
+
+
+def test_pair_events_with_open_call(redis):
+    """Test the event paired with the open call, the values missing kept"""
+    assert pair_events([START]) == {}
+    assert pair_events([dict(START, source_number=None, destination_number=None)]) == {}
+
+    completed = pair_events([dict(END, source_number=None)])
+    assert completed == {'1': {'start': START, 'end': END}}
+    assert not redis.exists(open_call_key('1'))
+
+
+def test_pair_events_by_workers_at_the_same_time(redis):
+    """Test the call is completed by one of the workers pairing its events
+
+    The events are paired by each worker after they are written, without
+    waiting for the commit, so the other worker finds the event paired first.
+    """
+    assert pair_events([START]) == {}
+    assert list(pair_events([END]).keys()) == ['1']
+
+
+def test_pair_events_in_a_single_transaction(redis):
+    """Test the open calls are written and read back in a single transaction"""
+    with patch.object(redis, 'pipeline', wraps=redis.pipeline) as pipeline:
+        pair_events([START, dict(START, call_id='2')])
+    pipeline.assert_called_once_with()
+
+
+def test_pair_without_events():
+    assert pair_events([]) == {}
+
+
+@patch('pawapp.pairing.timezone.now', return_value=datetime.datetime(2018, 3, 13, 10, 0, tzinfo=datetime.timezone.utc))
+def test_open_call_expired(now):
+    """Test the ends of the calls started before the timeout could have expired"""
+    assert not open_call_expired(datetime.datetime(2018, 3, 12, 10, 0, 1, tzinfo=datetime.timezone.utc))
+    assert open_call_expired(datetime.datetime(2018, 3, 12, 10, 0, tzinfo=datetime.timezone.utc))
+    assert open_call_expired(None)
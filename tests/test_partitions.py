@@ -0,0 +1,191 @@
+"""Module to test the monthly partitions of the tables"""
+import datetime
+
+import pytest
+from unittest.mock import call, patch
+
+from pawapp import partitions
+
+
+UTC = datetime.timezone.utc
+
+NOW = datetime.datetime(2018, 11, 20, 10, 0, tzinfo=UTC)
+
+
+def _connection(connection, rows=None):
+    connection.vendor = 'postgresql'
+    connection.ops.quote_name = lambda name: '"{}"'.format(name)
+    cursor = connection.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = rows or []
+    return cursor
+
+
+def test_partition_names():
+    assert partitions.partition_name('pawapp_callevent', 2018, 3) == 'pawapp_callevent_y2018m03'
+    assert partitions.default_partition_name('pawapp_callevent') == 'pawapp_callevent_default'
+
+
+@pytest.mark.parametrize('value,expected', [
+    ("'2018-03-01 00:00:00+00'", datetime.datetime(2018, 3, 1, tzinfo=UTC)),
+    ('MINVALUE', None),
+    ('MAXVALUE', None),
+])
+def test_parse_bound(value, expected):
+    assert partitions.parse_bound(value) == expected
+
+
+@patch('pawapp.partitions.connection')
+def test_is_partitioned_other_database(connection):
+    connection.vendor = 'sqlite'
+    assert not partitions.is_partitioned('pawapp_callevent')
+    connection.cursor.assert_not_called()
+
+
+@patch('pawapp.partitions.connection')
+def test_list_partitions(connection):
+    """Test the bounds of the range partitions, without the default one"""
+    _connection(connection, [
+        ('pawapp_callevent_default', 'DEFAULT'),
+        ('pawapp_callevent_legacy', "FOR VALUES FROM (MINVALUE) TO ('2018-11-01 00:00:00+00')"),
+        ('pawapp_callevent_y2018m11', "FOR VALUES FROM ('2018-11-01 00:00:00+00') TO ('2018-12-01 00:00:00+00')"),
+    ])
+
+    assert partitions.list_partitions('pawapp_callevent') == [
+        ('pawapp_callevent_legacy', None, datetime.datetime(2018, 11, 1, tzinfo=UTC)),
+        (
+            'pawapp_callevent_y2018m11',
+            datetime.datetime(2018, 11, 1, tzinfo=UTC),
+            datetime.datetime(2018, 12, 1, tzinfo=UTC),
+        ),
+    ]
+
+
+@pytest.mark.parametrize('move_rows', [True, False])
+@patch('pawapp.partitions.transaction')
+@patch('pawapp.partitions.connection')
+def test_create_partition(connection, transaction, move_rows):
+    """Test the rows of the month in the default partition are moved"""
+    cursor = _connection(connection)
+    cursor.fetchone.return_value = (1,) if move_rows else None
+
+    name = partitions.create_partition('pawapp_billitem', 'to_datetime', 2018, 12)
+
+    assert name == 'pawapp_billitem_y2018m12'
+    statements = [c[0][0] for c in cursor.execute.call_args_list]
+    create = (
+        'CREATE TABLE "pawapp_billitem_y2018m12" PARTITION OF "pawapp_billitem" '
+        'FOR VALUES FROM (%s) TO (%s)'
+    )
+    if move_rows:
+        assert statements[1:] == [
+            'ALTER TABLE "pawapp_billitem" DETACH PARTITION "pawapp_billitem_default"',
+            create,
+            'WITH moved AS (DELETE FROM "pawapp_billitem_default" '
+            'WHERE "to_datetime" >= %s AND "to_datetime" < %s '
+            'RETURNING *) INSERT INTO "pawapp_billitem" SELECT * FROM moved',
+            'ALTER TABLE "pawapp_billitem" ATTACH PARTITION "pawapp_billitem_default" DEFAULT',
+        ]
+    else:
+        assert statements[1:] == [create]
+    assert cursor.execute.call_args_list[0][0][1] == [
+        datetime.datetime(2018, 12, 1, tzinfo=UTC),
+        datetime.datetime(2019, 1, 1, tzinfo=UTC),
+    ]
+
+
+@patch('pawapp.partitions.timezone.now', return_value=NOW)
+@patch('pawapp.partitions.create_partition', side_effect=lambda table, column, year, month: partitions.partition_name(table, year, month))
+@patch('pawapp.partitions.list_partitions')
+@patch('pawapp.partitions.is_partitioned')
+def test_create_partitions(is_partitioned, list_partitions, create_partition, now):
+    """Test only the months without a partition are created"""
+    is_partitioned.side_effect = lambda table: table == 'pawapp_callevent'
+    list_partitions.return_value = [
+        ('pawapp_callevent_legacy', None, datetime.datetime(2018, 12, 1, tzinfo=UTC)),
+    ]
+
+    assert partitions.create_partitions(2) == ['pawapp_callevent_y2018m12', 'pawapp_callevent_y2019m01']
+    assert create_partition.call_args_list == [
+        call('pawapp_callevent', 'call_datetime', 2018, 12),
+        call('pawapp_callevent', 'call_datetime', 2019, 1),
+    ]
+
+
+@pytest.mark.parametrize('archive', [True, False])
+@patch('pawapp.partitions.timezone.now', return_value=NOW)
+@patch('pawapp.partitions.unbilled_calls')
+@patch('pawapp.partitions.list_partitions')
+@patch('pawapp.partitions.is_partitioned', return_value=True)
+@patch('pawapp.partitions.transaction')
+@patch('pawapp.partitions.connection')
+def test_remove_call_event_partitions(connection, transaction, is_partitioned, list_partitions,
+                                      unbilled_calls, now, archive):
+    """Test only the partitions older than the retention and billed are removed"""
+    cursor = _connection(connection)
+    list_partitions.return_value = [
+        ('pawapp_callevent_legacy', None, datetime.datetime(2018, 7, 1, tzinfo=UTC)),
+        (
+            'pawapp_callevent_y2018m07',
+            datetime.datetime(2018, 7, 1, tzinfo=UTC),
+            datetime.datetime(2018, 8, 1, tzinfo=UTC),
+        ),
+        (
+            'pawapp_callevent_y2018m08',
+            datetime.datetime(2018, 8, 1, tzinfo=UTC),
+            datetime.datetime(2018, 9, 1, tzinfo=UTC),
+        ),
+    ]
+    unbilled_calls.side_effect = lambda name: 3 if name.endswith('legacy') else 0
+
+    result = partitions.remove_call_event_partitions(3, archive=archive)
+
+    assert result == {
+        'removed': ['pawapp_callevent_y2018m07'],
+        'not_billed': {'pawapp_callevent_legacy': 3},
+    }
+    statements = [
+        call('DELETE FROM "pawapp_billedcall" WHERE "call_id" IN '
+             '(SELECT "call_id" FROM "pawapp_callevent_y2018m07")'),
+        call('ALTER TABLE "pawapp_callevent" DETACH PARTITION "pawapp_callevent_y2018m07"'),
+    ]
+    if not archive:
+        statements.append(call('DROP TABLE "pawapp_callevent_y2018m07"'))
+    assert cursor.execute.call_args_list == statements
+
+
+@patch('pawapp.partitions.timezone.now', return_value=NOW)
+@patch('pawapp.partitions.unbilled_calls', return_value=3)
+@patch('pawapp.partitions.list_partitions')
+@patch('pawapp.partitions.is_partitioned', return_value=True)
+@patch('pawapp.partitions.transaction')
+@patch('pawapp.partitions.connection')
+def test_remove_call_event_partitions_force(connection, transaction, is_partitioned, list_partitions,
+                                            unbilled_calls, now):
+    _connection(connection)
+    list_partitions.return_value = [
+        ('pawapp_callevent_legacy', None, datetime.datetime(2018, 7, 1, tzinfo=UTC)),
+    ]
+
+    result = partitions.remove_call_event_partitions(3, force=True)
+
+    assert result == {'removed': ['pawapp_callevent_legacy'], 'not_billed': {}}
+    unbilled_calls.assert_not_called()
+
+
+@patch('pawapp.partitions.is_partitioned', return_value=False)
+def test_remove_call_event_partitions_not_partitioned(is_partitioned):
+    assert partitions.remove_call_event_partitions() == {'removed': [], 'not_billed': {}}
+
+
+@patch('pawapp.partitions.connection')
+def test_unbilled_calls(connection):
+    """Test the calls billed read by id and the other events only in the window"""
+    cursor = _connection(connection)
+    cursor.fetchone.return_value = (2,)
+
+    assert partitions.unbilled_calls('pawapp_callevent_y2018m07') == 2
+    sql, params = cursor.execute.call_args[0]
+    assert 'FROM "pawapp_callevent_y2018m07" e' in sql
+    assert 'o."call_datetime" BETWEEN e."call_datetime" - %s AND e."call_datetime" + %s' in sql
+    assert 'NOT EXISTS (SELECT 1 FROM "pawapp_billedcall" b WHERE b."call_id" = e."call_id")' in sql
+    assert params == [datetime.timedelta(days=7)] * 2
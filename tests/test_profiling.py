@@ -0,0 +1,167 @@
+"""Module to test the sampled profiling of the requests and jobs"""
+import json
+import os
+from io import StringIO
+
+from unittest.mock import Mock, patch
+
+import pytest
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from pawapp import profiling
+
+
+@pytest.fixture
+def dumps_dir(settings, tmpdir):
+    settings.PROFILING_SAMPLE_RATE = 1
+    settings.PROFILING_MIN_DURATION = 0
+    settings.PROFILING_DIR = str(tmpdir)
+    return str(tmpdir)
+
+
+def read_dumps(directory):
+    return [data for _, data in profiling.load_dumps(directory)]
+
+
+@patch('pawapp.profiling.random')
+def test_sampled(random, settings):
+    settings.PROFILING_SAMPLE_RATE = 0
+    assert not profiling.sampled()
+    random.random.assert_not_called()
+
+    settings.PROFILING_SAMPLE_RATE = 0.1
+    random.random.return_value = 0.05
+    assert profiling.sampled()
+    random.random.return_value = 0.5
+    assert not profiling.sampled()
+
+
+def test_profile_dump(dumps_dir):
+    """Test the profile written with the parameters and allocations"""
+    with profiling.Profile('job', 'test', {'args': [1]}):
+        values = [str(value) for value in range(1000)]
+
+    assert len(values) == 1000
+    names = sorted(os.listdir(dumps_dir))
+    assert len(names) == 2
+    assert names[0].startswith('job-test-') and names[0].endswith('.json')
+    assert names[1].endswith('.prof')
+
+    data, = read_dumps(dumps_dir)
+    assert data['params'] == {'args': [1]}
+    assert data['elapsed'] > 0
+    assert data['allocations'][0]['line'].startswith(__file__)
+
+
+def test_profile_fast_not_dumped(dumps_dir, settings):
+    settings.PROFILING_MIN_DURATION = 60
+
+    with profiling.Profile('job', 'test', {}):
+        pass
+    assert os.listdir(dumps_dir) == []
+
+
+def test_profile_one_at_a_time(dumps_dir):
+    """Test a block is not profiled while other one is"""
+    with profiling.Profile('job', 'outer', {}):
+        with profiling.Profile('job', 'inner', {}) as inner:
+            assert inner.profiler is None
+
+    assert [data['name'] for data in read_dumps(dumps_dir)] == ['outer']
+    assert not profiling.profile_lock.locked()
+
+
+@pytest.mark.parametrize('view_name,dumped', [
+    ('BillResource', True),
+    ('metrics_view', False),
+])
+@patch('pawapp.profiling.resolve')
+def test_middleware(resolve, dumps_dir, view_name, dumped):
+    resolve.return_value.func.__name__ = view_name
+    resolve.return_value.kwargs = {'phone_number': '11911111111'}
+    middleware = profiling.ProfilingMiddleware(
+        Mock(return_value=HttpResponse(status=200))
+    )
+
+    response = middleware(RequestFactory().get('/api/v0/bills/11911111111/', {'limit': '5'}))
+    assert response.status_code == 200
+
+    dumps = read_dumps(dumps_dir)
+    assert len(dumps) == dumped
+    if dumped:
+        assert dumps[0]['kind'] == 'request'
+        assert dumps[0]['name'] == 'BillResource'
+        assert dumps[0]['params']['query'] == {'limit': ['5']}
+        assert dumps[0]['params']['kwargs'] == {'phone_number': '11911111111'}
+        assert dumps[0]['params']['status'] == 200
+
+
+@patch('pawapp.profiling.resolve')
+def test_middleware_not_sampled(resolve, dumps_dir, settings):
+    settings.PROFILING_SAMPLE_RATE = 0
+    get_response = Mock()
+    middleware = profiling.ProfilingMiddleware(get_response)
+
+    assert middleware(Mock()) is get_response.return_value
+    resolve.assert_not_called()
+    assert os.listdir(dumps_dir) == []
+
+
+def test_profile_job(dumps_dir):
+    @profiling.profile_job
+    def save_events(events, queue=None):
+        return len(events)
+
+    assert save_events([{}, {}], queue='default') == 2
+    data, = read_dumps(dumps_dir)
+    assert data['name'] == 'save_events'
+    assert data['params'] == {'args': ['<2 items>'], 'kwargs': {'queue': 'default'}}
+
+
+def write_dump(directory, name, kind, elapsed, allocations):
+    path = os.path.join(directory, name)
+    open(path + '.prof', 'w').close()
+    with open(path + '.json', 'w') as data_file:
+        json.dump({
+            'kind': kind, 'name': name, 'params': {}, 'elapsed': elapsed,
+            'peak_kib': 1, 'allocations': allocations,
+        }, data_file)
+
+
+def test_load_dumps_and_allocations(tmpdir):
+    """Test the dumps filtered, sorted and their allocations summed"""
+    directory = str(tmpdir)
+    write_dump(directory, 'a', 'job', 0.1, [{'line': 'x.py:1', 'size_kib': 2, 'count': 1}])
+    write_dump(directory, 'b', 'job', 0.3, [
+        {'line': 'x.py:1', 'size_kib': 3, 'count': 2},
+        {'line': 'y.py:5', 'size_kib': 4, 'count': 1},
+    ])
+    write_dump(directory, 'c', 'request', 0.2, [])
+    # without the profile
+    with open(os.path.join(directory, 'd.json'), 'w') as data_file:
+        data_file.write('{}')
+
+    dumps = profiling.load_dumps(directory)
+    assert [data['name'] for _, data in dumps] == ['b', 'c', 'a']
+    assert [data['name'] for _, data in profiling.load_dumps(directory, kind='job')] == ['b', 'a']
+    assert [data['name'] for _, data in profiling.load_dumps(directory, name='c')] == ['c']
+
+    assert profiling.aggregate_allocations(dumps) == [
+        ('x.py:1', 5, 3), ('y.py:5', 4, 1),
+    ]
+
+
+def test_profile_report_command(dumps_dir):
+    for name in ('first', 'second'):
+        with profiling.Profile('request', name, {'path': '/' + name}):
+            sorted(range(100))
+
+    stdout = StringIO()
+    call_command('profile_report', '--dir', dumps_dir, '--limit', '5', stdout=stdout)
+    output = stdout.getvalue()
+    assert output.startswith('2 profiles in {}.'.format(dumps_dir))
+    assert '{"path": "/first"}' in output
+    assert 'function calls' in output
+    assert 'Lines with the most memory allocated:' in output
@@ -0,0 +1,95 @@
+"""Module to test the budget of the database queries"""
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pawapp import const
+from pawapp.exceptions import QueryBudgetExceededException
+from pawapp.models import Bill, CallEvent
+from pawapp.querybudget import QueryBudget, query_budget
+
+
+def run_queries(budget, *queries):
+    execute = Mock()
+    for sql in queries:
+        budget.record(execute, sql, [], False, {})
+    assert execute.call_count == len(queries)
+
+
+def test_query_budget_within():
+    with query_budget(4, 'block') as budget:
+        run_queries(budget, 'SELECT 1', 'BEGIN', 'BEGIN', 'SELECT 2')
+    assert len(budget.queries) == 4
+
+
+def test_query_budget_max_queries():
+    with pytest.raises(QueryBudgetExceededException) as exception_info:
+        with query_budget(2, 'block') as budget:
+            run_queries(budget, 'SELECT 1', 'SELECT 2', 'SELECT 3')
+    assert str(exception_info.value) == \
+        'Query budget of block exceeded: 3 queries, max 2.'
+    assert exception_info.value.queries == ['SELECT 1', 'SELECT 2', 'SELECT 3']
+
+
+def test_query_budget_repeated_queries():
+    """Test the same query run again is reported, like in a loop"""
+    with pytest.raises(QueryBudgetExceededException) as exception_info:
+        with query_budget(10, 'loop') as budget:
+            run_queries(
+                budget, 'SAVEPOINT "s1"', 'SELECT %s', 'RELEASE SAVEPOINT "s1"',
+                'SAVEPOINT "s1"', 'SELECT %s', 'RELEASE SAVEPOINT "s1"'
+            )
+    assert 'Repeated 2 times: SELECT %s' in str(exception_info.value)
+    assert 'SAVEPOINT' not in str(exception_info.value).split('\n', 1)[1]
+
+
+@patch('pawapp.querybudget.logger')
+def test_query_budget_log(logger, settings):
+    settings.QUERY_BUDGET_MODE = 'log'
+    with query_budget(1, 'block') as budget:
+        run_queries(budget, 'SELECT 1', 'SELECT 2')
+    logger.warning.assert_called_once_with(
+        'Query budget of block exceeded: 2 queries, max 1.'
+    )
+
+
+@patch('pawapp.querybudget.connections')
+def test_query_budget_off(connections, settings):
+    settings.QUERY_BUDGET_MODE = 'off'
+    with query_budget(0, 'block'):
+        pass
+    connections.__getitem__.assert_not_called()
+
+
+def test_query_budget_error_not_hidden():
+    """Test the errors of the block are raised instead of the budget"""
+    with pytest.raises(ValueError):
+        with query_budget(0, 'block') as budget:
+            run_queries(budget, 'SELECT 1')
+            raise ValueError()
+
+
+def test_query_budget_decorator():
+    budgets = []
+
+    @query_budget(1)
+    def function():
+        return 'result'
+
+    with patch.object(QueryBudget, 'check', lambda budget: budgets.append(budget)):
+        assert function() == 'result'
+        assert function() == 'result'
+
+    # a new budget by call, named by the function
+    assert len(budgets) == 2 and budgets[0] is not budgets[1]
+    assert budgets[0].name.endswith('test_query_budget_decorator.<locals>.function')
+
+
+@pytest.mark.parametrize('func,max_queries', [
+    (CallEvent.save_call, const.QUERY_BUDGET_SAVE_CALL),
+    (Bill.save_by_calls, const.QUERY_BUDGET_SAVE_BY_CALLS),
+    (Bill.data_by_number_period, const.QUERY_BUDGET_BILL_DATA),
+])
+def test_billing_paths_budgeted(func, max_queries):
+    """Test the billing paths have a budget of queries"""
+    assert func.query_budget.max_queries == max_queries
@@ -0,0 +1,76 @@
+"""Module to test the rating engine"""
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from pawapp import rating
+from pawapp.exceptions import (
+    InvalidCallPairException, InvalidCallIntervalException, RatesNotFoundException
+)
+from pawapp.timeline import RateTimeline
+
+
+RATES = [
+    (datetime.time(6, 00), datetime.time(22, 00), Decimal('0.36'), Decimal('0.09')),
+    (datetime.time(22, 00), datetime.time(6, 00), Decimal('0.36'), Decimal('0.00')),
+]
+
+
+@pytest.mark.parametrize('rates', [None, [], ()])
+def test_compile_rates_not_found(rates):
+    """Test rates can't be compiled without values"""
+    with pytest.raises(RatesNotFoundException):
+        rating.compile_rates(rates)
+
+
+def test_compile_rates_with_timeline():
+    """Test a compiled timeline is used as it is"""
+    rate_timeline = RateTimeline(RATES)
+    assert rating.compile_rates(rate_timeline) is rate_timeline
+    assert rating.compile_rates(RATES) is rating.compile_rates(tuple(RATES))
+
+
+@pytest.mark.parametrize('start,end,exception', [
+    (None, datetime.datetime(2018, 2, 3, 5, 7, 3), InvalidCallPairException),
+    (datetime.datetime(2018, 2, 3, 5, 7, 3), None, InvalidCallPairException),
+    (
+        datetime.datetime(2018, 2, 3, 10, 50, 56),
+        datetime.datetime(2018, 2, 3, 10, 50, 56),
+        InvalidCallIntervalException
+    ),
+    (
+        datetime.datetime(2018, 2, 3, 10, 50, 56),
+        datetime.datetime(2018, 2, 3, 10, 50, 55),
+        InvalidCallIntervalException
+    ),
+])
+def test_rate_call_invalid_interval(start, end, exception):
+    """Test calls with invalid interval can't be rated"""
+    with pytest.raises(exception):
+        rating.rate_call(start, end, RATES)
+
+
+def test_rate_call():
+    """Test the value and duration of a call"""
+    value, duration = rating.rate_call(
+        datetime.datetime(2018, 2, 28, 21, 57, 13),
+        datetime.datetime(2018, 3, 1, 6, 10, 56),
+        RATES
+    )
+    assert value == Decimal('1.44')
+    assert duration == 29623
+
+
+def test_rate_calls():
+    """Test the value and duration of many calls"""
+    start = datetime.datetime(2018, 2, 28, 10, 00)
+    intervals = [
+        (start, start + datetime.timedelta(minutes=minutes))
+        for minutes in range(1, 4)
+    ]
+
+    results = list(rating.rate_calls(intervals, RATES))
+    assert results == [
+        (Decimal('0.45'), 60), (Decimal('0.54'), 120), (Decimal('0.63'), 180)
+    ]
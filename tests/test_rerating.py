@@ -0,0 +1,103 @@
+"""Module to test the bulk re-rating"""
+import datetime
+import random
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+
+from pawapp.exceptions import InvalidCallIntervalException
+from pawapp.rerating import parse_timestamps, price_arrays, rerate_period, to_cents
+from pawapp.timeline import RateTimeline
+
+
+@pytest.mark.parametrize('rates', [
+    [
+        (datetime.time(6, 00), datetime.time(22, 00), Decimal('0.36'), Decimal('0.09')),
+        (datetime.time(22, 00), datetime.time(6, 00), Decimal('0.36'), Decimal('0.0')),
+    ],
+    [
+        (datetime.time(9, 30), datetime.time(15, 40), Decimal('5.67'), Decimal('0.76')),
+        (datetime.time(15, 40), datetime.time(1, 00), Decimal('4.54'), Decimal('0.98')),
+        (datetime.time(1, 00), datetime.time(9, 30), Decimal('3.22'), Decimal('1.2')),
+    ],
+    [
+        (datetime.time(10, 00), datetime.time(20, 00), Decimal('0.4'), Decimal('0.02')),
+    ],
+    [
+        (datetime.time(0, 00), datetime.time(0, 00), Decimal('3.42'), Decimal('0.2')),
+    ],
+])
+def test_price_arrays_same_as_timeline(rates):
+    """Test the values calculated with arrays are the same of the timeline"""
+    randomizer = random.Random(len(rates))
+    first_day = datetime.datetime(2018, 4, 1)
+    intervals = []
+    for _ in range(500):
+        start = first_day + datetime.timedelta(seconds=randomizer.randint(0, 30 * 86400))
+        seconds = randomizer.choice([randomizer.randint(1, 900), randomizer.randint(1, 9 * 86400)])
+        intervals.append((start, start + datetime.timedelta(seconds=seconds)))
+
+    starts = np.array([start for start, _ in intervals], dtype='datetime64[s]')
+    ends = np.array([end for _, end in intervals], dtype='datetime64[s]')
+    values, durations = price_arrays(rates, starts, ends)
+
+    rate_timeline = RateTimeline(rates)
+    for index, (start, end) in enumerate(intervals):
+        value, duration = rate_timeline.price(start, end)
+        assert values[index] == int(value * 100)
+        assert durations[index] == duration
+
+
+def test_price_arrays_invalid_interval():
+    """Test calls with invalid interval can't be rated"""
+    rates = [(datetime.time(0, 00), datetime.time(0, 00), Decimal('1'), Decimal('1'))]
+    starts = parse_timestamps(['2018-04-01T10:00:00Z', '2018-04-01T10:00:00Z'])
+    ends = parse_timestamps(['2018-04-01T10:10:00Z', '2018-04-01T09:00:00Z'])
+
+    with pytest.raises(InvalidCallIntervalException):
+        price_arrays(rates, starts, ends)
+
+
+def test_parse_timestamps():
+    values = parse_timestamps(['2018-04-01T10:00:00Z', '2018-12-31T23:59:59Z'])
+    assert values.tolist() == [
+        datetime.datetime(2018, 4, 1, 10, 00), datetime.datetime(2018, 12, 31, 23, 59, 59)
+    ]
+
+
+def test_to_cents():
+    assert to_cents([Decimal('1.2'), Decimal('0.05'), Decimal('12')]).tolist() == [120, 5, 1200]
+
+
+@patch('pawapp.rerating.rerate_shard')
+@patch('pawapp.rerating.ConnectionRate.rate_timeline')
+def test_rerate_period_single_process(rate_timeline, rerate_shard):
+    """Test the period rated in the current process"""
+    rerate_shard.return_value = {'rated': 3, 'updated': 1, 'bills': 1}
+
+    assert rerate_period(2018, 4, chunk_size=10) == {'rated': 3, 'updated': 1, 'bills': 1}
+    rerate_shard.assert_called_once_with(2018, 4, rate_timeline.return_value, chunk_size=10)
+
+
+@patch('pawapp.rerating.connections')
+@patch('pawapp.rerating.multiprocessing')
+@patch('pawapp.rerating.ConnectionRate.rate_timeline')
+def test_rerate_period_processes(rate_timeline, multiprocessing, connections):
+    """Test the period rated by shards in many processes"""
+    pool = multiprocessing.get_context.return_value.Pool.return_value.__enter__.return_value
+    pool.starmap.return_value = [
+        {'rated': 3, 'updated': 1, 'bills': 1},
+        {'rated': 5, 'updated': 0, 'bills': 2},
+    ]
+
+    result = rerate_period(2018, 4, processes=2, chunk_size=10)
+    assert result == {'rated': 8, 'updated': 1, 'bills': 3}
+    connections.close_all.assert_called_once_with()
+    multiprocessing.get_context.return_value.Pool.assert_called_once_with(2)
+    _, arguments = pool.starmap.call_args[0]
+    assert arguments == [
+        (2018, 4, rate_timeline.return_value, 0, 2, 10),
+        (2018, 4, rate_timeline.return_value, 1, 2, 10),
+    ]
@@ -0,0 +1,49 @@
+"""Module to test the rollup of the bill items into the bill totals"""
+from decimal import Decimal
+
+from unittest.mock import Mock, patch
+
+from pawapp import rollup
+
+
+def _items(item_ids, totals=None):
+    pending = Mock()
+    pending.select_for_update.return_value.order_by.return_value.values_list.return_value = item_ids
+    items = Mock()
+    items.order_by.return_value.values.return_value.annotate.return_value = totals or []
+    return pending, items
+
+
+@patch('pawapp.rollup.transaction')
+@patch('pawapp.rollup.Bill.add_totals', return_value=2)
+@patch('pawapp.rollup.BillItem.objects.filter')
+def test_rollup_items(billitem_filter, add_totals, transaction):
+    """Test the items taken are marked and added to the totals by bill"""
+    pending, items = _items([4, 5, 9], [
+        {'bill_id': 3, 'duration': 420, 'amount': Decimal('2.10')},
+        {'bill_id': 1, 'duration': 60, 'amount': Decimal('0.45')},
+    ])
+    billitem_filter.side_effect = [pending, items]
+
+    assert rollup.rollup_items(100) == {'items': 3, 'bills': 2}
+
+    assert billitem_filter.call_args_list[0][1] == {'rolled_up': False}
+    pending.select_for_update.assert_called_once_with(skip_locked=True)
+    assert billitem_filter.call_args_list[1][1] == {'id__in': [4, 5, 9]}
+    items.update.assert_called_once_with(rolled_up=True)
+    add_totals.assert_called_once_with({
+        3: (420, Decimal('2.10')),
+        1: (60, Decimal('0.45')),
+    })
+
+
+@patch('pawapp.rollup.transaction')
+@patch('pawapp.rollup.Bill.add_totals')
+@patch('pawapp.rollup.BillItem.objects.filter')
+def test_rollup_items_nothing_pending(billitem_filter, add_totals, transaction):
+    pending, _ = _items([])
+    billitem_filter.return_value = pending
+
+    assert rollup.rollup_items() == {'items': 0, 'bills': 0}
+    billitem_filter.assert_called_once_with(rolled_up=False)
+    add_totals.assert_not_called()
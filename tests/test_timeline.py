@@ -0,0 +1,128 @@
+"""Module to test the compiled rates timeline"""
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from pawapp.timeline import RateTimeline, compile_timeline
+
+
+RATES = (
+    (datetime.time(6, 00), datetime.time(22, 00), Decimal('0.36'), Decimal('0.09')),
+    (datetime.time(22, 00), datetime.time(6, 00), Decimal('0.36'), Decimal('0.00')),
+)
+
+
+def test_timeline_segments():
+    """Test the segments compiled from the rates"""
+    rate_timeline = RateTimeline(RATES)
+
+    assert rate_timeline.boundaries == (6 * 3600, 22 * 3600)
+    assert rate_timeline.lengths == (16 * 3600, 8 * 3600)
+    assert rate_timeline.minute_rates == (Decimal('0.09'), Decimal('0.00'))
+
+
+def test_timeline_segments_with_gap():
+    """Test the periods of the day without rates are not charged"""
+    rates = (
+        (datetime.time(10, 00), datetime.time(20, 00), Decimal('0.4'), Decimal('0.02')),
+    )
+    rate_timeline = RateTimeline(rates)
+
+    assert rate_timeline.boundaries == (10 * 3600, 20 * 3600)
+    assert rate_timeline.standing_rates == (Decimal('0.4'), Decimal('0'))
+
+    value, duration = rate_timeline.price(
+        datetime.datetime(2018, 4, 5, 19, 00), datetime.datetime(2018, 4, 6, 11, 00)
+    )
+    assert value == Decimal('2.80')
+    assert duration == 16 * 3600
+
+
+def test_timeline_without_rates():
+    """Test the timeline can't be compiled without rates"""
+    with pytest.raises(ValueError):
+        RateTimeline(())
+
+
+@pytest.mark.parametrize('start,end,expected_value,expected_duration', [
+    # start exactly in a boundary
+    (
+        datetime.datetime(2018, 4, 5, 6, 00),
+        datetime.datetime(2018, 4, 5, 6, 10, 59),
+        Decimal('1.26'),
+        659
+    ),
+    # end exactly in a boundary
+    (
+        datetime.datetime(2018, 4, 5, 21, 50),
+        datetime.datetime(2018, 4, 5, 22, 00),
+        Decimal('1.26'),
+        600
+    ),
+    # crossing midnight inside the same segment
+    (
+        datetime.datetime(2018, 4, 5, 23, 59, 30),
+        datetime.datetime(2018, 4, 6, 0, 0, 40),
+        Decimal('0.36'),
+        70
+    ),
+    # whole days in closed form
+    (
+        datetime.datetime(2018, 4, 1, 6, 00),
+        datetime.datetime(2018, 5, 1, 6, 00),
+        Decimal('2592.36'),
+        30 * 24 * 3600
+    ),
+    (
+        datetime.datetime(2016, 1, 1, 12, 00),
+        datetime.datetime(2019, 1, 1, 12, 00),
+        Decimal('94694.76'),
+        1096 * 24 * 3600
+    ),
+])
+def test_timeline_price(start, end, expected_value, expected_duration):
+    """Test the price calculated by the timeline"""
+    value, duration = RateTimeline(RATES).price(start, end)
+
+    assert value == expected_value
+    assert duration == expected_duration
+
+
+@pytest.mark.parametrize('start,end,expected_value,expected_duration', [
+    (
+        datetime.datetime(2017, 12, 12, 23, 50),
+        datetime.datetime(2017, 12, 13, 0, 10),
+        Decimal('0.36'),
+        1200
+    ),
+    (
+        datetime.datetime(2017, 12, 12, 23, 00),
+        datetime.datetime(2017, 12, 13, 5, 00),
+        Decimal('0.36'),
+        6 * 3600
+    ),
+    (
+        datetime.datetime(2017, 12, 12, 10, 00),
+        datetime.datetime(2017, 12, 13, 2, 00),
+        Decimal('65.16'),
+        16 * 3600
+    ),
+])
+def test_timeline_price_ended_after_midnight(start, end, expected_value, expected_duration):
+    """Test the calls ended after midnight in an overnight rate priced by their duration
+
+    The pricing before the timeline added the overnight rate of the day
+    before and after, so these calls were priced 86.76 for 108600 seconds,
+    86.76 for 111600 seconds and 151.56 for 158400 seconds (see
+    CHANGELOG.md).
+    """
+    value, duration = RateTimeline(RATES).price(start, end)
+
+    assert value == expected_value
+    assert duration == expected_duration
+
+
+def test_compile_timeline_reuses_compiled():
+    """Test the same rates are compiled only once"""
+    assert compile_timeline(RATES) is compile_timeline(RATES)
@@ -0,0 +1,54 @@
+"""Module to test the parser of the timestamps"""
+import datetime
+
+import pytest
+
+from pawapp import const
+from pawapp.timestamps import parse_timestamp, parse_timestamp_utc
+
+
+@pytest.mark.parametrize('value', [
+    '2018-03-12T10:34:11Z',
+    '2016-02-29T23:59:59Z',
+    '0001-01-01T00:00:00Z',
+    '9999-12-31T23:59:59Z',
+])
+def test_parse_timestamp_same_as_strptime(value):
+    """Test the timestamps are parsed as strptime"""
+    expected = datetime.datetime.strptime(value, const.TIMESTAMP_FORMAT)
+    assert parse_timestamp(value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    '',
+    '2018-03-12 10:34:11Z',
+    '2018-03-12T10:34:11',
+    '2018-3-12T10:34:11Z',
+    '2018-03-12T10:34:11+0',
+    '2018-03-12T10:34:1aZ',
+    '2018-03-12T10:34:+1Z',
+    '2018-13-12T10:34:11Z',
+    '2017-02-29T10:34:11Z',
+    '2018-03-12T24:00:00Z',
+    '2018-03-12T10:34:11.000Z',
+    None,
+    20180312,
+])
+def test_parse_invalid_timestamp(value):
+    """Test only valid timestamps in the fixed format are parsed"""
+    with pytest.raises(ValueError):
+        parse_timestamp(value)
+
+
+def test_parse_timestamp_cached():
+    """Test the values parsed are kept in the cache"""
+    parse_timestamp.cache_clear()
+    first = parse_timestamp('2018-03-12T10:34:11Z')
+    assert parse_timestamp('2018-03-12T10:34:11Z') is first
+    assert parse_timestamp.cache_info().hits == 1
+
+
+def test_parse_timestamp_utc():
+    """Test the timestamps parsed as aware datetimes"""
+    value = parse_timestamp_utc('2018-03-12T10:34:11Z')
+    assert value == datetime.datetime(2018, 3, 12, 10, 34, 11, tzinfo=datetime.timezone.utc)
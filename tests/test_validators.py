@@ -0,0 +1,97 @@
+"""Module to test the validation of the CallEvent data"""
+import pytest
+
+from pawapp import const
+from pawapp.forms import CallEventForm
+from pawapp.helpers import map_dict_fields
+from pawapp.validators import callevent_validator
+
+
+VALID_START_EVENT = {
+    'call_type': const.CALL_TYPE_START,
+    'call_timestamp': '2018-03-12T10:34:11Z',
+    'call_id': '1',
+    'source_number': '11911111111',
+    'destination_number': '11922222222',
+}
+
+
+def form_errors(data):
+    form = CallEventForm(dict(data))
+    if form.is_valid():
+        return {}
+    errors = form.errors
+    map_dict_fields(errors, const.DB_FIELDS, const.API_FIELDS)
+    return {field: list(messages) for field, messages in errors.items()}
+
+
+@pytest.mark.parametrize('data', [
+    {},
+    VALID_START_EVENT,
+    {'call_type': const.CALL_TYPE_END, 'call_timestamp': '2018-03-12T10:40:11Z', 'call_id': 1},
+    dict(VALID_START_EVENT, call_type='x'),
+    dict(VALID_START_EVENT, call_type=' start'),
+    dict(VALID_START_EVENT, call_type=''),
+    dict(VALID_START_EVENT, call_timestamp='2018-03-12T10:34:11Z' * 2),
+    dict(VALID_START_EVENT, call_timestamp='2018-03-12 10:34:11'),
+    dict(VALID_START_EVENT, call_timestamp=' 2018-03-12T10:34:11Z '),
+    dict(VALID_START_EVENT, call_timestamp='2018-02-30T10:34:11Z'),
+    dict(VALID_START_EVENT, call_timestamp=None),
+    dict(VALID_START_EVENT, call_id='a' * 33),
+    dict(VALID_START_EVENT, call_id='a' * 32),
+    dict(VALID_START_EVENT, call_id='1\x00'),
+    dict(VALID_START_EVENT, call_id=[]),
+    dict(VALID_START_EVENT, source_number=' 11911111111 '),
+    dict(VALID_START_EVENT, source_number=11911111111),
+    dict(VALID_START_EVENT, source_number='123'),
+    dict(VALID_START_EVENT, source_number='1191111111a'),
+    dict(VALID_START_EVENT, source_number='119111111111'),
+    dict(VALID_START_EVENT, destination_number='1191111111\x00'),
+    dict(VALID_START_EVENT, destination_number='11911111111\x00'),
+    dict(VALID_START_EVENT, destination_number=''),
+    dict(VALID_START_EVENT, destination_number='   '),
+    dict(VALID_START_EVENT, call_type=const.CALL_TYPE_END, destination_number=''),
+    dict(VALID_START_EVENT, call_type='x', source_number=''),
+])
+def test_validate_same_as_form(data):
+    """Test the errors are the same of the CallEventForm"""
+    assert callevent_validator.validate(dict(data))[1] == form_errors(data)
+
+
+def test_validate_errors_order():
+    """Test the errors are ordered by the API fields"""
+    _, errors = callevent_validator.validate({'source_number': '1', 'call_type': 'x'})
+    assert list(errors.keys()) == ['type', 'timestamp', 'call_id', 'source']
+
+
+def test_validate_cleaned_data():
+    """Test the values cleaned as done by the form, without the empty ones"""
+    cleaned_data, errors = callevent_validator.validate(dict(
+        VALID_START_EVENT, call_timestamp=' 2018-03-12T10:34:11Z ', call_id=' 1 ',
+        source_number=11911111111, destination_number='11922222222 ', extra='x'
+    ))
+    assert errors == {}
+    assert cleaned_data == VALID_START_EVENT
+
+    cleaned_data, _ = callevent_validator.validate({
+        'call_type': 'end', 'call_timestamp': '2018-03-12T10:40:11Z', 'call_id': '1', 'source_number': '',
+    })
+    assert cleaned_data == {'call_type': 'end', 'call_timestamp': '2018-03-12T10:40:11Z', 'call_id': '1'}
+
+
+def test_validate_batch():
+    """Test the events of a batch validated at once"""
+    lines = [
+        (1, {'type': 'end', 'timestamp': ' 2018-03-12T10:40:11Z', 'call_id': '1 '}),
+        (2, None),
+        (3, {'type': 'end', 'call_id': '1'}),
+        (5, ['type', 'end']),
+    ]
+
+    events, errors = callevent_validator.validate_batch(lines)
+    assert events == [{'call_type': 'end', 'call_timestamp': '2018-03-12T10:40:11Z', 'call_id': '1'}]
+    assert errors == {
+        2: {'event': [const.MESSAGE_EVENT_INVALID_FORMAT]},
+        3: {'timestamp': [const.MESSAGE_FIELD_REQUIRED]},
+        5: {'event': [const.MESSAGE_EVENT_INVALID_FORMAT]},
+    }